@@ -0,0 +1,403 @@
+"""
+Per-stage benchmark suite.
+Times decode, detection, tracking, speed estimation, rules, overlay drawing
+and encoding separately on recorded footage and generated scenes, writes a
+JSON report and compares it against a stored baseline to flag regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import yaml
+
+from src.detect import VehicleDetector
+from src.detections import Detections
+from src.detection_cache import DEFAULT_CACHE_DIR, DetectionCache
+from src.processor import FrameProcessor
+
+STAGES = ['decode', 'detect', 'track', 'speed', 'rules', 'overlay', 'encode']
+
+# Synthetic vehicle classes with typical box sizes (width, height) in pixels at 720p
+SCENE_CLASSES = {
+    2: (90, 70),     # car
+    3: (35, 60),     # motorcycle
+    5: (110, 150),   # bus
+    7: (100, 120)    # truck
+}
+
+
+def summarize_durations(durations: List[float]) -> Dict[str, float]:
+    """
+    Summarize per-call durations of a stage.
+
+    Args:
+        durations: Durations in seconds
+
+    Returns:
+        Dict with calls, total_s, mean_ms, p50_ms, p90_ms, p99_ms and max_ms
+    """
+    samples = np.asarray(durations, dtype=np.float64) * 1000
+    return {
+        'calls': len(samples),
+        'total_s': float(samples.sum() / 1000),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max())
+    }
+
+
+def generate_scene(site_config: dict, video_path: str, num_vehicles: int, num_frames: int,
+                   frame_size: Tuple[int, int], fps: float = 30.0,
+                   seed: int = 0) -> List[Detections]:
+    """
+    Render a synthetic traffic scene and its ground-truth detections.
+
+    Vehicles are boxes driving up or down the frame at random speeds and
+    wrapping around; about half of them drive inside the lane's horizontal
+    extent so rules and dwell counting get exercised.
+
+    Args:
+        site_config: Site configuration dictionary (lane polygon)
+        video_path: Path the scene video is written to
+        num_vehicles: Vehicles in the scene
+        num_frames: Frames to render
+        frame_size: (width, height)
+        fps: Frame rate of the video
+        seed: Random seed
+
+    Returns:
+        Detections per frame
+    """
+    rng = np.random.default_rng(seed)
+    width, height = frame_size
+    scale = height / 720
+
+    lane = site_config.get('truck_bus_lane_polygon')
+    if lane:
+        lane_x = np.asarray(lane, dtype=np.float64)[:, 0]
+        lane_range = (max(0.0, lane_x.min()), min(float(width), lane_x.max()))
+    else:
+        lane_range = (0.0, float(width))
+
+    class_ids = rng.choice(list(SCENE_CLASSES), size=num_vehicles, p=[0.7, 0.1, 0.1, 0.1])
+    sizes = np.array([SCENE_CLASSES[c] for c in class_ids], dtype=np.float64) * scale
+    in_lane = rng.random(num_vehicles) < 0.5
+    x = np.where(in_lane, rng.uniform(*lane_range, num_vehicles), rng.uniform(0, width, num_vehicles))
+    y = rng.uniform(0, height, num_vehicles)
+    velocity = rng.uniform(1.0, 6.0, num_vehicles) * scale * rng.choice([-1, 1], num_vehicles)
+    colors = rng.integers(40, 255, size=(num_vehicles, 3))
+
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    if lane:
+        cv2.fillPoly(background, [np.asarray(lane, dtype=np.int32)], (110, 110, 110))
+
+    detections = []
+    for _ in range(num_frames):
+        boxes = np.stack([x - sizes[:, 0] / 2, y - sizes[:, 1] / 2,
+                          x + sizes[:, 0] / 2, y + sizes[:, 1] / 2], axis=1)
+        boxes = np.clip(boxes, 0, [width - 1, height - 1, width - 1, height - 1])
+        visible = (boxes[:, 2] - boxes[:, 0] > 4) & (boxes[:, 3] - boxes[:, 1] > 4)
+
+        frame = background.copy()
+        for box, color in zip(boxes[visible].astype(np.int32), colors[visible].tolist()):
+            cv2.rectangle(frame, tuple(box[:2]), tuple(box[2:]), color, -1)
+        writer.write(frame)
+
+        scores = rng.uniform(0.4, 0.95, int(visible.sum()))
+        detections.append(Detections(boxes[visible], scores, class_ids[visible]))
+
+        y = (y + velocity) % height
+    writer.release()
+    return detections
+
+
+def benchmark_input(video_path: str, site_config: dict, config_path: str, tracker_config: str,
+                    detector: Optional[VehicleDetector],
+                    detections: Optional[List[Detections]] = None,
+                    cache: Optional[DetectionCache] = None,
+                    max_frames: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Time every stage of the per-frame loop on one input.
+
+    Stages run in processing order on each frame, so tracker, speed and
+    rule state evolve as in a real run; each call is timed on its own.
+
+    Args:
+        video_path: Video to decode
+        site_config: Site configuration dictionary
+        config_path: Path to site config YAML
+        tracker_config: Path to tracker config
+        detector: Detector to time, or None to skip the detect stage
+        detections: Ground-truth detections per frame (synthetic scenes);
+                    these feed the tracker even when the detector is timed
+        cache: Detection cache used to feed the tracker when there is
+               neither a detector nor ground truth
+        max_frames: Stop after this many frames
+
+    Returns:
+        Dict with 'frames', 'resolution', 'detections_source', 'stages'
+        (per-stage summaries) and 'pipeline_fps'
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    fps = site_config.get('fps_override') or cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+    processor = FrameProcessor(site_config, config_path, video_path, fps, detector,
+                               tracker_config, verbose=False, frame_size=frame_size)
+    if detections is not None:
+        source = 'synthetic'
+    elif detector is not None:
+        source = 'detector'
+    elif cache is not None:
+        source = 'cache'
+    else:
+        source = 'none'
+
+    durations: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = cv2.VideoWriter(os.path.join(tmp_dir, 'encode.mp4'),
+                                 cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+        frame_num = 0
+        while max_frames is None or frame_num < max_frames:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            durations['decode'].append(time.perf_counter() - start)
+            frame_num += 1
+
+            frame_detections = Detections.empty()
+            if detector is not None:
+                start = time.perf_counter()
+                frame_detections = detector.detect(frame, roi=processor.inference_roi(frame.shape))
+                durations['detect'].append(time.perf_counter() - start)
+            if detections is not None:
+                frame_detections = detections[frame_num - 1]
+            elif detector is None and cache is not None:
+                frame_detections = cache.get(frame_num) or Detections.empty()
+
+            start = time.perf_counter()
+            tracks = processor.tracker.update(frame_detections)
+            durations['track'].append(time.perf_counter() - start)
+
+            if processor.calibrator.is_calibrated():
+                start = time.perf_counter()
+                speeds = processor.speed_estimator.update_tracks(tracks, frame_num)
+                durations['speed'].append(time.perf_counter() - start)
+            else:
+                speeds = np.full(len(tracks), np.nan)
+
+            start = time.perf_counter()
+            zone_violations, _ = processor.violation_checker.check_tracks(tracks)
+            durations['rules'].append(time.perf_counter() - start)
+
+            result = {
+                'frame_num': frame_num,
+                'tracks': tracks,
+                'speeds': speeds,
+                'violations': zone_violations.any(axis=1),
+                'zone_violations': zone_violations.any(axis=0),
+                'has_violation': bool(zone_violations.any())
+            }
+            start = time.perf_counter()
+            frame = processor.render(frame, result)
+            durations['overlay'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            writer.write(frame)
+            durations['encode'].append(time.perf_counter() - start)
+        writer.release()
+    cap.release()
+
+    stages = {stage: summarize_durations(samples)
+              for stage, samples in durations.items() if samples}
+    total = sum(summary['total_s'] for summary in stages.values())
+    return {
+        'frames': frame_num,
+        'resolution': list(frame_size),
+        'detections_source': source,
+        'stages': stages,
+        'pipeline_fps': frame_num / total if total > 0 else 0.0
+    }
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.10,
+                    min_delta_ms: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Compare stage timings of a report with a baseline report.
+
+    A stage regresses when its median time grew by more than tolerance
+    (relative) and min_delta_ms (absolute, to ignore timer noise on
+    sub-millisecond stages). Medians are compared since means are swayed by
+    single stalls (page faults, scheduler hiccups).
+
+    Args:
+        report: New benchmark report
+        baseline: Baseline benchmark report
+        tolerance: Allowed relative slowdown
+        min_delta_ms: Allowed absolute slowdown
+
+    Returns:
+        One row per input and stage present in both, with 'input', 'stage',
+        'baseline_ms', 'current_ms', 'change' and 'regression'
+    """
+    rows = []
+    for name, result in report['inputs'].items():
+        baseline_result = baseline.get('inputs', {}).get(name)
+        if baseline_result is None:
+            continue
+        for stage, summary in result['stages'].items():
+            baseline_summary = baseline_result['stages'].get(stage)
+            if baseline_summary is None:
+                continue
+            before, after = baseline_summary['p50_ms'], summary['p50_ms']
+            change = (after - before) / before if before > 0 else 0.0
+            rows.append({
+                'input': name,
+                'stage': stage,
+                'baseline_ms': before,
+                'current_ms': after,
+                'change': change,
+                'regression': change > tolerance and after - before > min_delta_ms
+            })
+    return rows
+
+
+def platform_info() -> Dict[str, Any]:
+    """Describe the machine and library versions a report was made with."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def main():
+    """Main entry point for the benchmark suite."""
+    parser = argparse.ArgumentParser(
+        description='Time each processing stage on recorded and synthetic inputs'
+    )
+    parser.add_argument('--config', default='footage/siteA/config.yaml',
+                       help='Path to site config YAML')
+    parser.add_argument('--video', default='footage/siteA/test_short.mp4',
+                       help="Recorded input ('' to skip)")
+    parser.add_argument('--scenes', default='5,20,50',
+                       help="Vehicle counts of generated scenes, comma separated ('' to skip)")
+    parser.add_argument('--scene-size', default='1280x720',
+                       help='Generated scene resolution (default: 1280x720)')
+    parser.add_argument('--frames', type=int, default=300,
+                       help='Frames per input (default: 300)')
+    parser.add_argument('--detector-config', default='configs/detector_yolov8s.yaml',
+                       help='Path to detector config')
+    parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
+                       help='Path to tracker config')
+    parser.add_argument('--no-detector', action='store_true',
+                       help='Skip the detect stage (recorded input is fed from the '
+                            'detection cache when available)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'Detection cache feeding the recorded input without a detector '
+                            f'(default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--output',
+                       help='Report path (default: benchmarks/benchmark_<timestamp>.json)')
+    parser.add_argument('--baseline',
+                       help='Baseline report to compare against; exits with status 1 '
+                            'on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                       help="Allowed relative slowdown of a stage's median (default: 0.10)")
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        site_config = yaml.safe_load(f)
+
+    detector = None
+    if not args.no_detector:
+        try:
+            detector = VehicleDetector(args.detector_config)
+        except ImportError as e:
+            print(f"Detector unavailable, skipping detect stage: {e}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'platform': platform_info(),
+        'site_config': args.config,
+        'detector_config': args.detector_config if detector is not None else None,
+        'tracker_config': args.tracker_config,
+        'inputs': {}
+    }
+
+    if args.video:
+        cache = None
+        if detector is None:
+            entries = DetectionCache.find(args.video, args.cache_dir)
+            cache = DetectionCache.from_path(entries[0]) if entries else None
+        name = f"recorded:{Path(args.video).name}"
+        print(f"Benchmarking {name}...")
+        report['inputs'][name] = benchmark_input(args.video, site_config, args.config,
+                                                 args.tracker_config, detector, cache=cache,
+                                                 max_frames=args.frames)
+
+    width, height = (int(value) for value in args.scene_size.lower().split('x'))
+    for num_vehicles in [int(value) for value in args.scenes.split(',') if value.strip()]:
+        name = f"synthetic:{num_vehicles}_vehicles_{width}x{height}"
+        print(f"Benchmarking {name}...")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            video_path = os.path.join(tmp_dir, 'scene.mp4')
+            detections = generate_scene(site_config, video_path, num_vehicles, args.frames,
+                                        (width, height))
+            report['inputs'][name] = benchmark_input(video_path, site_config, args.config,
+                                                     args.tracker_config, detector,
+                                                     detections=detections)
+
+    output_path = args.output
+    if output_path is None:
+        output_path = f"benchmarks/benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in report['inputs'].items():
+        print(f"\n{name} ({result['frames']} frames, {result['resolution'][0]}x"
+              f"{result['resolution'][1]}, detections: {result['detections_source']}, "
+              f"{result['pipeline_fps']:.1f} FPS end to end)")
+        print(f"  {'stage':<8} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'total s':>8}")
+        for stage, summary in result['stages'].items():
+            print(f"  {stage:<8} {summary['mean_ms']:>9.3f} {summary['p50_ms']:>9.3f} "
+                  f"{summary['p90_ms']:>9.3f} {summary['p99_ms']:>9.3f} {summary['total_s']:>8.2f}")
+    print(f"\nReport: {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        rows = compare_reports(report, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline} (median ms, tolerance {args.tolerance:.0%}):")
+        for row in rows:
+            flag = "  REGRESSION" if row['regression'] else ""
+            print(f"  {row['input']:<40} {row['stage']:<8} {row['baseline_ms']:>9.3f} -> "
+                  f"{row['current_ms']:>9.3f} ms ({row['change']:+.1%}){flag}")
+        regressions = [row for row in rows if row['regression']]
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
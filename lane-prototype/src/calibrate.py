@@ -2,10 +2,14 @@
 Camera calibration module for pixel-to-world coordinate conversion.
 Supports homography-based calibration for speed estimation.
 """
+import hashlib
+import os
 import numpy as np
 import cv2
 from typing import Optional, Tuple, List
 
+DEFAULT_LUT_DIR = "cache/world_lut"
+
 
 class CameraCalibrator:
     """Handles pixel-to-world coordinate transformation."""
@@ -21,6 +25,13 @@ class CameraCalibrator:
         self.homography_matrix = None
         self.simple_scale = None
         
+        # Optional dense (H, W, 2) world-coordinate lookup table for fixed cameras
+        lut_config = config.get('world_lut') or {}
+        self.lut_enabled = lut_config.get('enabled', False)
+        self.lut_cache_dir = lut_config.get('cache_dir', DEFAULT_LUT_DIR)
+        self.world_lut = None
+        self.world_lut_path = None
+        
         # Try to build homography
         if 'homography' in config and config['homography']:
             self._build_homography(config['homography'])
@@ -63,6 +74,110 @@ class CameraCalibrator:
         else:
             return None
     
+    def pixel_to_world_batch(self, points: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Convert many pixel coordinates to world coordinates in one call.
+        
+        Uses the world lookup table when one is loaded, interpolating
+        bilinearly between pixel centres; points outside the table are
+        transformed directly.
+        
+        Args:
+            points: (N, 2) pixel coordinates
+            
+        Returns:
+            (N, 2) world coordinates in meters, or None if calibration not available
+        """
+        if not self.is_calibrated():
+            return None
+        
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.world_lut is None or len(points) == 0:
+            return self._transform_points(points)
+        
+        lut = self.world_lut
+        height, width = lut.shape[:2]
+        x, y = points[:, 0], points[:, 1]
+        inside = (x >= 0) & (y >= 0) & (x <= width - 1) & (y <= height - 1)
+        
+        world = np.empty_like(points)
+        if not inside.all():
+            world[~inside] = self._transform_points(points[~inside])
+        
+        x, y = x[inside], y[inside]
+        x0 = np.minimum(x.astype(np.intp), width - 2)
+        y0 = np.minimum(y.astype(np.intp), height - 2)
+        fx = (x - x0)[:, None]
+        fy = (y - y0)[:, None]
+        top = lut[y0, x0] * (1 - fx) + lut[y0, x0 + 1] * fx
+        bottom = lut[y0 + 1, x0] * (1 - fx) + lut[y0 + 1, x0 + 1] * fx
+        world[inside] = top * (1 - fy) + bottom * fy
+        return world
+    
+    def _transform_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        Transform (N, 2) pixel coordinates with the homography or simple scale.
+        
+        Args:
+            points: (N, 2) pixel coordinates
+            
+        Returns:
+            (N, 2) world coordinates in meters
+        """
+        if self.homography_matrix is None:
+            return points * self.simple_scale
+        if len(points) == 0:
+            return np.empty((0, 2))
+        world = cv2.perspectiveTransform(points.astype(np.float32).reshape(-1, 1, 2),
+                                         self.homography_matrix)
+        return world.reshape(-1, 2).astype(np.float64)
+    
+    def load_world_lut(self, frame_size: Tuple[int, int],
+                       directory: Optional[str] = None) -> Optional[str]:
+        """
+        Memory-map the world lookup table for a frame size, building it if needed.
+        
+        The table is saved in the cache folder under a name holding the
+        frame size and a hash of the calibration, so a changed calibration
+        never reuses a stale table and sites with the same calibration
+        share one.
+        
+        Args:
+            frame_size: (width, height) of the video frames
+            directory: Folder the table is stored in (default: the
+                       world_lut.cache_dir setting, cache/world_lut)
+            
+        Returns:
+            Path of the table file, or None if disabled or not calibrated
+        """
+        if not self.lut_enabled or not self.is_calibrated():
+            return None
+        
+        width, height = frame_size
+        if self.homography_matrix is not None:
+            calibration = np.asarray(self.homography_matrix, dtype=np.float64).tobytes()
+        else:
+            calibration = repr(float(self.simple_scale)).encode()
+        digest = hashlib.sha1(calibration).hexdigest()[:12]
+        directory = directory or self.lut_cache_dir
+        path = os.path.join(directory, f"world_lut_{width}x{height}_{digest}.npy")
+        
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            xs, ys = np.meshgrid(np.arange(width, dtype=np.float64),
+                                 np.arange(height, dtype=np.float64))
+            pixels = np.stack([xs.ravel(), ys.ravel()], axis=1)
+            lut = self._transform_points(pixels).astype(np.float32).reshape(height, width, 2)
+            # Write under a temporary name so concurrent runs never read a partial table
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, lut)
+            os.replace(tmp_path, path)
+        
+        self.world_lut = np.load(path, mmap_mode='r')
+        self.world_lut_path = path
+        return path
+    
     def is_calibrated(self) -> bool:
         """Check if calibration is available."""
         return self.homography_matrix is not None or self.simple_scale is not None
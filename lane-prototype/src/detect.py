@@ -2,23 +2,29 @@
 Vehicle detection module using YOLOv8.
 Detects cars, motorcycles, buses, and trucks from COCO pretrained model.
 """
+import math
 import yaml
-from typing import List, Dict, Any
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
-from ultralytics import YOLO
+
+try:
+    from ultralytics import YOLO
+    ULTRALYTICS_AVAILABLE = True
+except ImportError:
+    ULTRALYTICS_AVAILABLE = False
+
+from src.detections import Detections, VEHICLE_CLASS_MAP
 
 
 class VehicleDetector:
     """YOLOv8-based vehicle detector."""
     
     # COCO dataset vehicle class IDs
-    VEHICLE_CLASS_MAP = {
-        2: "car",
-        3: "motorcycle",
-        5: "bus",
-        7: "truck"
-    }
+    VEHICLE_CLASS_MAP = VEHICLE_CLASS_MAP
+    
+    # Model input sizes must be a multiple of the network stride
+    MODEL_STRIDE = 32
     
     def __init__(self, config_path: str):
         """
@@ -27,65 +33,156 @@ class VehicleDetector:
         Args:
             config_path: Path to detector config YAML file
         """
+        if not ULTRALYTICS_AVAILABLE:
+            raise ImportError("ultralytics is required for detection: pip install ultralytics")
+        
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
         # Load YOLOv8 model
-        model_name = self.config.get('model', 'yolov8s.pt')
-        self.model = YOLO(model_name)
+        self.model_name = self.config.get('model', 'yolov8s.pt')
+        self.model = YOLO(self.model_name)
         
         # Detection parameters
         self.img_size = self.config.get('img_size', 640)
         self.conf_thres = self.config.get('conf_thres', 0.25)
         self.iou_nms = self.config.get('iou_nms', 0.7)
         self.classes_keep = self.config.get('classes_keep', [2, 3, 5, 7])
+        self.batch_size = max(1, int(self.config.get('batch_size', 1)))
         
-    def detect(self, frame: np.ndarray) -> List[Dict[str, Any]]:
+    def detect(self, frame: np.ndarray,
+               roi: Optional[Tuple[int, int, int, int]] = None) -> Detections:
         """
         Detect vehicles in a frame.
         
         Args:
             frame: Input image as numpy array (BGR format)
+            roi: Optional (x1, y1, x2, y2) region to run inference on;
+                 boxes are still returned in full-frame coordinates
+            
+        Returns:
+            Detections with columnar arrays:
+                - boxes: [x1, y1, x2, y2] per row
+                - scores: confidence scores
+                - class_ids: COCO class IDs
+                - class_names: vehicle type names
+        """
+        return self.detect_batch([frame], rois=[roi])[0]
+    
+    def detect_batch(self, frames: List[np.ndarray],
+                     rois: Optional[Sequence[Optional[Tuple[int, int, int, int]]]] = None
+                     ) -> List[Detections]:
+        """
+        Detect vehicles in several frames with a single model call.
+        
+        Batching amortizes the per-call overhead of the model and lets the
+        backend vectorize across images.
+        
+        Args:
+            frames: List of input images (BGR format)
+            rois: Optional per-frame (x1, y1, x2, y2) inference regions (None
+                  entries use the full frame). Crops are inferred at a smaller
+                  input size when they fit, and boxes are mapped back to
+                  full-frame coordinates.
             
         Returns:
-            List of detections, each containing:
-                - bbox: [x1, y1, x2, y2]
-                - score: confidence score
-                - class_id: COCO class ID
-                - class_name: vehicle type name
+            One Detections per frame, in input order (see detect())
         """
+        if not frames:
+            return []
+        
+        if rois is None:
+            rois = [None] * len(frames)
+        
+        # Crop to the regions of interest (views, no copy)
+        images = [
+            frame if roi is None else frame[roi[1]:roi[3], roi[0]:roi[2]]
+            for frame, roi in zip(frames, rois)
+        ]
+        
         # Run inference
         # Note: imgsz only affects internal YOLO processing (resizing for the model).
         # The output bounding boxes are automatically scaled back to original frame dimensions.
         # The input frame is never modified - original quality is preserved.
         results = self.model(
-            frame,
+            images,
             classes=self.classes_keep,
             conf=self.conf_thres,
             iou=self.iou_nms,
-            imgsz=self.img_size,
+            imgsz=self._inference_size(images),
             verbose=False
         )
         
         detections = []
+        for result, roi in zip(results, rois):
+            frame_detections = self._parse_result(result)
+            if roi is not None and len(frame_detections) > 0:
+                offset = np.array([roi[0], roi[1], roi[0], roi[1]], dtype=np.float32)
+                frame_detections.boxes = frame_detections.boxes + offset
+            detections.append(frame_detections)
+        return detections
+    
+    def _inference_size(self, images: List[np.ndarray]) -> int:
+        """
+        Choose the model input size for a batch.
         
-        if results[0].boxes is not None and len(results[0].boxes) > 0:
-            for box in results[0].boxes:
-                class_id = int(box.cls[0])
-                score = float(box.conf[0])
-                bbox = box.xyxy[0].cpu().numpy().tolist()  # [x1, y1, x2, y2]
-                
-                # Get class name
-                class_name = self.VEHICLE_CLASS_MAP.get(class_id, "unknown")
-                
-                detections.append({
-                    'bbox': bbox,
-                    'score': score,
-                    'class_id': class_id,
-                    'class_name': class_name
-                })
+        Full frames use img_size. Crops smaller than img_size are run at
+        their own size (rounded up to the model stride), so fewer pixels go
+        through the network without downscaling the crop.
         
-        return detections
+        Args:
+            images: Images (frames or crops) of the batch
+            
+        Returns:
+            Input size in pixels
+        """
+        longest = max(max(image.shape[:2]) for image in images)
+        fitted = math.ceil(longest / self.MODEL_STRIDE) * self.MODEL_STRIDE
+        return min(self.img_size, fitted)
+    
+    @staticmethod
+    def roi_for_polygon(polygon: Optional[np.ndarray], frame_shape: Tuple[int, ...],
+                        margin: int = 32) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Get the inference region covering a polygon plus a margin.
+        
+        Args:
+            polygon: Polygon points [[x1,y1], [x2,y2], ...] or None
+            frame_shape: Frame shape (height, width, ...)
+            margin: Extra pixels around the polygon's bounding box
+            
+        Returns:
+            (x1, y1, x2, y2) clipped to the frame, or None for no polygon
+        """
+        if polygon is None or len(polygon) == 0:
+            return None
+        
+        height, width = frame_shape[:2]
+        points = np.asarray(polygon).reshape(-1, 2)
+        x1 = max(0, int(np.floor(points[:, 0].min())) - margin)
+        y1 = max(0, int(np.floor(points[:, 1].min())) - margin)
+        x2 = min(width, int(np.ceil(points[:, 0].max())) + 1 + margin)
+        y2 = min(height, int(np.ceil(points[:, 1].max())) + 1 + margin)
+        
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return (x1, y1, x2, y2)
+    
+    def _parse_result(self, result) -> Detections:
+        """
+        Convert one Ultralytics result into Detections.
+        
+        Args:
+            result: Ultralytics Results object for a single image
+            
+        Returns:
+            Detections
+        """
+        if result.boxes is None or len(result.boxes) == 0:
+            return Detections.empty()
+        
+        # Single device-to-host transfer of [x1, y1, x2, y2, conf, cls] rows
+        return Detections.from_array(result.boxes.data.cpu().numpy())
     
     def get_centroid(self, bbox: List[float]) -> tuple:
         """
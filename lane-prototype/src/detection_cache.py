@@ -0,0 +1,277 @@
+"""
+Persistent detection cache.
+Stores the detector output of every processed frame, keyed by the media's
+content hash and the detector settings, so reruns with changed rule, speed
+or tracker settings skip inference.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.detections import Detections
+
+DEFAULT_CACHE_DIR = "cache/detections"
+
+
+def media_hash(media_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Hash the content of a media file.
+
+    Args:
+        media_path: Path to video or image
+        chunk_size: Bytes read at a time
+
+    Returns:
+        Hex SHA-1 digest
+    """
+    digest = hashlib.sha1()
+    with open(media_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def detector_signature(detector, roi: Optional[Tuple[int, int, int, int]] = None) -> Dict[str, Any]:
+    """
+    Get the detector settings that determine its output.
+
+    Args:
+        detector: VehicleDetector
+        roi: Inference region used for the media, if any
+
+    Returns:
+        Dict with model, img_size, conf_thres, iou_nms, classes_keep and roi
+    """
+    return {
+        'model': detector.model_name,
+        'img_size': detector.img_size,
+        'conf_thres': detector.conf_thres,
+        'iou_nms': detector.iou_nms,
+        'classes_keep': sorted(detector.classes_keep),
+        'roi': list(roi) if roi is not None else None
+    }
+
+
+class DetectionCache:
+    """Per-frame detections of one media file under one detector configuration.
+
+    On disk each entry is a folder of memory-mappable arrays:
+        offsets.npy: (F + 1,) int64, rows of frame f are offsets[f - 1]:offsets[f]
+        detected.npy: (F,) bool, whether frame f has been through the detector
+        rows.npy: (M, 6) float32 [x1, y1, x2, y2, score, class_id]
+    plus meta.json describing the media and detector settings.
+    """
+
+    def __init__(self, media_path: str, detector, roi: Optional[Tuple[int, int, int, int]] = None,
+                 cache_dir: str = DEFAULT_CACHE_DIR, fps: Optional[float] = None,
+                 frame_size: Optional[Tuple[int, int]] = None):
+        """
+        Open the cache entry for a media file and detector.
+
+        Args:
+            media_path: Path to the video or image
+            detector: VehicleDetector whose settings key the entry
+            roi: Inference region used for the media, if any
+            cache_dir: Root folder of the cache
+            fps: Video frame rate, recorded for replays
+            frame_size: (width, height) of the frames, recorded for replays
+        """
+        self.media_path = media_path
+        self.signature = detector_signature(detector, roi)
+        self.media_hash = media_hash(media_path)
+
+        config_hash = hashlib.sha1(
+            json.dumps(self.signature, sort_keys=True).encode()
+        ).hexdigest()
+        self.path = Path(cache_dir) / f"{self.media_hash[:16]}_{config_hash[:12]}"
+
+        self.meta: Dict[str, Any] = {}
+        self._offsets = None
+        self._detected = None
+        self._rows = None
+        self._load()
+
+        self.fps = fps or self.meta.get('fps')
+        self.frame_size = frame_size or self.meta.get('frame_size')
+
+        # Frames detected in this run and not yet saved: frame_num -> (N, 6) rows
+        self._new: Dict[int, np.ndarray] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_path(cls, path: str) -> 'DetectionCache':
+        """
+        Open a saved cache entry by its folder, without a detector.
+
+        Args:
+            path: Entry folder (holding meta.json)
+
+        Returns:
+            DetectionCache (read-only use: get, get_all, meta)
+        """
+        cache = cls.__new__(cls)
+        cache.path = Path(path)
+        cache.meta = {}
+        cache._offsets = cache._detected = cache._rows = None
+        cache._load()
+        if not cache.meta:
+            raise ValueError(f"No detection cache entry at: {path}")
+        cache.media_path = cache.meta['media']
+        cache.media_hash = cache.meta['media_hash']
+        cache.signature = cache.meta['detector']
+        cache.fps = cache.meta.get('fps')
+        cache.frame_size = cache.meta.get('frame_size')
+        cache._new = {}
+        cache.hits = 0
+        cache.misses = 0
+        return cache
+
+    @staticmethod
+    def find(media_path: str, cache_dir: str = DEFAULT_CACHE_DIR) -> List[Path]:
+        """
+        Find the saved entries of a media file (one per detector configuration).
+
+        Args:
+            media_path: Path to the video or image
+            cache_dir: Root folder of the cache
+
+        Returns:
+            Entry folders, most recently updated first
+        """
+        prefix = media_hash(media_path)[:16]
+        entries = [path for path in Path(cache_dir).glob(f"{prefix}_*")
+                   if (path / 'meta.json').exists()]
+        return sorted(entries, key=lambda path: (path / 'meta.json').stat().st_mtime,
+                      reverse=True)
+
+    def _load(self):
+        """Memory-map the saved entry, if there is one."""
+        if not (self.path / 'meta.json').exists():
+            return
+        with open(self.path / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self._offsets = np.load(self.path / 'offsets.npy', mmap_mode='r')
+        self._detected = np.load(self.path / 'detected.npy', mmap_mode='r')
+        self._rows = np.load(self.path / 'rows.npy', mmap_mode='r')
+
+    @property
+    def video_frames(self) -> int:
+        """Frames in the media as far as known (the highest frame seen by any run)."""
+        return max(self.num_frames, self.meta.get('video_frames', 0))
+
+    @property
+    def num_frames(self) -> int:
+        """Number of frames covered by the saved entry."""
+        return 0 if self._detected is None else len(self._detected)
+
+    def get(self, frame_num: int) -> Optional[Detections]:
+        """
+        Get the cached detections of a frame.
+
+        Args:
+            frame_num: 1-based frame number
+
+        Returns:
+            Detections, or None if the frame is not cached
+        """
+        rows = self._new.get(frame_num)
+        if rows is None and 0 < frame_num <= self.num_frames and self._detected[frame_num - 1]:
+            rows = np.array(self._rows[self._offsets[frame_num - 1]:self._offsets[frame_num]])
+        if rows is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Detections.from_array(rows)
+
+    def get_all(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the saved entry's arrays (memory-mapped, read-only).
+
+        Returns:
+            (offsets, detected, rows) as described in the class docstring
+        """
+        if self._detected is None:
+            return (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=bool),
+                    np.zeros((0, 6), dtype=np.float32))
+        return self._offsets, self._detected, self._rows
+
+    def put(self, frame_num: int, detections: Detections):
+        """
+        Add the detector output of a frame.
+
+        Args:
+            frame_num: 1-based frame number
+            detections: Detections returned by the detector
+        """
+        self._new[frame_num] = np.concatenate([
+            detections.boxes,
+            detections.scores[:, None],
+            detections.class_ids[:, None].astype(np.float32)
+        ], axis=1)
+
+    def save(self, frames_seen: int = 0):
+        """
+        Merge frames added in this run into the saved entry.
+
+        Args:
+            frames_seen: Frames of the media the run went through (detected
+                         or not), so replays know where the media ends
+        """
+        if not self._new and frames_seen <= self.video_frames:
+            return
+
+        num_frames = max(self.num_frames, max(self._new, default=0))
+        video_frames = max(self.video_frames, frames_seen, num_frames)
+        counts = np.zeros(num_frames, dtype=np.int64)
+        detected = np.zeros(num_frames, dtype=bool)
+        chunks = []
+        for frame_num in range(1, num_frames + 1):
+            rows = self._new.get(frame_num)
+            if rows is None and frame_num <= self.num_frames and self._detected[frame_num - 1]:
+                rows = self._rows[self._offsets[frame_num - 1]:self._offsets[frame_num]]
+            if rows is None:
+                continue
+            detected[frame_num - 1] = True
+            counts[frame_num - 1] = len(rows)
+            chunks.append(rows)
+
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        rows = (np.concatenate(chunks).astype(np.float32) if chunks
+                else np.zeros((0, 6), dtype=np.float32))
+
+        # Write next to the entry and swap it in, so readers never see a partial entry
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}")
+        tmp_path.mkdir(parents=True, exist_ok=True)
+        np.save(tmp_path / 'offsets.npy', offsets)
+        np.save(tmp_path / 'detected.npy', detected)
+        np.save(tmp_path / 'rows.npy', rows)
+        with open(tmp_path / 'meta.json', 'w') as f:
+            json.dump({
+                'media': self.media_path,
+                'media_hash': self.media_hash,
+                'detector': self.signature,
+                'fps': self.fps,
+                'frame_size': list(self.frame_size) if self.frame_size else None,
+                'frames': num_frames,
+                'video_frames': video_frames,
+                'frames_detected': int(detected.sum()),
+                'updated': datetime.now().isoformat()
+            }, f, indent=2)
+
+        self._offsets = self._detected = self._rows = None
+        old_path = self.path.with_name(f"{self.path.name}.old-{os.getpid()}")
+        if self.path.exists():
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        self._load()
+        self._new = {}
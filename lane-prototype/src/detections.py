@@ -0,0 +1,166 @@
+"""
+Columnar detection container shared by detector, tracker, rules and overlay.
+Stores one frame's boxes as NumPy arrays instead of a list of dicts.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+# COCO dataset vehicle class IDs
+VEHICLE_CLASS_MAP = {
+    2: "car",
+    3: "motorcycle",
+    5: "bus",
+    7: "truck"
+}
+
+
+def class_name_for(class_id: int) -> str:
+    """Get the vehicle type name for a COCO class ID."""
+    return VEHICLE_CLASS_MAP.get(int(class_id), "unknown")
+
+
+class Detections:
+    """Struct-of-arrays set of boxes for a single frame.
+
+    Attributes:
+        boxes: (N, 4) float32 array of [x1, y1, x2, y2]
+        scores: (N,) float32 confidence scores
+        class_ids: (N,) int32 COCO class IDs
+        track_ids: (N,) int64 track IDs, -1 where no track is assigned
+    """
+
+    def __init__(self, boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray,
+                 track_ids: Optional[np.ndarray] = None):
+        """
+        Initialize detections.
+
+        Args:
+            boxes: (N, 4) boxes as [x1, y1, x2, y2]
+            scores: (N,) confidence scores
+            class_ids: (N,) COCO class IDs
+            track_ids: Optional (N,) track IDs
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int32).reshape(-1)
+        if track_ids is None:
+            self.track_ids = np.full(len(self.boxes), -1, dtype=np.int64)
+        else:
+            self.track_ids = np.asarray(track_ids, dtype=np.int64).reshape(-1)
+
+        self._centroids: Optional[np.ndarray] = None
+
+    @classmethod
+    def empty(cls) -> 'Detections':
+        """Create an empty set of detections."""
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    @classmethod
+    def from_array(cls, data: np.ndarray) -> 'Detections':
+        """
+        Create detections from an (N, 6) array of [x1, y1, x2, y2, score, class_id].
+
+        This is the layout of Ultralytics `Boxes.data`, so a whole frame is
+        converted with a single device-to-host transfer.
+
+        Args:
+            data: (N, 6) array
+
+        Returns:
+            Detections
+        """
+        data = np.asarray(data, dtype=np.float32)
+        if data.size == 0:
+            return cls.empty()
+        # Score and class are always the last two columns (tracked boxes add an ID column)
+        return cls(data[:, :4], data[:, -2], data[:, -1].astype(np.int32))
+
+    @classmethod
+    def from_dicts(cls, detections: List[Dict[str, Any]]) -> 'Detections':
+        """
+        Create detections from the legacy list-of-dicts format.
+
+        Args:
+            detections: Dicts with 'bbox', 'score', 'class_id' and optional 'track_id'
+
+        Returns:
+            Detections
+        """
+        if not detections:
+            return cls.empty()
+        track_ids = None
+        if all('track_id' in det for det in detections):
+            track_ids = [det['track_id'] for det in detections]
+        return cls(
+            [det['bbox'] for det in detections],
+            [det['score'] for det in detections],
+            [det['class_id'] for det in detections],
+            track_ids
+        )
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __getitem__(self, index) -> 'Detections':
+        """Select a subset of rows with an index array, boolean mask or slice."""
+        return Detections(self.boxes[index], self.scores[index],
+                          self.class_ids[index], self.track_ids[index])
+
+    @property
+    def centroids(self) -> np.ndarray:
+        """(N, 2) float64 box centroids as (cx, cy)."""
+        if self._centroids is None:
+            boxes = self.boxes.astype(np.float64)
+            self._centroids = np.stack([
+                (boxes[:, 0] + boxes[:, 2]) / 2,
+                (boxes[:, 1] + boxes[:, 3]) / 2
+            ], axis=1)
+        return self._centroids
+
+    @property
+    def class_names(self) -> List[str]:
+        """Vehicle type name for each row."""
+        return [class_name_for(class_id) for class_id in self.class_ids]
+
+    def with_track_ids(self, track_ids: np.ndarray) -> 'Detections':
+        """
+        Get the same detections with track IDs assigned.
+
+        The box, score and class arrays are shared, not copied.
+
+        Args:
+            track_ids: (N,) track IDs
+
+        Returns:
+            Detections with track_ids set
+        """
+        tracks = Detections(self.boxes, self.scores, self.class_ids, track_ids)
+        tracks._centroids = self._centroids
+        return tracks
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Convert to the legacy list-of-dicts format (e.g. for JSON output).
+
+        Returns:
+            List of dicts with 'bbox', 'score', 'class_id', 'class_name'
+            and, when assigned, 'track_id'
+        """
+        dicts = []
+        for i in range(len(self)):
+            det = {
+                'bbox': self.boxes[i].tolist(),
+                'score': float(self.scores[i]),
+                'class_id': int(self.class_ids[i]),
+                'class_name': class_name_for(self.class_ids[i])
+            }
+            if self.track_ids[i] >= 0:
+                det['track_id'] = int(self.track_ids[i])
+            dicts.append(det)
+        return dicts
+
+
+# Detections with track_ids assigned, as returned by VehicleTracker.update()
+Tracks = Detections
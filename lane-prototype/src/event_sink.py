@@ -0,0 +1,159 @@
+"""
+Streaming event sink.
+Appends violation events to JSON Lines files as they happen, so a crash loses
+at most the last unflushed batch and memory does not grow with the event count.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class EventSink:
+    """Append-only JSON Lines writer with batched flushing and rotation."""
+
+    def __init__(self, config: dict, base_path: Path):
+        """
+        Initialize event sink.
+
+        Args:
+            config: Site configuration dictionary
+            base_path: Event log path without suffix; parts are written as
+                       <base_path>.events-0001.jsonl, -0002, ...
+        """
+        sink_config = config.get('event_sink') or {}
+        self.enabled = sink_config.get('enabled', False)
+        self.flush_every_n_events = max(1, sink_config.get('flush_every_n_events', 20))
+        self.flush_interval_s = sink_config.get('flush_interval_s', 1.0)
+        self.fsync = sink_config.get('fsync', True)
+        self.rotate_max_bytes = sink_config.get('rotate_max_bytes', 64 * 1024 * 1024)
+        self.rotate_max_seconds = sink_config.get('rotate_max_seconds', 0)
+        self.background = sink_config.get('background', False)
+
+        self.base_path = Path(base_path)
+
+        # Encoded lines waiting for the next flush
+        self._pending: List[str] = []
+        self._last_flush = time.monotonic()
+
+        self._file = None
+        self._file_bytes = 0
+        self._file_opened_at = 0.0
+        self.files: List[str] = []
+
+        self.events_written = 0
+
+        # Background writer: events are handed over on a queue and only the
+        # writer thread touches the files
+        self._queue: Optional[queue.Queue] = None
+        self._thread = None
+        self._error: Optional[BaseException] = None
+        if self.enabled and self.background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run_writer, name='event-sink',
+                                            daemon=True)
+            self._thread.start()
+
+    def write(self, event: Dict[str, Any]):
+        """
+        Append an event.
+
+        Args:
+            event: Violation event record (JSON serializable)
+        """
+        if self._queue is not None:
+            if self._error is not None:
+                raise RuntimeError("Event sink writer failed") from self._error
+            self._queue.put(event)
+        else:
+            self._append(event)
+
+    def close(self):
+        """Flush remaining events and close the current file."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            if self._error is not None:
+                raise RuntimeError("Event sink writer failed") from self._error
+        else:
+            self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def manifest(self) -> Dict[str, Any]:
+        """
+        Describe the written event files, for the run's summary JSON.
+
+        Returns:
+            Dict with 'num_violations' and 'event_files' (names relative to
+            the summary JSON's folder)
+        """
+        return {
+            'num_violations': self.events_written,
+            'event_files': list(self.files)
+        }
+
+    def _append(self, event: Dict[str, Any]):
+        """Buffer an encoded event and flush when the batch is full or old enough."""
+        self._pending.append(json.dumps(event) + '\n')
+        self.events_written += 1
+        if (len(self._pending) >= self.flush_every_n_events
+                or time.monotonic() - self._last_flush >= self.flush_interval_s):
+            self._flush()
+
+    def _flush(self):
+        """Write buffered events to disk, rotating the file first if due."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+
+        if self._file is None or self._rotation_due():
+            self._open_next_file()
+
+        data = ''.join(self._pending)
+        self._pending = []
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file_bytes += len(data.encode('utf-8'))
+
+    def _rotation_due(self) -> bool:
+        """Check whether the current file has reached its size or age limit."""
+        if self.rotate_max_bytes and self._file_bytes >= self.rotate_max_bytes:
+            return True
+        if self.rotate_max_seconds and time.monotonic() - self._file_opened_at >= self.rotate_max_seconds:
+            return True
+        return False
+
+    def _open_next_file(self):
+        """Close the current part and start the next one."""
+        if self._file is not None:
+            self._file.close()
+        self.base_path.parent.mkdir(parents=True, exist_ok=True)
+        path = Path(f"{self.base_path}.events-{len(self.files) + 1:04d}.jsonl")
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file_bytes = 0
+        self._file_opened_at = time.monotonic()
+        self.files.append(path.name)
+
+    def _run_writer(self):
+        """Writer thread: drain the queue, flushing on batch size or interval."""
+        try:
+            while True:
+                try:
+                    event = self._queue.get(timeout=self.flush_interval_s)
+                except queue.Empty:
+                    self._flush()
+                    continue
+                if event is None:
+                    break
+                self._append(event)
+            self._flush()
+        except BaseException as e:
+            self._error = e
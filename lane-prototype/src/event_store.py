@@ -0,0 +1,330 @@
+"""
+Indexed event store for violation queries.
+Keeps the events of all runs in one SQLite database, indexed on site, time,
+class, track and violation type, with a query CLI and an importer for the
+JSON logs in events/logs.
+"""
+import argparse
+import glob
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    site TEXT NOT NULL,
+    media TEXT,
+    site_config TEXT,
+    log_file TEXT UNIQUE,
+    started_at REAL NOT NULL,
+    total_frames INTEGER,
+    fps REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    event_id TEXT,
+    site TEXT NOT NULL,
+    event_time REAL NOT NULL,
+    media_ms REAL,
+    frame_num INTEGER,
+    track_id INTEGER,
+    class TEXT,
+    violation TEXT,
+    speed_kph REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_site_time ON events (site, event_time);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (event_time);
+CREATE INDEX IF NOT EXISTS idx_events_class ON events (class, event_time);
+CREATE INDEX IF NOT EXISTS idx_events_track ON events (run_id, track_id);
+CREATE INDEX IF NOT EXISTS idx_events_violation ON events (violation, event_time);
+"""
+
+DEFAULT_DB_PATH = "events/events.db"
+
+
+class EventStore:
+    """SQLite store of violation events with batched inserts."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, batch_size: int = 100):
+        """
+        Open (and create if needed) an event store.
+
+        Args:
+            db_path: Path to the SQLite database
+            batch_size: Events inserted per transaction
+        """
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        # WAL lets reviewers query while a run is still writing
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        # Rows waiting for the next transaction
+        self._pending: List[tuple] = []
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional['EventStore']:
+        """
+        Open the store configured in a site config's 'event_store' block.
+
+        Args:
+            config: Site configuration dictionary
+
+        Returns:
+            EventStore, or None if the store is not enabled
+        """
+        store_config = config.get('event_store') or {}
+        if not store_config.get('enabled', False):
+            return None
+        return cls(store_config.get('path', DEFAULT_DB_PATH),
+                   store_config.get('batch_size', 100))
+
+    def start_run(self, kind: str, site: str, media: str, site_config: Optional[str] = None,
+                  log_file: Optional[str] = None, started_at: Optional[float] = None,
+                  total_frames: Optional[int] = None, fps: Optional[float] = None) -> int:
+        """
+        Register a processing run.
+
+        Args:
+            kind: 'video' or 'image'
+            site: Site name
+            media: Input media path
+            site_config: Path to site config YAML
+            log_file: JSON log of the run (used to skip it when importing)
+            started_at: Run start as a Unix timestamp (defaults to now)
+            total_frames: Frames processed, if known
+            fps: Video frame rate
+
+        Returns:
+            run_id of the new run
+        """
+        if started_at is None:
+            started_at = datetime.now().timestamp()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (kind, site, media, site_config, log_file, started_at, "
+                "total_frames, fps) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, site, media, site_config, log_file, started_at, total_frames, fps)
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id: int, total_frames: int):
+        """Record the number of frames a run processed and write pending events."""
+        self.flush()
+        with self.conn:
+            self.conn.execute("UPDATE runs SET total_frames = ? WHERE run_id = ?",
+                              (total_frames, run_id))
+
+    def add_event(self, run_id: int, site: str, started_at: float, event: Dict[str, Any]):
+        """
+        Queue an event; it is inserted with the next batch.
+
+        Args:
+            run_id: Run the event belongs to
+            site: Site name
+            started_at: Run start (Unix timestamp); the event time is this
+                        plus the event's media offset
+            event: Violation event record
+        """
+        media_ms = event.get('timestamp_ms')
+        event_time = started_at + (media_ms or 0.0) / 1000.0
+        self._pending.append((
+            run_id, event.get('event_id'), site, event_time, media_ms,
+            event.get('frame_num'), event.get('track_id'), event.get('class'),
+            event.get('violation'), event.get('speed_kph'), json.dumps(event)
+        ))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Insert queued events in one transaction."""
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO events (run_id, event_id, site, event_time, media_ms, frame_num, "
+                "track_id, class, violation, speed_kph, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending
+            )
+        self._pending = []
+
+    def close(self):
+        """Write pending events and close the database."""
+        self.flush()
+        self.conn.close()
+
+    def query(self, site: Optional[str] = None, class_name: Optional[str] = None,
+              violation: Optional[str] = None, track_id: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Find events matching all given filters, oldest first.
+
+        Args:
+            site: Site name
+            class_name: Vehicle class
+            violation: Violation type (zone name)
+            track_id: Track identifier
+            since: Earliest event time (Unix timestamp, inclusive)
+            until: Latest event time (Unix timestamp, exclusive)
+            limit: Maximum number of events
+
+        Returns:
+            Event records, each with 'event_time' (ISO) and 'run_id' added
+        """
+        conditions, params = [], []
+        for column, value in (('site', site), ('class', class_name),
+                              ('violation', violation), ('track_id', track_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("event_time >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("event_time < ?")
+            params.append(until)
+
+        sql = "SELECT run_id, site, event_time, data FROM events"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY event_time, id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        events = []
+        for run_id, site_name, event_time, data in self.conn.execute(sql, params):
+            event = json.loads(data)
+            event['site'] = site_name
+            event['event_time'] = datetime.fromtimestamp(event_time).isoformat()
+            event['run_id'] = run_id
+            events.append(event)
+        return events
+
+    def has_log(self, log_file: str) -> bool:
+        """Check whether a JSON log has already been written or imported."""
+        row = self.conn.execute("SELECT 1 FROM runs WHERE log_file = ?", (log_file,)).fetchone()
+        return row is not None
+
+    def import_log(self, log_path: str) -> Optional[int]:
+        """
+        Import a JSON log from events/logs (video, image or streamed manifest).
+
+        Runs are timed by the log's 'timestamp', which for video logs is
+        written at the end of processing.
+
+        Args:
+            log_path: Path to the JSON log
+
+        Returns:
+            Number of events imported, or None if the log was already in the store
+        """
+        log_file = str(Path(log_path).resolve())
+        if self.has_log(log_file):
+            return None
+
+        with open(log_path, 'r') as f:
+            log = json.load(f)
+
+        site_config = log.get('site_config')
+        site = Path(site_config).parent.name if site_config else Path(log_path).stem.split('_')[0]
+        kind = 'image' if 'total_detections' in log else 'video'
+        started_at = datetime.fromisoformat(log['timestamp']).timestamp()
+
+        run_id = self.start_run(kind, site, log.get('media'), site_config, log_file,
+                                started_at, log.get('total_frames'), log.get('fps'))
+        count = 0
+        for event in _log_events(log_path, log):
+            self.add_event(run_id, site, started_at, event)
+            count += 1
+        self.flush()
+        return count
+
+
+def _log_events(log_path: str, log: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Events of a JSON log, read from its streamed event files if it has them."""
+    if 'violations' in log:
+        yield from log['violations']
+        return
+    for name in log.get('event_files', []):
+        with open(Path(log_path).parent / name, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO date/time (local time) into a Unix timestamp."""
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    """Main entry point for querying and importing events."""
+    parser = argparse.ArgumentParser(description='Query and import violation events')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH,
+                       help=f'Path to the event database (default: {DEFAULT_DB_PATH})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = subparsers.add_parser('query', help='List matching events')
+    query_parser.add_argument('--site', help='Site name')
+    query_parser.add_argument('--class', dest='class_name', help='Vehicle class')
+    query_parser.add_argument('--violation', help='Violation type (zone name)')
+    query_parser.add_argument('--track', type=int, help='Track ID')
+    query_parser.add_argument('--since', help='Earliest event time, e.g. 2025-11-02T14:00')
+    query_parser.add_argument('--until', help='Latest event time (exclusive)')
+    query_parser.add_argument('--limit', type=int, help='Maximum number of events')
+    query_parser.add_argument('--json', action='store_true',
+                             help='Print events as JSON instead of a table')
+
+    import_parser = subparsers.add_parser('import', help='Import JSON logs')
+    import_parser.add_argument('logs', nargs='*', default=['events/logs/*.json'],
+                              help='JSON log files or glob patterns '
+                                   '(default: events/logs/*.json)')
+
+    args = parser.parse_args()
+    store = EventStore(args.db)
+
+    try:
+        if args.command == 'import':
+            paths = sorted({path for pattern in args.logs for path in glob.glob(pattern)})
+            for path in paths:
+                count = store.import_log(path)
+                if count is None:
+                    print(f"  {path}: already imported")
+                else:
+                    print(f"  {path}: {count} event(s)")
+            return
+
+        events = store.query(site=args.site, class_name=args.class_name,
+                             violation=args.violation, track_id=args.track,
+                             since=_parse_time(args.since), until=_parse_time(args.until),
+                             limit=args.limit)
+        if args.json:
+            print(json.dumps(events, indent=2))
+            return
+        for event in events:
+            speed = event.get('speed_kph')
+            speed_text = f"{speed:.1f} km/h" if speed is not None else "-"
+            print(f"{event['event_time']}  {event['site']:<10} {event.get('class', '-'):<12} "
+                  f"{event.get('violation', '-'):<16} track {event.get('track_id', '-'):<5} "
+                  f"{speed_text:>11}  {event.get('event_id', '')}")
+        print(f"{len(events)} event(s)")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Evidence clips for violation events.
+Keeps the last few seconds of frames in memory and writes a short clip with
+pre-roll and post-roll around each violation instead of the whole video.
+"""
+import os
+from collections import deque
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+
+class ClipRecorder:
+    """Ring buffer of recent frames that turns violation events into clips."""
+
+    def __init__(self, config: dict, fps: float, output_dir: str):
+        """
+        Initialize clip recorder.
+
+        Args:
+            config: Site configuration dictionary
+            fps: Video frame rate
+            output_dir: Folder the clips of this run are written to
+        """
+        clip_config = config.get('evidence_clips') or {}
+        self.enabled = clip_config.get('enabled', False)
+        self.annotate = clip_config.get('annotate', True)
+        self.pre_frames = max(1, int(round(clip_config.get('pre_seconds', 3.0) * fps)))
+        self.post_frames = max(0, int(round(clip_config.get('post_seconds', 2.0) * fps)))
+
+        self.fps = fps
+        self.output_dir = output_dir
+
+        # Last pre_frames frames, oldest first (the current frame included)
+        self._buffer: deque = deque(maxlen=self.pre_frames)
+
+        # Clips still recording post-roll: [writer, frames left]
+        self._active: List[list] = []
+
+        self.clips_written = 0
+
+    def add_frame(self, frame: np.ndarray):
+        """
+        Add the next frame of the video.
+
+        Args:
+            frame: Frame as it should appear in clips (annotated or raw)
+        """
+        self._buffer.append(frame)
+
+        still_active = []
+        for clip in self._active:
+            writer, frames_left = clip
+            writer.write(frame)
+            if frames_left <= 1:
+                writer.release()
+            else:
+                clip[1] = frames_left - 1
+                still_active.append(clip)
+        self._active = still_active
+
+    def record_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start a clip for an event triggered on the most recently added frame.
+
+        The clip holds the buffered pre-roll (ending with the trigger frame)
+        and keeps recording for post_frames further frames.
+
+        Args:
+            event: Violation event record
+
+        Returns:
+            Copy of the event with 'clip' (file name) added after 'event_id'
+        """
+        if not self._buffer:
+            return event
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        clip_name = f"{event['event_id']}.mp4"
+        height, width = self._buffer[-1].shape[:2]
+        writer = cv2.VideoWriter(os.path.join(self.output_dir, clip_name),
+                                 cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+        for frame in self._buffer:
+            writer.write(frame)
+
+        if self.post_frames > 0:
+            self._active.append([writer, self.post_frames])
+        else:
+            writer.release()
+        self.clips_written += 1
+
+        recorded = {}
+        for key, value in event.items():
+            recorded[key] = value
+            if key == 'event_id':
+                recorded['clip'] = clip_name
+        return recorded
+
+    def close(self):
+        """Finish clips still recording (post-roll is cut short at the end of the video)."""
+        for writer, _ in self._active:
+            writer.release()
+        self._active = []
+        self._buffer.clear()
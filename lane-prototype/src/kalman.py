@@ -0,0 +1,153 @@
+"""
+Constant-velocity Kalman filter for bounding boxes.
+Predicts track boxes forward between detections, vectorized over all tracks.
+"""
+from typing import Tuple
+
+import numpy as np
+
+
+class BoxKalmanFilter:
+    """
+    Kalman filter over box state [cx, cy, w, h, vcx, vcy, vw, vh].
+
+    Boxes move with constant velocity; the box center, size and their
+    velocities are estimated from [cx, cy, w, h] measurements. Process and
+    measurement noise scale with box size, as in BYTETrack. All methods work
+    on a batch of N tracks at once.
+    """
+
+    ndim = 4
+
+    def __init__(self, std_weight_position: float = 1.0 / 20,
+                 std_weight_velocity: float = 1.0 / 160):
+        """
+        Initialize filter.
+
+        Args:
+            std_weight_position: Position noise relative to box size
+            std_weight_velocity: Velocity noise relative to box size
+        """
+        self.std_weight_position = std_weight_position
+        self.std_weight_velocity = std_weight_velocity
+
+        # Transition (one frame step) and observation matrices
+        self.motion_mat = np.eye(2 * self.ndim)
+        self.motion_mat[:self.ndim, self.ndim:] = np.eye(self.ndim)
+        self.update_mat = np.eye(self.ndim, 2 * self.ndim)
+
+    def initiate(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Create track states from first detections.
+
+        Args:
+            boxes: (N, 4) boxes as [x1, y1, x2, y2]
+
+        Returns:
+            (mean, covariance) of shapes (N, 8) and (N, 8, 8)
+        """
+        measurement = boxes_to_xywh(boxes)
+        mean = np.concatenate([measurement, np.zeros_like(measurement)], axis=1)
+
+        wh = measurement[:, [2, 3, 2, 3]]
+        std = np.concatenate([
+            2 * self.std_weight_position * wh,
+            10 * self.std_weight_velocity * wh
+        ], axis=1)
+        covariance = _diag(np.square(std))
+        return mean, covariance
+
+    def predict(self, mean: np.ndarray,
+                covariance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advance track states by one frame.
+
+        Args:
+            mean: (N, 8) state means
+            covariance: (N, 8, 8) state covariances
+
+        Returns:
+            Predicted (mean, covariance)
+        """
+        if len(mean) == 0:
+            return mean, covariance
+
+        wh = mean[:, [2, 3, 2, 3]]
+        std = np.concatenate([
+            self.std_weight_position * wh,
+            self.std_weight_velocity * wh
+        ], axis=1)
+        motion_cov = _diag(np.square(std))
+
+        mean = mean @ self.motion_mat.T
+        covariance = self.motion_mat @ covariance @ self.motion_mat.T + motion_cov
+        return mean, covariance
+
+    def update(self, mean: np.ndarray, covariance: np.ndarray,
+               boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Correct track states with matched detections.
+
+        Args:
+            mean: (N, 8) predicted state means
+            covariance: (N, 8, 8) predicted state covariances
+            boxes: (N, 4) matched detection boxes as [x1, y1, x2, y2]
+
+        Returns:
+            Corrected (mean, covariance)
+        """
+        if len(mean) == 0:
+            return mean, covariance
+
+        measurement = boxes_to_xywh(boxes)
+
+        # Project state into measurement space
+        wh = mean[:, [2, 3, 2, 3]]
+        innovation_cov = _diag(np.square(self.std_weight_position * wh))
+        projected_mean = mean @ self.update_mat.T
+        projected_cov = (self.update_mat @ covariance @ self.update_mat.T
+                         + innovation_cov)
+
+        # Kalman gain K = P H^T S^-1, solved per track
+        cross_cov = covariance @ self.update_mat.T
+        gain = np.linalg.solve(projected_cov, cross_cov.transpose(0, 2, 1)).transpose(0, 2, 1)
+
+        innovation = measurement - projected_mean
+        mean = mean + np.einsum('nij,nj->ni', gain, innovation)
+        covariance = covariance - gain @ projected_cov @ gain.transpose(0, 2, 1)
+        return mean, covariance
+
+
+def boxes_to_xywh(boxes: np.ndarray) -> np.ndarray:
+    """Convert (N, 4) [x1, y1, x2, y2] boxes to [cx, cy, w, h]."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.stack([
+        (boxes[:, 0] + boxes[:, 2]) / 2,
+        (boxes[:, 1] + boxes[:, 3]) / 2,
+        boxes[:, 2] - boxes[:, 0],
+        boxes[:, 3] - boxes[:, 1]
+    ], axis=1)
+
+
+def xywh_to_boxes(xywh: np.ndarray) -> np.ndarray:
+    """Convert (N, >=4) [cx, cy, w, h, ...] states to [x1, y1, x2, y2] boxes."""
+    xywh = np.asarray(xywh, dtype=np.float64)
+    if len(xywh) == 0:
+        return np.zeros((0, 4))
+    half_w = np.maximum(xywh[:, 2], 1.0) / 2
+    half_h = np.maximum(xywh[:, 3], 1.0) / 2
+    return np.stack([
+        xywh[:, 0] - half_w,
+        xywh[:, 1] - half_h,
+        xywh[:, 0] + half_w,
+        xywh[:, 1] + half_h
+    ], axis=1)
+
+
+def _diag(values: np.ndarray) -> np.ndarray:
+    """Stack (N, D) values into (N, D, D) diagonal matrices."""
+    n, d = values.shape
+    out = np.zeros((n, d, d))
+    idx = np.arange(d)
+    out[:, idx, idx] = values
+    return out
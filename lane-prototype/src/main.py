@@ -8,30 +8,146 @@ import os
 import time
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 import cv2
 import yaml
 
 from src.detect import VehicleDetector
-from src.track import VehicleTracker
-from src.calibrate import CameraCalibrator
-from src.speed import SpeedEstimator
-from src.rules import LaneViolationChecker
-from src.overlay import OverlayDrawer
+from src.processor import FrameProcessor
+from src.pipeline import StagedPipeline
+from src.evidence import ClipRecorder
+from src.event_sink import EventSink
+from src.event_store import EventStore
+from src.detection_cache import DetectionCache
+from src.metrics import RunMetrics
 
 
-def process_video(config_path: str, video_path: str, output_path: str,
+def read_frames(cap: cv2.VideoCapture, start_frame: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Decode frames from a video capture.
+
+    Args:
+        cap: Opened video capture
+        start_frame: Frame number of the next frame the capture returns
+                     (differs from 1 after seeking)
+
+    Yields:
+        Dicts with 'frame_num' (1-based) and 'frame'
+    """
+    frame_num = start_frame - 1
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_num += 1
+        yield {'frame_num': frame_num, 'frame': frame}
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """
+    Group consecutive items into lists of up to batch_size.
+
+    Args:
+        items: Items in order
+        batch_size: Maximum items per batch
+
+    Yields:
+        Lists of items, preserving order
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def event_log_path(config_path: str, name: Optional[str] = None) -> Path:
+    """
+    Get a new events/logs/<name>_video_<timestamp>.json path for a video run.
+    
+    Args:
+        config_path: Path to site config YAML (site name is its folder)
+        name: Name of the run's stream, for runs sharing a site and start
+              time (defaults to the site name)
+        
+    Returns:
+        Path of the run's JSON log
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = name or Path(config_path).parent.name
+    return Path("events/logs") / f"{name}_video_{timestamp}.json"
+
+
+def save_event_log(config_path: str, media: str, total_frames: int, fps: float,
+                   violation_events: Optional[List[Dict[str, Any]]],
+                   extra: Optional[Dict[str, Any]] = None,
+                   event_file: Optional[Path] = None) -> Path:
+    """
+    Write the violation events of a video run to events/logs.
+    
+    Args:
+        config_path: Path to site config YAML (site name is its folder)
+        media: Input video path
+        total_frames: Number of frames processed
+        fps: Video frame rate
+        violation_events: Event records, or None if they were streamed to
+                          event files (listed in extra) instead
+        extra: Optional additional run statistics for the log
+        event_file: Path to write (defaults to a new event_log_path())
+        
+    Returns:
+        Path of the written JSON file
+    """
+    if event_file is None:
+        event_file = event_log_path(config_path)
+    event_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    event_data = {
+        'timestamp': datetime.now().isoformat(),
+        'media': media,
+        'site_config': config_path,
+        'total_frames': total_frames,
+        'fps': fps
+    }
+    event_data.update(extra or {})
+    if violation_events is not None:
+        event_data['violations'] = violation_events
+    
+    with open(event_file, 'w') as f:
+        json.dump(event_data, f, indent=2)
+    
+    return event_file
+
+
+def process_video(config_path: str, video_path: str, output_path: Optional[str] = None,
                  detector_config: str = "configs/detector_yolov8s.yaml",
-                 tracker_config: str = "configs/tracker_bytetrack.yaml"):
+                 tracker_config: str = "configs/tracker_bytetrack.yaml",
+                 pipeline: bool = False, queue_size: int = 8,
+                 detect_every_n_frames: int = 1, headless: bool = False,
+                 detection_cache: Optional[str] = None):
     """
     Process video for lane violations with tracking and speed estimation.
     
     Args:
         config_path: Path to site config YAML
         video_path: Path to input video
-        output_path: Path to save output video
+        output_path: Path to save output video (None for headless)
         detector_config: Path to detector config
         tracker_config: Path to tracker config
+        pipeline: Run decode, detection, analysis, rendering and encoding
+                  concurrently on bounded queues
+        queue_size: Batches buffered between pipeline stages; one batch is
+                    batch_size * detect_every_n_frames frames
+        detect_every_n_frames: Run the detector only on every Nth frame and
+                               track motion-predicted boxes in between
+        headless: Only produce the events log; skip overlay drawing, live
+                  preview and video encoding
+        detection_cache: Folder of the detection cache; cached frames skip
+                         the detector and new ones are added (None to disable)
     """
     print(f"Processing video: {video_path}")
     
@@ -52,152 +168,236 @@ def process_video(config_path: str, video_path: str, output_path: str,
     
     print(f"Video: {frame_width}x{frame_height} @ {fps:.2f} FPS, {total_frames} frames")
     
+    headless = headless or output_path is None
+    
     # Initialize modules
     print("Initializing detector, tracker, and calibrator...")
     detector = VehicleDetector(detector_config)
-    tracker = VehicleTracker(tracker_config, fps=fps)
-    calibrator = CameraCalibrator(site_config)
-    speed_estimator = SpeedEstimator(calibrator, site_config, fps)
-    violation_checker = LaneViolationChecker(site_config)
-    overlay_drawer = OverlayDrawer(site_config)
+    processor = FrameProcessor(site_config, config_path, video_path, fps,
+                               detector, tracker_config,
+                               frame_size=(frame_width, frame_height),
+                               detect_every_n_frames=detect_every_n_frames)
+    overlay_drawer = processor.overlay_drawer
+    
+    if detection_cache:
+        processor.detection_cache = DetectionCache(
+            video_path, detector, processor.inference_roi((frame_height, frame_width, 3)),
+            detection_cache, fps=fps, frame_size=(frame_width, frame_height)
+        )
+        print(f"Detection cache: {processor.detection_cache.path} "
+              f"({processor.detection_cache.num_frames} frames cached)")
     
     # Create output video writer
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    video_writer = overlay_drawer.create_video_writer(
-        output_path, fps, (frame_width, frame_height)
-    )
+    video_writer = None
+    if not headless:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        video_writer = overlay_drawer.create_video_writer(
+            output_path, fps, (frame_width, frame_height)
+        )
+    
+    # Optional short clips around each violation, from a ring buffer of recent frames
+    site_name = Path(config_path).parent.name
+    clips_dir = os.path.join("events", "clips",
+                             f"{site_name}_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    clip_recorder = ClipRecorder(site_config, fps, clips_dir)
+    if not clip_recorder.enabled:
+        clip_recorder = None
     
-    # Event storage
+    # Event storage: kept in memory for the end-of-run log, or streamed to
+    # JSON Lines files as they happen
+    event_file = event_log_path(config_path)
+    event_sink = EventSink(site_config, event_file.with_suffix(''))
+    if not event_sink.enabled:
+        event_sink = None
     violation_events = []
+    num_violations = 0
+    
+    # Optional indexed event database shared by all runs
+    event_store = EventStore.from_config(site_config)
+    if event_store is not None:
+        run_started_at = time.time()
+        run_id = event_store.start_run('video', site_name, video_path, config_path,
+                                       str(event_file.resolve()), run_started_at, fps=fps)
+    
+    # Optional latency histograms, queue depths and track counts on a local
+    # Prometheus endpoint and/or a periodic JSON snapshot
+    metrics = RunMetrics(site_config, site_name, video_path, fps)
     
     # Processing loop
     frame_num = 0
     start_time = time.time()
     
     print("\\nProcessing frames...")
-    print("Press 'q' in the preview window to stop early")
+    if headless:
+        print("Headless mode: events only, no output video")
+    else:
+        print("Press 'q' in the preview window to stop early")
+    
+    # Frames are grouped into batches for the detector; tracking, speed and
+    # rules still see them one at a time in frame order. Only keyframes go
+    # through the detector, other frames carry detections=None.
+    detect_every_n_frames = max(1, detect_every_n_frames)
+    
+    def detect_stage(batch):
+        keyframes = [item for item in batch
+                     if (item['frame_num'] - 1) % detect_every_n_frames == 0]
+        for item in batch:
+            item['detections'] = None
+        detections = processor.detect_batch([item['frame'] for item in keyframes],
+                                            [item['frame_num'] for item in keyframes])
+        for item, frame_detections in zip(keyframes, detections):
+            item['detections'] = frame_detections
+        return batch
+    
+    def analyze_stage(batch):
+        for item in batch:
+            item['result'] = processor.analyze(item['frame_num'], item.pop('detections'))
+        return batch
+    
+    # render() draws on the frame in place, so raw evidence clips need a copy
+    keep_raw_frames = clip_recorder is not None and not clip_recorder.annotate
     
+    def render_stage(batch):
+        for item in batch:
+            if keep_raw_frames:
+                item['raw_frame'] = item['frame'].copy()
+            item['frame'] = processor.render(item['frame'], item['result'])
+        return batch
+    
+    # Size batches so each holds about batch_size keyframes
+    batches = iter_batches(metrics.timed_iter('decode', read_frames(cap)),
+                           detector.batch_size * detect_every_n_frames)
+    
+    stages = [('detect', detect_stage), ('analyze', analyze_stage)]
+    if not headless or (clip_recorder is not None and clip_recorder.annotate):
+        stages.append(('render', render_stage))
+    stages = [(name, metrics.timed(name, stage)) for name, stage in stages]
+    
+    if pipeline:
+        # Decode runs on the pipeline's source thread, encoding on this one
+        staged = StagedPipeline(stages, queue_size=queue_size)
+        outputs = staged.run(batches)
+    else:
+        staged = None
+        
+        def run_stages(batch):
+            for _, stage in stages:
+                batch = stage(batch)
+            return batch
+        
+        outputs = (run_stages(batch) for batch in batches)
+    
+    metrics.watch(processor, staged, [name for name, _ in stages] + ['output'],
+                  detect_every_n_frames)
+    metrics.start()
+    
+    stopped = False
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_num += 1
-            
-            # Progress indicator
-            if frame_num % 30 == 0 or frame_num == 1:
-                elapsed = time.time() - start_time
-                fps_actual = frame_num / elapsed if elapsed > 0 else 0
-                progress = (frame_num / total_frames * 100) if total_frames > 0 else 0
-                print(f"Frame {frame_num}/{total_frames} ({progress:.1f}%) - {fps_actual:.1f} FPS")
-            
-            # 1. Detect vehicles
-            detections = detector.detect(frame)
-            
-            # 2. Track vehicles
-            tracks = tracker.update(detections)
-            
-            # 3. Estimate speed and check violations
-            frame_has_violation = False
-            
-            for track in tracks:
-                track_id = track['track_id']
-                centroid = detector.get_centroid(track['bbox'])
+        for batch in outputs:
+            for item in batch:
+                result = item['result']
+                frame = item['frame']
+                frame_num = result['frame_num']
                 
-                # Estimate speed
-                speed_kph = None
-                if calibrator.is_calibrated():
-                    speed_kph = speed_estimator.update_track(track_id, centroid, frame_num)
+                events = result['events']
+                if clip_recorder is not None:
+                    clip_recorder.add_frame(item.get('raw_frame', frame))
+                    events = [clip_recorder.record_event(event) for event in events]
                 
-                # Check violation
-                is_violation, dwell_count = violation_checker.check_track_violation(
-                    track_id, centroid, track['class_name']
-                )
+                num_violations += len(events)
+                if event_store is not None:
+                    for event in events:
+                        event_store.add_event(run_id, site_name, run_started_at, event)
+                if event_sink is not None:
+                    for event in events:
+                        event_sink.write(event)
+                else:
+                    violation_events.extend(events)
+                metrics.frame_done(frame_num, len(events))
                 
-                if is_violation:
-                    frame_has_violation = True
-                    
-                    # Log violation event (only once when first triggered)
-                    if dwell_count == violation_checker.dwell_frames:
-                        timestamp_ms = (frame_num / fps) * 1000
-                        site_name = Path(config_path).parent.name
-                        
-                        event = {
-                            'event_id': f"{site_name}_{frame_num:08d}_t{track_id}",
-                            'media': video_path,
-                            'timestamp_ms': timestamp_ms,
-                            'frame_num': frame_num,
-                            'track_id': track_id,
-                            'class': track['class_name'],
-                            'violation': 'TRUCK_BUS_LANE',
-                            'dwell_frames': dwell_count,
-                            'speed_kph': speed_kph if speed_kph else 0.0
-                        }
-                        
-                        violation_events.append(event)
-                        print(f"  VIOLATION: Track {track_id} ({track['class_name']}) - {speed_kph:.1f} km/h")
+                # Progress indicator
+                if frame_num % 30 == 0 or frame_num == 1:
+                    elapsed = time.time() - start_time
+                    fps_actual = frame_num / elapsed if elapsed > 0 else 0
+                    progress = (frame_num / total_frames * 100) if total_frames > 0 else 0
+                    live = processor.live_track_state()
+                    print(f"Frame {frame_num}/{total_frames} ({progress:.1f}%) - {fps_actual:.1f} FPS"
+                          f" - live tracks: {live['tracker']} "
+                          f"(speed {live['speed']}, rules {live['rules']})")
                 
-                # 4. Draw overlay
-                frame = overlay_drawer.draw_detection(
-                    frame, track,
-                    track_id=track_id,
-                    speed_kph=speed_kph,
-                    is_violation=is_violation
-                )
-            
-            # Draw lane polygon
-            lane_polygon = violation_checker.get_lane_polygon()
-            frame = overlay_drawer.draw_lane_polygon(frame, lane_polygon, frame_has_violation)
-            
-            # Draw frame info
-            frame = overlay_drawer.draw_frame_info(frame, frame_num, fps)
-            
-            # 5. Write output frame
-            video_writer.write(frame)
+                if headless:
+                    continue
+                
+                # 5. Write output frame
+                with metrics.measure('encode'):
+                    video_writer.write(frame)
+                
+                # 6. Show live preview
+                if not overlay_drawer.show_preview(frame):
+                    print("\\nStopped by user")
+                    stopped = True
+                    break
             
-            # 6. Show live preview
-            if not overlay_drawer.show_preview(frame):
-                print("\\nStopped by user")
+            if stopped:
                 break
     
     finally:
         # Cleanup
+        if staged is not None:
+            outputs.close()
         cap.release()
-        video_writer.release()
+        if video_writer is not None:
+            video_writer.release()
+        if clip_recorder is not None:
+            clip_recorder.close()
+        if event_sink is not None:
+            event_sink.close()
+        if event_store is not None:
+            event_store.finish_run(run_id, frame_num)
+            event_store.close()
+        if processor.detection_cache is not None:
+            processor.detection_cache.save(frames_seen=frame_num)
+        metrics.close()
+        # Only touches the GUI if a preview window was opened
         overlay_drawer.close_preview()
-        cv2.destroyAllWindows()
     
-    # Save violation events
-    if violation_events:
-        events_dir = Path("events/logs")
-        events_dir.mkdir(parents=True, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        site_name = Path(config_path).parent.name
-        event_file = events_dir / f"{site_name}_video_{timestamp}.json"
-        
-        event_data = {
-            'timestamp': datetime.now().isoformat(),
-            'media': video_path,
-            'site_config': config_path,
-            'total_frames': frame_num,
-            'fps': fps,
-            'violations': violation_events
+    # Save violation events (just the manifest of event files when streaming)
+    if num_violations:
+        run_stats = {
+            'detector_frames': processor.frames_detected,
+            'frames_skipped_no_motion': processor.motion_gate.frames_skipped
         }
-        
-        with open(event_file, 'w') as f:
-            json.dump(event_data, f, indent=2)
-        
-        print(f"\\nSaved {len(violation_events)} violation event(s) to: {event_file}")
+        if processor.detection_cache is not None:
+            run_stats['frames_from_cache'] = processor.detection_cache.hits
+        if clip_recorder is not None:
+            run_stats['clips_dir'] = clips_dir
+        if event_sink is not None:
+            run_stats.update(event_sink.manifest())
+            violation_events = None
+        event_file = save_event_log(config_path, video_path, frame_num, fps,
+                                    violation_events, run_stats, event_file)
+        print(f"\\nSaved {num_violations} violation event(s) to: {event_file}")
     
     elapsed = time.time() - start_time
     print(f"\\nProcessing complete!")
     print(f"  Frames processed: {frame_num}")
     print(f"  Time elapsed: {elapsed:.1f}s")
     print(f"  Average FPS: {frame_num/elapsed:.1f}")
-    print(f"  Output video: {output_path}")
-    print(f"  Violations detected: {len(violation_events)}")
+    print(f"  Output video: {output_path if not headless else 'none (headless)'}")
+    print(f"  Violations detected: {num_violations}")
+    if clip_recorder is not None:
+        print(f"  Evidence clips: {clip_recorder.clips_written} in {clips_dir}")
+    print(f"  Detector frames: {processor.frames_detected}")
+    if processor.detection_cache is not None:
+        print(f"  Frames from detection cache: {processor.detection_cache.hits}")
+    if processor.motion_gate.enabled:
+        gate = processor.motion_gate
+        skipped_pct = gate.frames_skipped / gate.frames_checked * 100 if gate.frames_checked else 0
+        print(f"  Frames skipped (no motion): {gate.frames_skipped}/{gate.frames_checked} "
+              f"({skipped_pct:.1f}%)")
+    if staged is not None:
+        busy = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in staged.stage_seconds.items())
+        print(f"  Stage busy time: {busy}")
 
 
 def main():
@@ -209,24 +409,45 @@ def main():
                        help='Path to site config YAML')
     parser.add_argument('--video', required=True,
                        help='Path to input video')
-    parser.add_argument('--output', required=True,
-                       help='Path to save output video')
+    parser.add_argument('--output',
+                       help='Path to save output video (required unless --headless)')
+    parser.add_argument('--headless', action='store_true',
+                       help='Only write the events log: no overlays, preview or '
+                            'output video')
     parser.add_argument('--detector-config', default='configs/detector_yolov8s.yaml',
                        help='Path to detector config')
     parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
                        help='Path to tracker config')
+    parser.add_argument('--pipeline', action='store_true',
+                       help='Run decode, detection, tracking, rendering and encoding '
+                            'concurrently on separate threads')
+    parser.add_argument('--queue-size', type=int, default=8,
+                       help='Batches buffered between pipeline stages, each holding '
+                            'batch_size * detect-every-n-frames frames (default: 8)')
+    parser.add_argument('--detect-every-n-frames', type=int, default=1,
+                       help='Run the detector only on every Nth frame and use '
+                            'motion-predicted boxes in between (default: 1)')
+    parser.add_argument('--detection-cache', nargs='?', const='cache/detections',
+                       help='Reuse detector output from earlier runs on the same video '
+                            'and detector settings (default folder: cache/detections)')
     
     args = parser.parse_args()
+    if not args.output and not args.headless:
+        parser.error('--output is required unless --headless is set')
     
     process_video(
         config_path=args.config,
         video_path=args.video,
         output_path=args.output,
         detector_config=args.detector_config,
-        tracker_config=args.tracker_config
+        tracker_config=args.tracker_config,
+        pipeline=args.pipeline,
+        queue_size=args.queue_size,
+        detect_every_n_frames=args.detect_every_n_frames,
+        headless=args.headless,
+        detection_cache=args.detection_cache
     )
 
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,588 @@
+"""
+Run metrics for long-running deployments.
+Records per-stage latency histograms, queue depths, skipped frames, live
+tracks, event rate and process memory during process_video, and exposes them
+on a local Prometheus endpoint, as a periodic JSON snapshot and through an
+on-demand sampling profiler.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Per-frame stage latency buckets in seconds (upper bounds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """
+    Get the resident set size of this process.
+
+    Reads /proc on Linux; elsewhere falls back to the peak RSS reported by
+    getrusage.
+
+    Returns:
+        Bytes, or None if the platform offers neither
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Histogram:
+    """Thread-safe cumulative histogram in the Prometheus bucket layout."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        """
+        Initialize histogram.
+
+        Args:
+            buckets: Increasing bucket upper bounds
+        """
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, times: int = 1):
+        """
+        Record a value.
+
+        Args:
+            value: Observed value
+            times: Number of observations of this value
+        """
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += times
+            self.count += times
+            self.sum += value * times
+
+    def cumulative(self) -> List[int]:
+        """Get cumulative counts per bucket, ending with the +Inf bucket."""
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        cumulative = []
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile by linear interpolation within its bucket.
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            Estimated value (the last finite bound if it falls in +Inf), or
+            None if nothing was observed
+        """
+        cumulative = self.cumulative()
+        if not cumulative[-1]:
+            return None
+        rank = q * cumulative[-1]
+        lower_count = 0
+        lower_bound = 0.0
+        for bound, count in zip(self.buckets, cumulative):
+            if count >= rank:
+                within = count - lower_count
+                fraction = (rank - lower_count) / within if within else 0.0
+                return lower_bound + (bound - lower_bound) * fraction
+            lower_count, lower_bound = count, bound
+        return self.buckets[-1]
+
+
+class StageProfiler:
+    """Sampling profiler attributing stack samples to processing stages.
+
+    Stages mark the thread they run on while active; each sample reads the
+    stacks of all marked threads, so sequential and pipelined runs are
+    profiled the same way and unmarked threads (queues, HTTP) are ignored.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Initialize profiler.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        # thread id -> stage currently running on it
+        self.active: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mark the calling thread as running a stage."""
+        thread_id = threading.get_ident()
+        self.active[thread_id] = name
+        try:
+            yield
+        finally:
+            self.active.pop(thread_id, None)
+
+    def sample(self, seconds: float) -> Dict[str, Counter]:
+        """
+        Sample the active stages for a while.
+
+        Only one sampling run happens at a time; concurrent requests wait.
+
+        Args:
+            seconds: Sampling duration
+
+        Returns:
+            Per stage, a Counter of collapsed stacks ("file:function;...",
+            outermost frame first) to sample counts
+        """
+        profiles: Dict[str, Counter] = {}
+        with self._lock:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                frames = sys._current_frames()
+                for thread_id, stage in list(self.active.items()):
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    stack = ";".join(f"{Path(entry.filename).name}:{entry.name}"
+                                     for entry in traceback.extract_stack(frame))
+                    profiles.setdefault(stage, Counter())[stack] += 1
+                del frames
+                time.sleep(self.interval)
+        return profiles
+
+
+class RunMetrics:
+    """Metrics of one video run, exported over HTTP and to a snapshot file."""
+
+    def __init__(self, config: dict, site: str, media: str, fps: float):
+        """
+        Initialize run metrics from the site config's 'metrics' block.
+
+        Args:
+            config: Site configuration dictionary
+            site: Site name, used as a label
+            media: Input video path
+            fps: Video frame rate, used to compare progress with real time
+        """
+        metrics_config = config.get('metrics') or {}
+        self.enabled = metrics_config.get('enabled', False)
+        self.host = metrics_config.get('host', '127.0.0.1')
+        self.port = metrics_config.get('port', 9108)
+        self.snapshot_path = metrics_config.get('snapshot_path')
+        self.snapshot_interval = metrics_config.get('snapshot_interval_s', 10.0)
+        self.profiling = metrics_config.get('profiler', False)
+        self.profile_dir = metrics_config.get('profile_dir', 'events/profiles')
+
+        self.site = site
+        self.media = media
+        self.fps = fps
+
+        self.stage_latency: Dict[str, Histogram] = {}
+        self.frames = 0
+        self.events = 0
+        # (wall time, events) of recent frames with events, for the per-minute rate
+        self._recent_events = deque()
+        self._events_lock = threading.Lock()
+        self.start_time: Optional[float] = None
+
+        self.profiler = StageProfiler(metrics_config.get('profile_interval_s', 0.005))
+
+        # Sources read when metrics are collected, set by watch()
+        self._processor = None
+        self._pipeline = None
+        self._queue_names: List[str] = []
+        self._detect_every_n_frames = 1
+
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def watch(self, processor=None, pipeline=None, queue_names: Optional[List[str]] = None,
+              detect_every_n_frames: int = 1):
+        """
+        Set the objects whose state is read when metrics are collected.
+
+        Args:
+            processor: FrameProcessor of the run (tracks, skipped frames)
+            pipeline: StagedPipeline of the run, if pipelined (queue depths)
+            queue_names: Name of each pipeline queue, i.e. of the stage it feeds
+            detect_every_n_frames: Keyframe interval of the run
+        """
+        self._processor = processor
+        self._pipeline = pipeline
+        self._queue_names = queue_names or []
+        self._detect_every_n_frames = max(1, detect_every_n_frames)
+
+    def start(self):
+        """Start the HTTP endpoint and the snapshot writer, as configured."""
+        if not self.enabled:
+            return
+        self.start_time = time.time()
+        self._stop.clear()
+
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+            except OSError as e:
+                # Processing matters more than its metrics; keep going without the endpoint
+                print(f"Warning: metrics endpoint not started on {self.host}:{self.port}: {e}")
+            else:
+                self._server.daemon_threads = True
+                self._threads.append(threading.Thread(target=self._server.serve_forever,
+                                                      name='metrics-http', daemon=True))
+        if self.snapshot_path:
+            self._threads.append(threading.Thread(target=self._snapshot_loop,
+                                                  name='metrics-snapshot', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """Stop the endpoint and write a final snapshot."""
+        if not self.enabled:
+            return
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    def observe(self, stage: str, seconds: float, frames: int = 1):
+        """
+        Record the time a stage spent on a group of frames.
+
+        Args:
+            stage: Stage name
+            seconds: Time spent
+            frames: Frames processed in that time; each is recorded with an
+                    equal share, so histograms are per frame
+        """
+        histogram = self.stage_latency.get(stage)
+        if histogram is None:
+            histogram = self.stage_latency.setdefault(stage, Histogram())
+        histogram.observe(seconds / max(1, frames), max(1, frames))
+
+    @contextmanager
+    def measure(self, stage: str, frames: int = 1):
+        """Time a block as one run of a stage over frames."""
+        if not self.enabled:
+            yield
+            return
+        with self.profiler.stage(stage):
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(stage, time.perf_counter() - start, frames)
+
+    def timed(self, stage: str, func: Callable[[List[Any]], Any]) -> Callable[[List[Any]], Any]:
+        """
+        Wrap a batch stage function so each call is measured.
+
+        Args:
+            stage: Stage name
+            func: Function taking a batch (list of frames)
+
+        Returns:
+            Wrapped function (func itself when metrics are disabled)
+        """
+        if not self.enabled:
+            return func
+
+        def timed_func(batch):
+            with self.measure(stage, len(batch)):
+                return func(batch)
+        return timed_func
+
+    def timed_iter(self, stage: str, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        Measure the time taken to produce each item of an iterable (e.g. decoding).
+
+        Args:
+            stage: Stage name
+            items: Iterable to time
+
+        Yields:
+            The items
+        """
+        if not self.enabled:
+            yield from items
+            return
+        iterator = iter(items)
+        while True:
+            with self.profiler.stage(stage):
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def frame_done(self, frame_num: int, events: int = 0):
+        """
+        Record a frame leaving the pipeline.
+
+        Args:
+            frame_num: 1-based frame number
+            events: Violation events triggered on the frame
+        """
+        if not self.enabled:
+            return
+        self.frames = frame_num
+        if events:
+            self.events += events
+            with self._events_lock:
+                self._recent_events.append((time.time(), events))
+
+    def events_per_minute(self) -> int:
+        """Count events triggered in the last 60 seconds of wall time."""
+        cutoff = time.time() - 60
+        with self._events_lock:
+            while self._recent_events and self._recent_events[0][0] < cutoff:
+                self._recent_events.popleft()
+            return sum(events for _, events in self._recent_events)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Collect all metrics.
+
+        Returns:
+            Dict with run progress, per-stage latency (count, sum, p50/p90/p99
+            estimates and cumulative bucket counts), queue depths, frame
+            counts, live tracks, event counts and process memory
+        """
+        elapsed = time.time() - self.start_time if self.start_time else 0.0
+        media_seconds = self.frames / self.fps if self.fps else 0.0
+
+        stages = {}
+        for stage, histogram in list(self.stage_latency.items()):
+            stages[stage] = {
+                'count': histogram.count,
+                'sum_s': histogram.sum,
+                'p50_s': histogram.quantile(0.5),
+                'p90_s': histogram.quantile(0.9),
+                'p99_s': histogram.quantile(0.99),
+                'buckets': dict(zip([str(bound) for bound in histogram.buckets] + ['+Inf'],
+                                    histogram.cumulative()))
+            }
+
+        keyframes = (self.frames - 1) // self._detect_every_n_frames + 1 if self.frames else 0
+        frames = {
+            'processed': self.frames,
+            'predicted': self.frames - keyframes
+        }
+        live_tracks = {}
+        processor = self._processor
+        if processor is not None:
+            frames['detected'] = processor.frames_detected
+            frames['skipped_no_motion'] = processor.motion_gate.frames_skipped
+            if processor.detection_cache is not None:
+                frames['from_cache'] = processor.detection_cache.hits
+            live_tracks = processor.live_track_state()
+
+        queues = {}
+        if self._pipeline is not None:
+            queues = dict(zip(self._queue_names, self._pipeline.queue_depths()))
+
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'site': self.site,
+            'media': self.media,
+            'elapsed_s': elapsed,
+            'media_s': media_seconds,
+            # Positive when processing is slower than the video plays
+            'realtime_lag_s': elapsed - media_seconds,
+            'realtime_factor': media_seconds / elapsed if elapsed > 0 else 0.0,
+            'processing_fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'stages': stages,
+            'queue_depths': queues,
+            'frames': frames,
+            'live_tracks': live_tracks,
+            'events_total': self.events,
+            'events_per_minute': self.events_per_minute(),
+            'resident_memory_bytes': resident_memory_bytes()
+        }
+
+    def prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            Exposition text
+        """
+        snapshot = self.snapshot()
+        site = _label_value(self.site)
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join([f'site="{site}"'] +
+                                      [f'{key}="{_label_value(val)}"' for key, val in labels])
+                lines.append(f"{name}{suffix}{{{label_text}}} {_number(value)}")
+
+        samples = []
+        for stage, histogram in list(self.stage_latency.items()):
+            bounds = [_number(bound) for bound in histogram.buckets] + ['+Inf']
+            for bound, count in zip(bounds, histogram.cumulative()):
+                samples.append(('_bucket', [('stage', stage), ('le', bound)], count))
+            samples.append(('_sum', [('stage', stage)], histogram.sum))
+            samples.append(('_count', [('stage', stage)], histogram.count))
+        metric('lane_stage_seconds', 'histogram', 'Processing time per frame by stage', samples)
+
+        metric('lane_frames_total', 'counter', ('Frames processed, detected, predicted between keyframes, '
+                'skipped by the motion gate or read from the detection cache'),
+               [('', [('kind', kind)], value) for kind, value in snapshot['frames'].items()])
+        metric('lane_queue_depth', 'gauge', 'Batches waiting in front of each pipeline stage',
+               [('', [('stage', name)], depth) for name, depth in snapshot['queue_depths'].items()])
+        metric('lane_live_tracks', 'gauge', 'Tracks holding state in each component',
+               [('', [('component', name)], count)
+                for name, count in snapshot['live_tracks'].items()])
+        metric('lane_events_total', 'counter', 'Violation events triggered',
+               [('', [], snapshot['events_total'])])
+        metric('lane_events_per_minute', 'gauge', 'Violation events in the last 60 seconds',
+               [('', [], snapshot['events_per_minute'])])
+        metric('lane_realtime_lag_seconds', 'gauge',
+               'Wall time minus video time processed (positive = behind real time)',
+               [('', [], snapshot['realtime_lag_s'])])
+        metric('lane_processing_fps', 'gauge', 'Average frames processed per second',
+               [('', [], snapshot['processing_fps'])])
+        if snapshot['resident_memory_bytes'] is not None:
+            metric('lane_process_resident_memory_bytes', 'gauge', 'Resident memory of the process',
+                   [('', [], snapshot['resident_memory_bytes'])])
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self):
+        """Write the current snapshot to snapshot_path (atomically replaced)."""
+        path = Path(self.snapshot_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def profile(self, seconds: float) -> Dict[str, Any]:
+        """
+        Sample the running stages and dump one profile per stage.
+
+        Profiles are written to profile_dir in collapsed-stack format
+        ("frame;frame;frame count" per line), readable by flamegraph.pl and
+        speedscope.
+
+        Args:
+            seconds: Sampling duration
+
+        Returns:
+            Dict mapping stage to its profile path, sample count and the
+            innermost functions with the most samples
+        """
+        profiles = self.profiler.sample(seconds)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+
+        summary = {}
+        for stage, stacks in profiles.items():
+            path = Path(self.profile_dir) / f"{self.site}_{timestamp}_{stage}.folded"
+            with open(path, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            leaves = Counter()
+            for stack, count in stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            summary[stage] = {
+                'path': str(path),
+                'samples': sum(stacks.values()),
+                'top': leaves.most_common(10)
+            }
+        return summary
+
+    def _snapshot_loop(self):
+        """Write snapshots periodically until closed."""
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Warning: could not write metrics snapshot: {e}")
+
+
+def _label_value(value: Any) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: Any) -> str:
+    """Format a sample value or bucket bound."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _make_handler(metrics: RunMetrics):
+    """Build the HTTP request handler class serving a RunMetrics."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/metrics':
+                self._send(200, metrics.prometheus(), 'text/plain; version=0.0.4')
+            elif url.path == '/snapshot':
+                self._send(200, json.dumps(metrics.snapshot(), indent=2), 'application/json')
+            elif url.path == '/profile' and metrics.profiling:
+                query = parse_qs(url.query)
+                try:
+                    seconds = min(float(query.get('seconds', ['5'])[0]), 300.0)
+                except ValueError:
+                    self._send(400, 'seconds must be a number\n', 'text/plain')
+                    return
+                self._send(200, json.dumps(metrics.profile(seconds), indent=2),
+                           'application/json')
+            else:
+                self._send(404, 'Not found\n', 'text/plain')
+
+        def _send(self, status: int, body: str, content_type: str):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # Scrapes would otherwise flood the console
+            pass
+
+    return MetricsHandler
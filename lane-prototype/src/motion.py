@@ -0,0 +1,125 @@
+"""
+Motion gate for skipping detection on static frames.
+Compares downscaled frames inside the lane region to decide whether anything moved.
+"""
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap motion check run before the detector."""
+
+    def __init__(self, config: dict, lane_polygons: Optional[List[np.ndarray]] = None,
+                 track_buffer: Optional[int] = None, detect_every_n_frames: int = 1):
+        """
+        Initialize motion gate.
+
+        Skipped frames age tracks like frames without detections, so the gap
+        between forced detections must stay within the tracker's track_buffer.
+        When track_buffer is given, max_skip_frames is lowered to fit it.
+
+        Args:
+            config: Site configuration dictionary
+            lane_polygons: Optional lane/zone polygons restricting where motion counts
+            track_buffer: Frames the tracker keeps a lost track
+            detect_every_n_frames: Keyframe interval; the gate only sees keyframes
+        """
+        gate_config = config.get('motion_gate') or {}
+        self.enabled = gate_config.get('enabled', False)
+        self.method = gate_config.get('method', 'diff')  # 'diff' or 'mog2'
+        self.downscale = max(1, int(gate_config.get('downscale', 4)))
+        self.pixel_thresh = gate_config.get('pixel_thresh', 25)
+        self.min_changed_fraction = gate_config.get('min_changed_fraction', 0.002)
+        self.max_skip_frames = gate_config.get('max_skip_frames', 30)
+        if self.enabled and track_buffer is not None:
+            self._fit_track_buffer(track_buffer, max(1, detect_every_n_frames))
+
+        self.lane_polygons = lane_polygons or None
+
+        self._mask = None
+        self._mask_pixels = 0
+        self._prev_gray = None
+        self._skipped_in_row = 0
+        self._subtractor = None
+        if self.method == 'mog2':
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+
+        # Run statistics
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def _fit_track_buffer(self, track_buffer: int, detect_every_n_frames: int):
+        """Clamp max_skip_frames so parked vehicles keep their tracks."""
+        # A track detected on one keyframe is next matched (max_skip_frames + 1)
+        # keyframes later and must not be dropped in between
+        limit = (track_buffer + 1) // detect_every_n_frames - 1
+        if limit < 1:
+            raise ValueError(f"Motion gate cannot skip keyframes every {detect_every_n_frames} "
+                             f"frames with track_buffer {track_buffer}; disable the gate, "
+                             f"detect more often or raise track_buffer")
+        if not self.max_skip_frames or self.max_skip_frames > limit:
+            print(f"Warning: motion_gate.max_skip_frames {self.max_skip_frames} lets tracks "
+                  f"expire (track_buffer {track_buffer}, detecting every "
+                  f"{detect_every_n_frames} frames); using {limit}")
+            self.max_skip_frames = limit
+
+    def has_motion(self, frame: np.ndarray) -> bool:
+        """
+        Check whether a frame should go to the detector.
+
+        Args:
+            frame: Full-resolution frame (BGR)
+
+        Returns:
+            True if motion was found (or the gate is disabled), False if the
+            detector can be skipped for this frame
+        """
+        if not self.enabled:
+            return True
+
+        self.frames_checked += 1
+
+        small = cv2.resize(frame, None, fx=1.0 / self.downscale, fy=1.0 / self.downscale,
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self._mask is None or self._mask.shape != gray.shape:
+            self._build_mask(gray.shape)
+
+        if self._subtractor is not None:
+            changed = self._subtractor.apply(gray) > 0
+        elif self._prev_gray is None:
+            changed = np.ones(gray.shape, dtype=bool)
+        else:
+            changed = cv2.absdiff(gray, self._prev_gray) > self.pixel_thresh
+        self._prev_gray = gray
+
+        changed_fraction = np.count_nonzero(changed & self._mask) / self._mask_pixels
+        moving = changed_fraction >= self.min_changed_fraction
+
+        # Still detect now and then so parked vehicles keep their tracks
+        if not moving and self.max_skip_frames and self._skipped_in_row >= self.max_skip_frames:
+            moving = True
+
+        if moving:
+            self._skipped_in_row = 0
+        else:
+            self._skipped_in_row += 1
+            self.frames_skipped += 1
+        return moving
+
+    def _build_mask(self, shape):
+        """Rasterize the lane polygons at the downscaled resolution."""
+        if self.lane_polygons is None:
+            self._mask = np.ones(shape, dtype=bool)
+        else:
+            mask = np.zeros(shape, dtype=np.uint8)
+            polygons = [np.round(np.asarray(polygon, dtype=np.float64)
+                                 / self.downscale).astype(np.int32)
+                        for polygon in self.lane_polygons]
+            cv2.fillPoly(mask, polygons, 1)
+            self._mask = mask.astype(bool)
+        self._mask_pixels = max(1, int(np.count_nonzero(self._mask)))
@@ -0,0 +1,346 @@
+"""
+Multi-stream processing with one shared detector.
+Watches several site cameras at once; each stream keeps its own tracker, speed
+estimator, rules and site config while frames are batched across streams.
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+import yaml
+
+from src.detect import VehicleDetector
+from src.processor import FrameProcessor, detect_frames
+from src.main import event_log_path, save_event_log
+
+
+def stream_name(stream_config: dict) -> str:
+    """Get a stream's name: its 'name', or else the folder of its site config."""
+    return stream_config.get('name') or os.path.basename(os.path.dirname(stream_config['config']))
+
+
+class VideoStream:
+    """One camera or recording with its own per-stream state."""
+
+    def __init__(self, stream_config: dict, detector: VehicleDetector,
+                 tracker_config: str, queue_size: int = 4):
+        """
+        Initialize stream.
+
+        Args:
+            stream_config: Dict with 'video', 'config' and optional 'name',
+                           'output' and 'latency_budget_ms'
+            detector: Detector shared by all streams
+            tracker_config: Path to tracker config
+            queue_size: Decoded frames buffered ahead of the scheduler
+        """
+        self.video_path = str(stream_config['video'])
+        self.config_path = stream_config['config']
+        self.output_path = stream_config.get('output')
+        self.latency_budget_ms = stream_config.get('latency_budget_ms')
+
+        with open(self.config_path, 'r') as f:
+            site_config = yaml.safe_load(f)
+        self.name = stream_name(stream_config)
+
+        # Numeric sources are camera indices
+        source = int(self.video_path) if self.video_path.isdigit() else self.video_path
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video: {self.video_path}")
+
+        self.fps = site_config.get('fps_override') or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        self.processor = FrameProcessor(site_config, self.config_path, self.video_path,
+                                        self.fps, detector, tracker_config,
+                                        frame_size=self.frame_size)
+
+        self.video_writer = None
+        if self.output_path:
+            os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+            self.video_writer = self.processor.overlay_drawer.create_video_writer(
+                self.output_path, self.fps, self.frame_size
+            )
+
+        # Decoded frames waiting for the scheduler: (frame_num, frame, decode time)
+        self.frames: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.finished = False
+        self._reader = threading.Thread(target=self._read, name=f'reader-{self.name}',
+                                         daemon=True)
+        self._stop = threading.Event()
+
+        # Statistics
+        self.events: List[Dict[str, Any]] = []
+        self.frames_processed = 0
+        self.frames_over_budget = 0
+        self.latency_sum_ms = 0.0
+        self.latency_max_ms = 0.0
+
+    def start(self):
+        """Start decoding in the background."""
+        self._reader.start()
+
+    def stop(self):
+        """Stop decoding and release resources."""
+        self._stop.set()
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+        self._reader.join()
+        self.cap.release()
+        if self.video_writer is not None:
+            self.video_writer.release()
+
+    def _read(self):
+        """Decode frames into the stream queue."""
+        frame_num = 0
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            frame_num += 1
+            item = (frame_num, frame, time.perf_counter())
+            while not self._stop.is_set():
+                try:
+                    self.frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+        self._put_end()
+
+    def _put_end(self):
+        """Signal end of stream to the scheduler."""
+        while not self._stop.is_set():
+            try:
+                self.frames.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def over_budget(self, decoded_at: float) -> bool:
+        """Check whether a frame has waited longer than the stream's latency budget."""
+        if not self.latency_budget_ms:
+            return False
+        return (time.perf_counter() - decoded_at) * 1000 > self.latency_budget_ms
+
+    def finish(self, frame_num: int, frame: np.ndarray, result: Dict[str, Any],
+               decoded_at: float):
+        """Record results for a processed frame and write the output video."""
+        self.events.extend(result['events'])
+        if self.video_writer is not None:
+            frame = self.processor.render(frame, result)
+            self.video_writer.write(frame)
+
+        latency_ms = (time.perf_counter() - decoded_at) * 1000
+        self.frames_processed = frame_num
+        self.latency_sum_ms += latency_ms
+        self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+
+
+class MultiStreamScheduler:
+    """Round-robin scheduler feeding one shared detector from many streams."""
+
+    def __init__(self, streams: List[VideoStream], detector: VehicleDetector,
+                 batch_size: Optional[int] = None):
+        """
+        Initialize scheduler.
+
+        Args:
+            streams: Streams to process
+            detector: Detector shared by the streams
+            batch_size: Frames per detector call (defaults to the detector's batch_size)
+        """
+        self.streams = streams
+        self.detector = detector
+        self.batch_size = batch_size or detector.batch_size
+        self._next_stream = 0
+
+    def run(self):
+        """Process all streams until every one of them has ended."""
+        for stream in self.streams:
+            stream.start()
+
+        start_time = time.time()
+        last_report = start_time
+        try:
+            while not all(stream.finished for stream in self.streams):
+                batch = self._next_batch()
+                if not batch:
+                    time.sleep(0.001)
+                    continue
+                self._process_batch(batch)
+
+                if time.time() - last_report >= 5:
+                    last_report = time.time()
+                    self._report_progress(last_report - start_time)
+        finally:
+            for stream in self.streams:
+                stream.stop()
+
+    def _next_batch(self) -> List[tuple]:
+        """
+        Collect up to batch_size frames, taking one frame per stream per round.
+
+        The starting stream rotates between batches, so every stream gets
+        an equal share of detector capacity regardless of its frame rate or
+        list position.
+
+        Returns:
+            List of (stream, frame_num, frame, decoded_at) in scheduling order
+        """
+        batch = []
+        active = [s for s in self.streams if not s.finished]
+        if not active:
+            return batch
+
+        start = self._next_stream % len(active)
+        order = active[start:] + active[:start]
+        self._next_stream += 1
+
+        while len(batch) < self.batch_size:
+            took_any = False
+            for stream in order:
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = stream.frames.get_nowait()
+                except queue.Empty:
+                    continue
+                if item is None:
+                    stream.finished = True
+                    continue
+                batch.append((stream,) + item)
+                took_any = True
+            if not took_any:
+                break
+        return batch
+
+    def _process_batch(self, batch: List[tuple]):
+        """Detect a cross-stream batch, then analyze each frame in its stream's order."""
+        # Frames that already exceeded their stream's latency budget skip the
+        # detector; their tracks are motion-predicted instead
+        requests = []
+        request_index = {}
+        for i, (stream, frame_num, frame, decoded_at) in enumerate(batch):
+            if stream.over_budget(decoded_at):
+                stream.frames_over_budget += 1
+                continue
+            request_index[i] = len(requests)
+            requests.append((stream.processor, frame))
+
+        detections = detect_frames(self.detector, requests) if requests else []
+
+        for i, (stream, frame_num, frame, decoded_at) in enumerate(batch):
+            frame_detections = detections[request_index[i]] if i in request_index else None
+            result = stream.processor.analyze(frame_num, frame_detections)
+            stream.finish(frame_num, frame, result, decoded_at)
+
+    def _report_progress(self, elapsed: float):
+        """Print per-stream progress."""
+        print(f"[{elapsed:.0f}s]")
+        for stream in self.streams:
+            live = stream.processor.live_track_state()
+            print(f"  {stream.name}: frame {stream.frames_processed}, "
+                  f"{len(stream.events)} violation(s), "
+                  f"{stream.frames_over_budget} over budget, "
+                  f"{live['tracker']} live track(s)")
+
+
+def process_streams(streams_config: str,
+                    detector_config: str = "configs/detector_yolov8s.yaml",
+                    tracker_config: str = "configs/tracker_bytetrack.yaml",
+                    queue_size: int = 4):
+    """
+    Process several video streams with one shared detector.
+
+    Args:
+        streams_config: Path to YAML file with a 'streams' list
+        detector_config: Path to detector config
+        tracker_config: Path to tracker config
+        queue_size: Decoded frames buffered per stream
+    """
+    with open(streams_config, 'r') as f:
+        stream_configs = yaml.safe_load(f)['streams']
+
+    # Each stream's events log is named after the stream
+    names = [stream_name(config) for config in stream_configs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Stream names must be unique, set 'name' for: {', '.join(duplicates)}")
+
+    print(f"Loading shared detector for {len(stream_configs)} stream(s)...")
+    detector = VehicleDetector(detector_config)
+    streams = [VideoStream(config, detector, tracker_config, queue_size)
+               for config in stream_configs]
+    for stream in streams:
+        budget = f"{stream.latency_budget_ms} ms" if stream.latency_budget_ms else "none"
+        print(f"  {stream.name}: {stream.video_path} "
+              f"({stream.frame_size[0]}x{stream.frame_size[1]} @ {stream.fps:.2f} FPS, "
+              f"latency budget: {budget})")
+
+    start_time = time.time()
+    MultiStreamScheduler(streams, detector).run()
+    elapsed = time.time() - start_time
+
+    print(f"\nProcessing complete in {elapsed:.1f}s")
+    for stream in streams:
+        if stream.events:
+            event_file = save_event_log(
+                stream.config_path, stream.video_path, stream.frames_processed,
+                stream.fps, stream.events, {
+                    'stream': stream.name,
+                    'detector_frames': stream.processor.frames_detected,
+                    'frames_over_budget': stream.frames_over_budget
+                },
+                event_log_path(stream.config_path, stream.name)
+            )
+        else:
+            event_file = None
+
+        mean_latency = stream.latency_sum_ms / stream.frames_processed if stream.frames_processed else 0
+        print(f"  {stream.name}:")
+        print(f"    Frames processed: {stream.frames_processed}")
+        print(f"    Detector frames: {stream.processor.frames_detected}")
+        print(f"    Frames over latency budget: {stream.frames_over_budget}")
+        print(f"    Latency: mean {mean_latency:.1f} ms, max {stream.latency_max_ms:.1f} ms")
+        print(f"    Violations detected: {len(stream.events)}")
+        if event_file:
+            print(f"    Events: {event_file}")
+
+
+def main():
+    """Main entry point for multi-stream processing."""
+    parser = argparse.ArgumentParser(
+        description='Process several site cameras with one shared detector'
+    )
+    parser.add_argument('--streams', required=True,
+                       help='Path to YAML file listing streams (video, config, '
+                            'optional name, output and latency_budget_ms)')
+    parser.add_argument('--detector-config', default='configs/detector_yolov8s.yaml',
+                       help='Path to detector config')
+    parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
+                       help='Path to tracker config')
+    parser.add_argument('--queue-size', type=int, default=4,
+                       help='Decoded frames buffered per stream (default: 4)')
+
+    args = parser.parse_args()
+
+    process_streams(
+        streams_config=args.streams,
+        detector_config=args.detector_config,
+        tracker_config=args.tracker_config,
+        queue_size=args.queue_size
+    )
+
+
+if __name__ == '__main__':
+    main()
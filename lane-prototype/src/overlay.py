@@ -6,6 +6,8 @@ import cv2
 import numpy as np
 from typing import Dict, List, Tuple, Optional, Any
 
+from src.detections import Detections
+
 
 class OverlayDrawer:
     """Handles all visualization and overlay drawing."""
@@ -39,6 +41,9 @@ class OverlayDrawer:
         
         self.window_name = 'Lane Violation Detection'
         self.window_created = False
+        
+        # Rasterized lane layers per (polygon, violation state, label, frame size)
+        self._lane_layers: Dict[tuple, Dict[str, Any]] = {}
     
     def draw_detection(self, frame: np.ndarray, detection: Dict[str, Any],
                       track_id: Optional[int] = None,
@@ -57,10 +62,42 @@ class OverlayDrawer:
         Returns:
             Frame with overlay drawn
         """
-        bbox = detection['bbox']
-        class_name = detection['class_name']
-        score = detection['score']
+        return self._draw_box(frame, detection['bbox'], detection['class_name'],
+                              track_id, speed_kph, is_violation)
+    
+    def draw_detections(self, frame: np.ndarray, detections: Detections,
+                        speeds: Optional[np.ndarray] = None,
+                        violations: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Draw all detections/tracks of a frame.
         
+        Args:
+            frame: Input frame
+            detections: Detections or tracks (track IDs drawn when assigned)
+            speeds: Optional (N,) speeds in km/h, NaN where unknown
+            violations: Optional (N,) violation flags
+            
+        Returns:
+            Frame with overlay drawn
+        """
+        for i, (bbox, class_name, track_id) in enumerate(zip(
+                detections.boxes.tolist(), detections.class_names,
+                detections.track_ids.tolist())):
+            speed_kph = None
+            if speeds is not None and not np.isnan(speeds[i]):
+                speed_kph = float(speeds[i])
+            frame = self._draw_box(
+                frame, bbox, class_name,
+                track_id=track_id if track_id >= 0 else None,
+                speed_kph=speed_kph,
+                is_violation=bool(violations[i]) if violations is not None else False
+            )
+        return frame
+    
+    def _draw_box(self, frame: np.ndarray, bbox: List[float], class_name: str,
+                  track_id: Optional[int], speed_kph: Optional[float],
+                  is_violation: bool) -> np.ndarray:
+        """Draw one bounding box with its label."""
         x1, y1, x2, y2 = map(int, bbox)
         
         # Choose color
@@ -108,14 +145,16 @@ class OverlayDrawer:
         return frame
     
     def draw_lane_polygon(self, frame: np.ndarray, lane_polygon: Optional[np.ndarray],
-                         has_violation: bool = False) -> np.ndarray:
+                         has_violation: bool = False,
+                         label: str = "TRUCK/BUS LANE") -> np.ndarray:
         """
-        Draw the truck/bus lane polygon.
+        Draw the truck/bus lane (or another zone's) polygon.
         
         Args:
             frame: Input frame
             lane_polygon: Polygon points as numpy array [[x1,y1], [x2,y2], ...]
             has_violation: Whether there's currently a violation
+            label: Zone label drawn at the bottom of the polygon
             
         Returns:
             Frame with lane polygon drawn
@@ -123,44 +162,113 @@ class OverlayDrawer:
         if not self.draw_lane_rect or lane_polygon is None:
             return frame
         
+        # The lane never moves: its fill, outline and label are rasterized once
+        # per violation state, and only the polygon's bounding box is blended
+        key = (lane_polygon.tobytes(), lane_polygon.dtype.str, has_violation, label,
+               frame.shape[:2])
+        layer = self._lane_layers.get(key)
+        if layer is None:
+            layer = self._build_lane_layer(lane_polygon, has_violation, label, frame.shape[:2])
+            self._lane_layers[key] = layer
+        
+        x1, y1, x2, y2 = layer['fill_box']
+        if x2 > x1 and y2 > y1:
+            # Semi-transparent fill; the outline stays at full color
+            roi = frame[y1:y2, x1:x2]
+            blended = cv2.addWeighted(layer['fill'], 0.1, roi, 0.9, 0)
+            cv2.copyTo(blended, layer['fill_mask'], roi)
+            roi[layer['outline']] = layer['color']
+        
+        # Label with background at bottom
+        x1, y1, x2, y2 = layer['label_box']
+        if x2 > x1 and y2 > y1:
+            cv2.copyTo(layer['label'], layer['label_mask'], frame[y1:y2, x1:x2])
+        
+        return frame
+    
+    def _build_lane_layer(self, lane_polygon: np.ndarray, has_violation: bool, label: str,
+                          frame_shape: Tuple[int, int]) -> Dict[str, Any]:
+        """
+        Rasterize a lane's fill, outline and label for one violation state.
+        
+        Args:
+            lane_polygon: Polygon points [[x1,y1], [x2,y2], ...]
+            has_violation: Whether there's currently a violation
+            label: Zone label drawn at the bottom of the polygon
+            frame_shape: (height, width) of the frames drawn on
+        
+        Returns:
+            Dict with 'color', the clipped 'fill_box' (x1, y1, x2, y2) with
+            its solid 'fill' patch, 'fill_mask' and 'outline' pixel indices,
+            and the clipped 'label_box' with its 'label' sprite and 'label_mask'
+        """
+        height, width = frame_shape
+        lane_polygon = np.asarray(lane_polygon, dtype=np.int32)
+        
         # Choose color based on violation status
         color = self.LANE_COLOR_VIOLATION if has_violation else self.LANE_COLOR_NORMAL
         thickness = 1
-
-        # Draw polygon outline
-        cv2.polylines(frame, [lane_polygon], isClosed=True, color=color, thickness=thickness)
         
-        # Fill with semi-transparent overlay
-        overlay = frame.copy()
-        cv2.fillPoly(overlay, [lane_polygon], color)
-        cv2.addWeighted(overlay, 0.1, frame, 0.9, 0, frame)
+        # Fill and outline masks over the polygon's bounding box, clipped to the frame
+        x1 = max(int(lane_polygon[:, 0].min()), 0)
+        y1 = max(int(lane_polygon[:, 1].min()), 0)
+        x2 = min(int(lane_polygon[:, 0].max()) + 1, width)
+        y2 = min(int(lane_polygon[:, 1].max()) + 1, height)
+        box_w, box_h = max(x2 - x1, 0), max(y2 - y1, 0)
+        fill_mask = np.zeros((box_h, box_w), dtype=np.uint8)
+        outline_mask = np.zeros((box_h, box_w), dtype=np.uint8)
+        if box_w and box_h:
+            shifted = lane_polygon - np.array([x1, y1], dtype=np.int32)
+            cv2.fillPoly(fill_mask, [shifted], 255)
+            cv2.polylines(outline_mask, [shifted], isClosed=True, color=255, thickness=thickness)
         
         # Add label at bottom of polygon
         centroid_x = int(np.mean(lane_polygon[:, 0]))
         # Find the maximum Y coordinate (bottom-most point)
         bottom_y = int(np.max(lane_polygon[:, 1]))
-
-        label = "TRUCK/BUS LANE"
+        
         if has_violation:
             label += " - VIOLATION!"
-
+        
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.6
         font_thickness = 1
-
-        # Draw label with background at bottom
+        
         (label_w, label_h), baseline = cv2.getTextSize(label, font, font_scale, font_thickness)
         label_x = centroid_x - label_w // 2
         label_y = bottom_y - 10  # Position slightly above the bottom edge
-
-        cv2.rectangle(frame,
-                     (label_x - 5, label_y - label_h - 5),
-                     (label_x + label_w + 5, label_y + 5),
-                     (0, 0, 0), -1)
-        cv2.putText(frame, label, (label_x, label_y),
-                   font, font_scale, color, font_thickness)
         
-        return frame
+        # Sprite of the background box, with room for glyphs reaching past it
+        margin = label_h + baseline
+        origin_x = label_x - 5 - margin
+        origin_y = label_y - label_h - 5 - margin
+        sprite = np.zeros((label_h + 11 + 2 * margin, label_w + 11 + 2 * margin, 3), dtype=np.uint8)
+        sprite_mask = np.zeros(sprite.shape[:2], dtype=np.uint8)
+        for canvas, box_color, text_color in ((sprite, (0, 0, 0), color),
+                                              (sprite_mask, 255, 255)):
+            cv2.rectangle(canvas,
+                         (label_x - 5 - origin_x, label_y - label_h - 5 - origin_y),
+                         (label_x + label_w + 5 - origin_x, label_y + 5 - origin_y),
+                         box_color, -1)
+            cv2.putText(canvas, label, (label_x - origin_x, label_y - origin_y),
+                       font, font_scale, text_color, font_thickness)
+        
+        lx1, ly1 = max(origin_x, 0), max(origin_y, 0)
+        lx2 = min(origin_x + sprite.shape[1], width)
+        ly2 = min(origin_y + sprite.shape[0], height)
+        label_crop = (slice(ly1 - origin_y, max(ly2, ly1) - origin_y),
+                      slice(lx1 - origin_x, max(lx2, lx1) - origin_x))
+        
+        return {
+            'color': color,
+            'fill_box': (x1, y1, x1 + box_w, y1 + box_h),
+            'fill': np.full((box_h, box_w, 3), color, dtype=np.uint8),
+            'fill_mask': fill_mask,
+            'outline': np.nonzero(outline_mask),
+            'label_box': (lx1, ly1, max(lx2, lx1), max(ly2, ly1)),
+            'label': np.ascontiguousarray(sprite[label_crop]),
+            'label_mask': np.ascontiguousarray(sprite_mask[label_crop])
+        }
     
     def draw_lane_rectangle(self, frame: np.ndarray, lane_rect: Tuple[int, int, int, int],
                            has_violation: bool = False) -> np.ndarray:
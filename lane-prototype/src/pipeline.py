@@ -0,0 +1,154 @@
+"""
+Staged pipeline runner for video processing.
+Runs decode, inference, analysis, rendering and encoding concurrently on
+worker threads connected by bounded queues.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class StagedPipeline:
+    """Chain of stage functions executed on dedicated threads.
+
+    Each stage runs on a single thread and consumes its input queue in FIFO
+    order, so items leave the pipeline in the same order they entered it.
+    Queues are bounded, so a slow stage applies backpressure upstream instead
+    of letting frames pile up in memory.
+    """
+
+    _END = object()
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any]]],
+                 queue_size: int = 8):
+        """
+        Initialize pipeline.
+
+        Args:
+            stages: List of (name, function) pairs, applied in order
+            queue_size: Maximum number of items buffered between two stages
+        """
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+        # Busy time per stage in seconds (excludes time blocked on queues)
+        self.stage_seconds: Dict[str, float] = {name: 0.0 for name, _ in stages}
+        self.queues: List[queue.Queue] = []
+
+    def run(self, source: Iterable[Any]) -> Iterator[Any]:
+        """
+        Run the pipeline over a source of items.
+
+        The source is iterated on its own thread (e.g. video decoding) and
+        the outputs of the last stage are yielded on the calling thread.
+
+        Args:
+            source: Iterable producing input items
+
+        Yields:
+            Items returned by the last stage, in source order
+        """
+        self._stop.clear()
+        self._error = None
+        self.queues = [queue.Queue(maxsize=self.queue_size)
+                       for _ in range(len(self.stages) + 1)]
+
+        threads = [threading.Thread(target=self._feed, args=(source, self.queues[0]),
+                                    name='pipeline-source', daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._work,
+                args=(name, func, self.queues[i], self.queues[i + 1]),
+                name=f'pipeline-{name}', daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+
+        output = self.queues[-1]
+        try:
+            while True:
+                item = self._get(output)
+                if item is self._END:
+                    break
+                yield item
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Ask all stages to finish and unblock any thread waiting on a queue."""
+        self._stop.set()
+        for q in self.queues:
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+
+    def queue_depths(self) -> List[int]:
+        """Get the current number of items waiting in each queue."""
+        return [q.qsize() for q in self.queues]
+
+    def _feed(self, source: Iterable[Any], out_queue: queue.Queue):
+        """Push source items into the first queue."""
+        try:
+            for item in source:
+                if not self._put(out_queue, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(out_queue, self._END)
+
+    def _work(self, name: str, func: Callable[[Any], Any],
+              in_queue: queue.Queue, out_queue: queue.Queue):
+        """Apply a stage function to every item of its input queue."""
+        while True:
+            item = self._get(in_queue)
+            if item is self._END:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except BaseException as e:
+                self._fail(e)
+                break
+            self.stage_seconds[name] += time.perf_counter() - start
+
+            if not self._put(out_queue, result):
+                return
+        self._put(out_queue, self._END)
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Put with backpressure; returns False if the pipeline was stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Get the next item, or the end marker if the pipeline was stopped."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._END
+
+    def _fail(self, error: BaseException):
+        """Record the first stage error and stop the pipeline."""
+        if self._error is None:
+            self._error = error
+        self._stop.set()
@@ -7,18 +7,21 @@ import json
 import os
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 import cv2
+import numpy as np
 import yaml
 
 from src.detect import VehicleDetector
-from src.rules import LaneViolationChecker
-from src.overlay import OverlayDrawer
+from src.processor import FrameProcessor
+from src.event_store import EventStore
+from src.detection_cache import DetectionCache
 
 
 def process_image(config_path: str, image_path: str, output_path: str,
                  detector_config: str = "configs/detector_yolov8s.yaml",
-                 save_events: bool = True):
+                 save_events: bool = True, detection_cache: Optional[str] = None):
     """
     Process a single image for lane violations.
     
@@ -28,6 +31,7 @@ def process_image(config_path: str, image_path: str, output_path: str,
         output_path: Path to save annotated output image
         detector_config: Path to detector config
         save_events: Whether to save violation events to JSON
+        detection_cache: Folder of the detection cache (None to disable)
     """
     print(f"Processing image: {image_path}")
     
@@ -37,8 +41,12 @@ def process_image(config_path: str, image_path: str, output_path: str,
     
     # Initialize modules
     detector = VehicleDetector(detector_config)
-    violation_checker = LaneViolationChecker(site_config)
-    overlay_drawer = OverlayDrawer(site_config)
+    # Same rules, overlay and inference region as video mode; a single image
+    # is never tracked, so the tracker keeps its default settings
+    processor = FrameProcessor(site_config, config_path, image_path, 30.0, detector, {},
+                               verbose=False)
+    violation_checker = processor.violation_checker
+    overlay_drawer = processor.overlay_drawer
     
     # Read image
     frame = cv2.imread(image_path)
@@ -49,39 +57,47 @@ def process_image(config_path: str, image_path: str, output_path: str,
     
     # Detect vehicles
     print("Detecting vehicles...")
-    detections = detector.detect(frame)
+    roi = processor.inference_roi(frame.shape)
+    cache = None
+    if detection_cache:
+        cache = DetectionCache(image_path, detector, roi, detection_cache,
+                               frame_size=(frame.shape[1], frame.shape[0]))
+    detections = cache.get(1) if cache is not None else None
+    if detections is None:
+        detections = detector.detect(frame, roi=roi)
+        if cache is not None:
+            cache.put(1, detections)
+            cache.save()
+    else:
+        print("Using cached detections")
     print(f"Found {len(detections)} vehicle(s)")
     
     # Check for violations and draw overlays
+    zones = violation_checker.get_zones()
+    zone_flags = violation_checker.instant_violation_zones(detections)
+    violation_flags = zone_flags.any(axis=1)
+    
     violations = []
-    frame_has_violation = False
+    for i in np.flatnonzero(violation_flags):
+        class_name = detections.class_names[i]
+        centroid = tuple(detections.centroids[i].tolist())
+        violations.append({
+            'detection_id': int(i),
+            'class': class_name,
+            'bbox': detections.boxes[i].tolist(),
+            'centroid': centroid,
+            'score': float(detections.scores[i]),
+            'zone': zones[int(np.argmax(zone_flags[i]))].name
+        })
+        print(f"  VIOLATION: {class_name} at {centroid}")
     
-    for i, det in enumerate(detections):
-        centroid = detector.get_centroid(det['bbox'])
-        is_violation = violation_checker.check_instant_violation(centroid, det['class_name'])
-        
-        if is_violation:
-            frame_has_violation = True
-            violations.append({
-                'detection_id': i,
-                'class': det['class_name'],
-                'bbox': det['bbox'],
-                'centroid': centroid,
-                'score': det['score']
-            })
-            print(f"  VIOLATION: {det['class_name']} at {centroid}")
-        
-        # Draw detection
-        frame = overlay_drawer.draw_detection(
-            frame, det,
-            track_id=None,
-            speed_kph=None,
-            is_violation=is_violation
-        )
+    # Draw detections
+    frame = overlay_drawer.draw_detections(frame, detections, violations=violation_flags)
     
-    # Draw lane polygon
-    lane_polygon = violation_checker.get_lane_polygon()
-    frame = overlay_drawer.draw_lane_polygon(frame, lane_polygon, frame_has_violation)
+    # Draw zone polygons
+    for zone, zone_violation in zip(zones, zone_flags.any(axis=0)):
+        frame = overlay_drawer.draw_lane_polygon(frame, zone.polygon, zone_violation,
+                                                 label=zone.label)
     
     # Save output image
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -93,7 +109,8 @@ def process_image(config_path: str, image_path: str, output_path: str,
         events_dir = Path("events/logs")
         events_dir.mkdir(parents=True, exist_ok=True)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        run_started_at = datetime.now()
+        timestamp = run_started_at.strftime("%Y%m%d_%H%M%S")
         site_name = Path(config_path).parent.name
         event_file = events_dir / f"{site_name}_image_{timestamp}.json"
         
@@ -110,7 +127,7 @@ def process_image(config_path: str, image_path: str, output_path: str,
                 'event_id': f"{site_name}_image_det{v['detection_id']}",
                 'detection_id': v['detection_id'],
                 'class': v['class'],
-                'violation': 'TRUCK_BUS_LANE',
+                'violation': v['zone'],
                 'bbox': v['bbox'],
                 'centroid': v['centroid'],
                 'score': v['score']
@@ -119,6 +136,16 @@ def process_image(config_path: str, image_path: str, output_path: str,
         with open(event_file, 'w') as f:
             json.dump(event_data, f, indent=2)
         
+        # Also add them to the event database if one is configured
+        event_store = EventStore.from_config(site_config)
+        if event_store is not None:
+            run_id = event_store.start_run('image', site_name, image_path, config_path,
+                                           str(event_file.resolve()),
+                                           run_started_at.timestamp())
+            for event in event_data['violations']:
+                event_store.add_event(run_id, site_name, run_started_at.timestamp(), event)
+            event_store.close()
+        
         print(f"Saved {len(violations)} violation event(s) to: {event_file}")
     
     print(f"\\nSummary:")
@@ -141,6 +168,9 @@ def main():
                        help='Path to detector config')
     parser.add_argument('--no-events', action='store_true',
                        help='Do not save violation events to JSON')
+    parser.add_argument('--detection-cache', nargs='?', const='cache/detections',
+                       help='Reuse detector output from earlier runs on the same image '
+                            'and detector settings (default folder: cache/detections)')
     
     args = parser.parse_args()
     
@@ -149,7 +179,8 @@ def main():
         image_path=args.image,
         output_path=args.output,
         detector_config=args.detector_config,
-        save_events=not args.no_events
+        save_events=not args.no_events,
+        detection_cache=args.detection_cache
     )
 
 
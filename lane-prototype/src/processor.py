@@ -0,0 +1,287 @@
+"""
+Per-frame processing stages for lane violation detection.
+Splits the video loop into detect, analyze and render steps so they can run
+one after another or concurrently in a staged pipeline.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.detect import VehicleDetector
+from src.detections import Detections, Tracks
+from src.track import VehicleTracker
+from src.calibrate import CameraCalibrator
+from src.speed import SpeedEstimator
+from src.rules import LaneViolationChecker
+from src.overlay import OverlayDrawer
+from src.motion import MotionGate
+from src.detection_cache import DetectionCache
+
+
+class FrameProcessor:
+    """Holds the per-stream tracking, speed, rule and overlay state."""
+
+    def __init__(self, site_config: dict, config_path: str, media: str, fps: float,
+                 detector: VehicleDetector, tracker_config: Union[str, Dict[str, Any]],
+                 verbose: bool = True, frame_size: Optional[Tuple[int, int]] = None,
+                 detect_every_n_frames: int = 1):
+        """
+        Initialize frame processor.
+
+        Args:
+            site_config: Site configuration dictionary
+            config_path: Path to site config YAML (site name is its folder)
+            media: Path to the input media, recorded in events
+            fps: Video frame rate
+            detector: Vehicle detector (may be shared between streams)
+            tracker_config: Path to tracker config, or the config as a dict
+            verbose: Print violations as they are triggered
+            frame_size: (width, height) of the frames, used to load the
+                        world lookup table when one is configured
+            detect_every_n_frames: Keyframe interval, used to keep the motion
+                                   gate's forced detections within track_buffer
+        """
+        self.site_config = site_config
+        self.config_path = config_path
+        self.site_name = Path(config_path).parent.name
+        self.media = media
+        self.fps = fps
+        self.verbose = verbose
+
+        self.detector = detector
+        self.tracker = VehicleTracker(tracker_config, fps=fps)
+        self.calibrator = CameraCalibrator(site_config)
+        if frame_size is not None:
+            self.calibrator.load_world_lut(frame_size)
+        self.speed_estimator = SpeedEstimator(self.calibrator, site_config, fps)
+        self.violation_checker = LaneViolationChecker(site_config)
+        self.overlay_drawer = OverlayDrawer(site_config)
+        
+        # Release per-track speed and dwell state when the tracker drops a track
+        self.tracker.add_track_ended_listener(self.speed_estimator.reset_track)
+        self.tracker.add_track_ended_listener(self.violation_checker.reset_track)
+
+        # Optional inference on the lane's bounding box only
+        roi_config = site_config.get('roi_inference') or {}
+        self.roi_enabled = roi_config.get('enabled', False)
+        self.roi_margin = roi_config.get('margin', 32)
+        self._roi = None
+        self._roi_frame_shape = None
+
+        # Optional motion gate that skips the detector on static frames
+        self.motion_gate = MotionGate(site_config, self.violation_checker.get_zone_polygons(),
+                                      self.tracker.track_buffer, detect_every_n_frames)
+
+        # Optional cache of detector output for this stream's media, set by the caller
+        self.detection_cache: Optional[DetectionCache] = None
+
+        # Number of frames actually sent to the detector
+        self.frames_detected = 0
+
+    def detect(self, frame: np.ndarray) -> Detections:
+        """
+        Detect vehicles in a frame.
+
+        Args:
+            frame: Input frame (BGR)
+
+        Returns:
+            Detections
+        """
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames: List[np.ndarray],
+                     frame_nums: Optional[List[int]] = None) -> List[Detections]:
+        """
+        Detect vehicles in several frames with one model call.
+
+        Frames rejected by the motion gate are not sent to the detector and
+        get empty detections, so the tracker ages its tracks as usual.
+
+        Args:
+            frames: Input frames (BGR), in frame order
+            frame_nums: 1-based frame numbers, needed to use the detection cache
+
+        Returns:
+            One Detections per frame
+        """
+        return detect_frames(self.detector, [(self, frame) for frame in frames], frame_nums)
+
+    def live_track_state(self) -> Dict[str, int]:
+        """
+        Count tracks currently holding state in each per-track component.
+        
+        Returns:
+            Dict with 'tracker', 'speed' and 'rules' track counts
+        """
+        return {
+            'tracker': len(self.tracker),
+            'speed': len(self.speed_estimator),
+            'rules': len(self.violation_checker)
+        }
+    
+    def inference_roi(self, frame_shape) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Get the region the detector should run on for this stream.
+
+        Args:
+            frame_shape: Shape of the frames being processed
+
+        Returns:
+            (x1, y1, x2, y2) around all zone polygons plus margin, or None
+            for the full frame (ROI inference disabled or no lane configured)
+        """
+        if not self.roi_enabled:
+            return None
+        if frame_shape != self._roi_frame_shape:
+            polygons = self.violation_checker.get_zone_polygons()
+            self._roi = VehicleDetector.roi_for_polygon(
+                np.concatenate(polygons) if polygons else None, frame_shape, self.roi_margin
+            )
+            self._roi_frame_shape = frame_shape
+        return self._roi
+
+    def analyze(self, frame_num: int, detections: Optional[Detections]) -> Dict[str, Any]:
+        """
+        Track detections, estimate speeds and check violations for one frame.
+
+        Must be called in frame order, since tracker, speed and rule state
+        carry over between frames.
+
+        Args:
+            frame_num: 1-based frame number
+            detections: Detections for this frame, or None if the detector
+                        was not run (tracks are then motion-predicted)
+
+        Returns:
+            Dict with 'frame_num', 'tracks', per-track 'speeds' (km/h, NaN
+            where unknown) and 'violations' arrays, per-zone 'zone_violations',
+            'has_violation' and newly triggered 'events'
+        """
+        if detections is None:
+            tracks = self.tracker.predict()
+        else:
+            tracks = self.tracker.update(detections)
+
+        # Estimate speed
+        if self.calibrator.is_calibrated():
+            speeds = self.speed_estimator.update_tracks(tracks, frame_num)
+        else:
+            speeds = np.full(len(tracks), np.nan)
+
+        # Check violation, per track and zone
+        zone_violations, dwell_counts = self.violation_checker.check_tracks(tracks)
+
+        # Log violation events (only once when first triggered)
+        events = []
+        triggered = dwell_counts == self.violation_checker.dwell_thresholds
+        for i, zone_index in zip(*np.nonzero(triggered)):
+            event = self._make_event(frame_num, tracks, i, zone_index,
+                                     int(dwell_counts[i, zone_index]), speeds[i])
+            events.append(event)
+            if self.verbose:
+                print(f"  VIOLATION: Track {event['track_id']} ({event['class']}) - "
+                      f"{event['speed_kph']:.1f} km/h")
+
+        return {
+            'frame_num': frame_num,
+            'tracks': tracks,
+            'speeds': speeds,
+            'violations': zone_violations.any(axis=1),
+            'zone_violations': zone_violations.any(axis=0),
+            'has_violation': bool(zone_violations.any()),
+            'events': events
+        }
+
+    def render(self, frame: np.ndarray, result: Dict[str, Any]) -> np.ndarray:
+        """
+        Draw tracks, lane polygon and frame info for an analyzed frame.
+
+        Args:
+            frame: Frame to draw on (modified in place)
+            result: Output of analyze() for this frame
+
+        Returns:
+            Annotated frame
+        """
+        frame = self.overlay_drawer.draw_detections(
+            frame, result['tracks'], result['speeds'], result['violations']
+        )
+
+        # Draw zone polygons
+        for zone, zone_violation in zip(self.violation_checker.get_zones(),
+                                        result['zone_violations']):
+            frame = self.overlay_drawer.draw_lane_polygon(frame, zone.polygon, zone_violation,
+                                                          label=zone.label)
+
+        # Draw frame info
+        frame = self.overlay_drawer.draw_frame_info(frame, result['frame_num'], self.fps)
+
+        return frame
+
+    def _make_event(self, frame_num: int, tracks: Tracks, index: int, zone_index: int,
+                    dwell_count: int, speed_kph: float) -> Dict[str, Any]:
+        """Build a violation event record for one track and zone."""
+        track_id = int(tracks.track_ids[index])
+        zones = self.violation_checker.get_zones()
+        event_id = f"{self.site_name}_{frame_num:08d}_t{track_id}"
+        if len(zones) > 1:
+            event_id += f"_{zones[zone_index].name}"
+        return {
+            'event_id': event_id,
+            'media': self.media,
+            'timestamp_ms': (frame_num / self.fps) * 1000,
+            'frame_num': frame_num,
+            'track_id': track_id,
+            'class': tracks.class_names[index],
+            'violation': zones[zone_index].name,
+            'dwell_frames': dwell_count,
+            'speed_kph': float(speed_kph) if speed_kph and not np.isnan(speed_kph) else 0.0
+        }
+
+
+def detect_frames(detector: VehicleDetector,
+                  requests: List[Tuple[FrameProcessor, np.ndarray]],
+                  frame_nums: Optional[List[int]] = None) -> List[Detections]:
+    """
+    Run one detector call over frames that may belong to different streams.
+
+    Each frame goes through its own stream's motion gate and inference
+    region. Frames rejected by the gate get empty detections and are not
+    sent to the detector. Frames found in their stream's detection cache
+    are not sent either; the rest are added to it.
+
+    Args:
+        detector: Detector shared by the streams
+        requests: (processor, frame) pairs
+        frame_nums: Optional 1-based frame number per request (for the cache)
+
+    Returns:
+        One Detections per request, in request order
+    """
+    detections = [Detections.empty() for _ in requests]
+    moving = [i for i, (processor, frame) in enumerate(requests)
+              if processor.motion_gate.has_motion(frame)]
+
+    to_detect = []
+    for i in moving:
+        cache = requests[i][0].detection_cache
+        if cache is not None and frame_nums is not None:
+            cached = cache.get(frame_nums[i])
+            if cached is not None:
+                detections[i] = cached
+                continue
+        to_detect.append(i)
+    if not to_detect:
+        return detections
+
+    frames = [requests[i][1] for i in to_detect]
+    rois = [requests[i][0].inference_roi(requests[i][1].shape) for i in to_detect]
+    for i, frame_detections in zip(to_detect, detector.detect_batch(frames, rois=rois)):
+        detections[i] = frame_detections
+        processor = requests[i][0]
+        processor.frames_detected += 1
+        if processor.detection_cache is not None and frame_nums is not None:
+            processor.detection_cache.put(frame_nums[i], frame_detections)
+    return detections
@@ -0,0 +1,175 @@
+"""
+Replay of cached detections.
+Reruns tracking, speed estimation and the violation rules over detections
+recorded in the detection cache, without decoding video or running the
+detector, e.g. to check a config change against days of footage.
+"""
+import argparse
+import time
+from typing import Any, Dict, Optional, Union
+
+import yaml
+
+from src.detections import Detections
+from src.detection_cache import DEFAULT_CACHE_DIR, DetectionCache
+from src.processor import FrameProcessor
+from src.main import save_event_log
+
+
+def replay_detections(cache: DetectionCache, site_config: dict, config_path: str,
+                      tracker_config: Union[str, Dict[str, Any]], media: Optional[str] = None,
+                      fps: Optional[float] = None, detect_every_n_frames: int = 1,
+                      verbose: bool = False) -> Dict[str, Any]:
+    """
+    Run tracker, speed and rules over the cached detections of a video.
+
+    Frames are fed exactly as process_video feeds them: keyframes (every
+    detect_every_n_frames-th frame) get their cached detections and the
+    frames in between are motion-predicted, so with the same settings the
+    events are identical to those of the run that filled the cache. A
+    keyframe missing from the cache is treated as a frame the motion gate
+    skipped (no detections).
+
+    Args:
+        cache: Cache entry of the video
+        site_config: Site configuration dictionary
+        config_path: Path to site config YAML (site name is its folder)
+        tracker_config: Path to tracker config, or the config as a dict
+        media: Media path recorded in events (defaults to the cached one)
+        fps: Video frame rate (defaults to the cached one)
+        detect_every_n_frames: Keyframe interval of the run to reproduce
+        verbose: Print violations as they are triggered
+
+    Returns:
+        Dict with 'events', 'frames', 'fps', 'missing_keyframes' and 'seconds'
+    """
+    fps = fps or cache.fps
+    if not fps:
+        raise ValueError(f"Frame rate unknown for {cache.path}; pass fps")
+    fps = site_config.get('fps_override') or fps
+
+    # The frame size loads the same world lookup table the live run used
+    frame_size = tuple(cache.frame_size) if cache.frame_size else None
+    processor = FrameProcessor(site_config, config_path, media or cache.media_path, fps,
+                               None, tracker_config, verbose=verbose, frame_size=frame_size)
+
+    offsets, detected, rows = cache.get_all()
+    num_cached = len(detected)
+    total_frames = cache.video_frames
+    detect_every_n_frames = max(1, detect_every_n_frames)
+
+    events = []
+    missing_keyframes = 0
+    start_time = time.perf_counter()
+    for frame_num in range(1, total_frames + 1):
+        index = frame_num - 1
+        if index % detect_every_n_frames != 0:
+            detections = None
+        elif index < num_cached and detected[index]:
+            data = rows[offsets[index]:offsets[index + 1]]
+            detections = Detections(data[:, :4], data[:, 4], data[:, 5])
+        else:
+            detections = Detections.empty()
+            missing_keyframes += 1
+
+        result = processor.analyze(frame_num, detections)
+        events.extend(result['events'])
+
+    return {
+        'events': events,
+        'frames': total_frames,
+        'fps': fps,
+        'missing_keyframes': missing_keyframes,
+        'seconds': time.perf_counter() - start_time
+    }
+
+
+def open_cache(video_path: Optional[str], cache_path: Optional[str],
+               cache_dir: str = DEFAULT_CACHE_DIR) -> DetectionCache:
+    """
+    Open a cache entry by folder, or the only entry of a video.
+
+    Args:
+        video_path: Video whose entry to use (when cache_path is not given)
+        cache_path: Entry folder
+        cache_dir: Root folder of the cache
+
+    Returns:
+        DetectionCache
+    """
+    if cache_path:
+        return DetectionCache.from_path(cache_path)
+
+    entries = DetectionCache.find(video_path, cache_dir)
+    if not entries:
+        raise ValueError(f"No cached detections for {video_path} in {cache_dir}")
+    if len(entries) > 1:
+        listing = "\n".join(f"  {entry}" for entry in entries)
+        raise ValueError(f"Several detector configurations cached for {video_path}; "
+                         f"choose one with --cache:\n{listing}")
+    return DetectionCache.from_path(entries[0])
+
+
+def main():
+    """Main entry point for replaying cached detections."""
+    parser = argparse.ArgumentParser(
+        description='Rerun tracking, speed and violation rules over cached detections'
+    )
+    parser.add_argument('--config', required=True,
+                       help='Path to site config YAML')
+    parser.add_argument('--video',
+                       help='Video whose cached detections to replay (not decoded)')
+    parser.add_argument('--cache',
+                       help='Cache entry folder (instead of --video)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'Root folder of the detection cache (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
+                       help='Path to tracker config')
+    parser.add_argument('--detect-every-n-frames', type=int, default=1,
+                       help='Keyframe interval of the run to reproduce (default: 1)')
+    parser.add_argument('--no-events', action='store_true',
+                       help='Do not save the events log')
+
+    args = parser.parse_args()
+    if not args.video and not args.cache:
+        parser.error('--video or --cache is required')
+
+    with open(args.config, 'r') as f:
+        site_config = yaml.safe_load(f)
+
+    cache = open_cache(args.video, args.cache, args.cache_dir)
+    print(f"Replaying {cache.path} ({cache.media_path}, {cache.video_frames} frames)")
+
+    # Boxes only match a live run if the detector saw the same region
+    if cache.frame_size:
+        width, height = cache.frame_size
+        roi = FrameProcessor(site_config, args.config, cache.media_path, cache.fps or 30.0,
+                             None, args.tracker_config).inference_roi((height, width, 3))
+        cached_roi = cache.signature.get('roi')
+        if (list(roi) if roi is not None else None) != cached_roi:
+            print(f"Warning: cached detections used inference region {cached_roi}, "
+                  f"this site config gives {roi}")
+
+    result = replay_detections(cache, site_config, args.config, args.tracker_config,
+                               media=args.video, detect_every_n_frames=args.detect_every_n_frames)
+
+    frames_per_second = result['frames'] / result['seconds'] if result['seconds'] > 0 else 0
+    print(f"\nReplay complete in {result['seconds']:.2f}s ({frames_per_second:.0f} frames/s)")
+    print(f"  Frames replayed: {result['frames']}")
+    print(f"  Violations detected: {len(result['events'])}")
+    if result['missing_keyframes']:
+        print(f"  Keyframes not in cache (replayed as empty): {result['missing_keyframes']}")
+
+    if result['events'] and not args.no_events:
+        event_file = save_event_log(
+            args.config, args.video or cache.media_path, result['frames'], result['fps'],
+            result['events'], {
+                'detector_frames': 0,
+                'replayed_from': str(cache.path)
+            }
+        )
+        print(f"  Events: {event_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,48 @@
 """
 Lane violation detection rules.
-Checks if non-truck/bus vehicles enter designated truck/bus lanes.
-Supports both polygon and rectangle lane definitions.
+Checks if vehicles enter zones they are not allowed in, such as non-truck/bus
+vehicles in designated truck/bus lanes.
+Supports a list of named zones, or a single polygon or rectangle lane definition.
 """
 import cv2
 import numpy as np
 from typing import Dict, List, Tuple, Optional
 
+from src.detections import Detections, Tracks
+
+
+class LaneZone:
+    """A named zone with its own allowed classes and dwell threshold."""
+    
+    def __init__(self, name: str, polygon: np.ndarray, classes_allowed,
+                 dwell_frames: int, label: Optional[str] = None,
+                 overlap_threshold: float = 0.5):
+        """
+        Initialize zone.
+        
+        Args:
+            name: Zone name, reported as the event's violation type
+            polygon: Polygon points [[x1,y1], [x2,y2], ...]
+            classes_allowed: Vehicle classes allowed in the zone
+            dwell_frames: Consecutive frames inside before a violation triggers
+            label: Text drawn on the overlay (defaults to the name)
+            overlap_threshold: Fraction of a box footprint that must be inside
+                               (footprint containment only)
+        """
+        self.name = name
+        self.polygon = np.array(polygon, dtype=np.int32)
+        self.classes_allowed = set(classes_allowed)
+        self.dwell_frames = dwell_frames
+        self.label = label or name.replace('_', ' ')
+        self.overlap_threshold = overlap_threshold
+
 
 class LaneViolationChecker:
     """Checks for lane violations based on vehicle position and class."""
     
+    # Zones are stored as bits of one label raster
+    MAX_ZONES = 64
+    
     def __init__(self, config: dict):
         """
         Initialize violation checker.
@@ -40,40 +72,244 @@ class LaneViolationChecker:
             x, y, w, h = self.lane_rect
             self.lane_polygon = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.int32)
         
-        # Violation rules
+        # Violation rules (also the defaults for zones that don't set their own)
         violation_config = config.get('violation', {})
         self.dwell_frames = violation_config.get('dwell_frames', 10)
         self.classes_truck_ok = set(violation_config.get('classes_truck_ok', ['truck', 'bus']))
         
-        # Track dwell counters for video mode
-        self.track_dwell_counters: Dict[int, int] = {}
-        self.track_violations: Dict[int, bool] = {}
+        # How a vehicle counts as inside a zone: its bbox centroid, or the
+        # share of its bbox's bottom strip (where it touches the road)
+        self.containment = violation_config.get('containment', 'centroid')
+        if self.containment not in ('centroid', 'footprint'):
+            raise ValueError(f"Unknown containment mode: {self.containment}")
+        self.overlap_threshold = violation_config.get('overlap_threshold', 0.5)
+        self.footprint_height = violation_config.get('footprint_height', 0.25)
+        
+        self.zones = self._load_zones(config)
+        if len(self.zones) > self.MAX_ZONES:
+            raise ValueError(f"At most {self.MAX_ZONES} zones are supported, got {len(self.zones)}")
+        if self.lane_polygon is None and self.zones:
+            self.lane_polygon = self.zones[0].polygon
+        self.dwell_thresholds = np.array([zone.dwell_frames for zone in self.zones],
+                                         dtype=np.int64)
+        self.overlap_thresholds = np.array([zone.overlap_threshold for zone in self.zones],
+                                           dtype=np.float64)
+        
+        # Label raster: bit z of a pixel is set if the pixel is inside zone z
+        self._zone_mask = None
+        self._zone_edges = None
+        self._zone_mask_origin = (0, 0)
+        self._zone_bits = None
+        
+        # Per-zone summed-area tables over the zone's bounding box, as
+        # (x0, y0, table), for footprint containment
+        self._zone_tables: List[Tuple[int, int, np.ndarray]] = []
+        if self.zones:
+            self._build_zone_mask()
+        
+        # Per class, which zones the class may be in
+        self._allowed_rows: Dict[str, np.ndarray] = {}
+        
+        # Track dwell counters for video mode, one entry per zone
+        self.track_dwell_counters: Dict[int, np.ndarray] = {}
+        self.track_violations: Dict[int, np.ndarray] = {}
+    
+    def _load_zones(self, config: dict) -> List[LaneZone]:
+        """Read the zone list, or wrap the single lane definition as one zone."""
+        zone_configs = config.get('zones') or []
+        if not zone_configs:
+            if self.lane_polygon is None:
+                return []
+            return [LaneZone('TRUCK_BUS_LANE', self.lane_polygon, self.classes_truck_ok,
+                             self.dwell_frames, label='TRUCK/BUS LANE',
+                             overlap_threshold=self.overlap_threshold)]
+        
+        return [
+            LaneZone(
+                zone_config.get('name', f'ZONE_{i + 1}'),
+                zone_config['polygon'],
+                zone_config.get('classes_allowed', self.classes_truck_ok),
+                zone_config.get('dwell_frames', self.dwell_frames),
+                label=zone_config.get('label'),
+                overlap_threshold=zone_config.get('overlap_threshold', self.overlap_threshold)
+            )
+            for i, zone_config in enumerate(zone_configs)
+        ]
     
     def point_in_lane(self, px: float, py: float) -> bool:
         """
-        Check if a point is inside the lane polygon.
+        Check if a point is inside the lane polygon (or any zone).
         
         Args:
             px: Point x coordinate
             py: Point y coordinate
-            
+        
         Returns:
             True if point is inside lane polygon
         """
-        if self.lane_polygon is None:
-            return False
-        
+        return any(self._point_in_zone(z, px, py) for z in range(len(self.zones)))
+    
+    def _point_in_zone(self, zone_index: int, px: float, py: float) -> bool:
+        """Check if a point is inside one zone's polygon."""
         # Use OpenCV's pointPolygonTest for accurate polygon containment
         # Returns positive if inside, negative if outside, 0 if on edge
-        result = cv2.pointPolygonTest(self.lane_polygon, (float(px), float(py)), False)
+        result = cv2.pointPolygonTest(self.zones[zone_index].polygon,
+                                      (float(px), float(py)), False)
         return result >= 0
     
+    def zones_at(self, points: np.ndarray) -> np.ndarray:
+        """
+        Find the zones each of many points is inside.
+        
+        Looks every point up in the zone label raster at once, so the cost
+        barely depends on the number of zones. Points that fall in the thin
+        band around a zone's edges are resolved with pointPolygonTest, so
+        results match point_in_lane() exactly (edges count as inside).
+        
+        Args:
+            points: (N, 2) array of (x, y) coordinates
+        
+        Returns:
+            (N, Z) boolean array, True where point n is inside zone z
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        in_zone = np.zeros((len(points), len(self.zones)), dtype=bool)
+        if self._zone_mask is None or len(points) == 0:
+            return in_zone
+        
+        # Pixel cell each point falls in, relative to the raster origin
+        cols = np.floor(points[:, 0]).astype(np.int64) - self._zone_mask_origin[0]
+        rows = np.floor(points[:, 1]).astype(np.int64) - self._zone_mask_origin[1]
+        height, width = self._zone_mask.shape
+        valid = np.flatnonzero((cols >= 0) & (cols < width) & (rows >= 0) & (rows < height))
+        
+        inside_bits = self._zone_mask[rows[valid], cols[valid]]
+        edge_bits = self._zone_edges[rows[valid], cols[valid]]
+        in_zone[valid] = (inside_bits[:, None] & self._zone_bits) != 0
+        
+        undecided = (edge_bits[:, None] & self._zone_bits) != 0
+        for i, z in zip(*np.nonzero(undecided)):
+            point = points[valid[i]]
+            in_zone[valid[i], z] = self._point_in_zone(z, point[0], point[1])
+        return in_zone
+    
+    def footprint_overlap(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Get the fraction of each box's footprint inside each zone.
+        
+        The footprint is the bottom footprint_height of the box, snapped
+        outwards to whole pixels. Its inside area comes from four lookups
+        in the zone's summed-area table, so the cost per box is constant
+        whatever the box and zone sizes.
+        
+        Args:
+            boxes: (N, 4) boxes as [x1, y1, x2, y2]
+        
+        Returns:
+            (N, Z) fractions in [0, 1]
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        overlap = np.zeros((len(boxes), len(self.zones)))
+        if len(boxes) == 0 or not self.zones:
+            return overlap
+        
+        if not self._zone_tables:
+            self._build_zone_tables()
+        
+        top = boxes[:, 3] - (boxes[:, 3] - boxes[:, 1]) * self.footprint_height
+        c0 = np.floor(boxes[:, 0]).astype(np.int64)
+        c1 = np.maximum(np.ceil(boxes[:, 2]).astype(np.int64), c0 + 1)
+        r0 = np.floor(top).astype(np.int64)
+        r1 = np.maximum(np.ceil(boxes[:, 3]).astype(np.int64), r0 + 1)
+        area = (c1 - c0) * (r1 - r0)
+        
+        for z, (x0, y0, table) in enumerate(self._zone_tables):
+            height, width = table.shape[0] - 1, table.shape[1] - 1
+            left = np.clip(c0 - x0, 0, width)
+            right = np.clip(c1 - x0, 0, width)
+            upper = np.clip(r0 - y0, 0, height)
+            lower = np.clip(r1 - y0, 0, height)
+            inside = (table[lower, right] - table[upper, right]
+                      - table[lower, left] + table[upper, left])
+            overlap[:, z] = inside / area
+        return overlap
+    
+    def _build_zone_tables(self):
+        """Build a summed-area table of each zone's mask over its bounding box."""
+        for zone in self.zones:
+            polygon = zone.polygon.reshape(-1, 2)
+            x0, y0 = polygon.min(axis=0)
+            x1, y1 = polygon.max(axis=0) + 1
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, [(polygon - [x0, y0]).astype(np.int32)], 1)
+            self._zone_tables.append((int(x0), int(y0), cv2.integral(mask)))
+    
+    def _zones_for(self, detections: Detections) -> np.ndarray:
+        """(N, Z) boolean array of the zones each detection counts as inside."""
+        if self.containment == 'footprint':
+            return self.footprint_overlap(detections.boxes) >= self.overlap_thresholds
+        return self.zones_at(detections.centroids)
+    
+    def points_in_lane(self, points: np.ndarray) -> np.ndarray:
+        """
+        Check which of many points are inside the lane polygon (or any zone).
+        
+        Args:
+            points: (N, 2) array of (x, y) coordinates
+        
+        Returns:
+            (N,) boolean array, True where the point is inside the lane
+        """
+        return self.zones_at(points).any(axis=1)
+    
+    def _build_zone_mask(self):
+        """Rasterize all zones into bitmask rasters, plus a band along their edges."""
+        # Any point in a pixel cell whose corner lies more than 2.5 px from
+        # every edge of a zone is on the same side of it as that corner
+        margin = 4
+        all_points = np.concatenate([zone.polygon.reshape(-1, 2) for zone in self.zones])
+        x0, y0 = all_points.min(axis=0) - margin
+        x1, y1 = all_points.max(axis=0) + margin + 1
+        shape = (y1 - y0, x1 - x0)
+        
+        dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64)
+                     if np.iinfo(t).bits >= len(self.zones))
+        self._zone_mask = np.zeros(shape, dtype=dtype)
+        self._zone_edges = np.zeros(shape, dtype=dtype)
+        self._zone_bits = np.left_shift(dtype(1), np.arange(len(self.zones), dtype=dtype))
+        
+        zone_raster = np.zeros(shape, dtype=np.uint8)
+        for bit, zone in zip(self._zone_bits, self.zones):
+            local = (zone.polygon.reshape(-1, 2) - [x0, y0]).astype(np.int32)
+            zone_raster[:] = 0
+            cv2.fillPoly(zone_raster, [local], 1)
+            self._zone_mask[zone_raster > 0] |= bit
+            zone_raster[:] = 0
+            cv2.polylines(zone_raster, [local], True, 1, thickness=5)
+            self._zone_edges[zone_raster > 0] |= bit
+        
+        self._zone_mask_origin = (int(x0), int(y0))
+    
     # Keep old method name for backward compatibility
     def point_in_rect(self, px: float, py: float) -> bool:
         """Deprecated: Use point_in_lane() instead."""
         return self.point_in_lane(px, py)
     
-    def check_instant_violation(self, centroid: Tuple[float, float], 
+    def _allowed(self, class_names: List[str]) -> np.ndarray:
+        """(N, Z) boolean array, True where the class may be in the zone."""
+        rows = []
+        for class_name in class_names:
+            row = self._allowed_rows.get(class_name)
+            if row is None:
+                row = np.array([class_name in zone.classes_allowed for zone in self.zones],
+                               dtype=bool)
+                self._allowed_rows[class_name] = row
+            rows.append(row)
+        if not rows:
+            return np.zeros((0, len(self.zones)), dtype=bool)
+        return np.stack(rows)
+    
+    def check_instant_violation(self, centroid: Tuple[float, float],
                                 class_name: str) -> bool:
         """
         Check for instant violation (for image mode).
@@ -81,18 +317,36 @@ class LaneViolationChecker:
         Args:
             centroid: (cx, cy) vehicle centroid
             class_name: Vehicle class name
-            
+        
         Returns:
             True if violation detected
         """
-        cx, cy = centroid
+        offending = self.zones_at([centroid]) & ~self._allowed([class_name])
+        return bool(offending.any())
+    
+    def instant_violation_zones(self, detections: Detections) -> np.ndarray:
+        """
+        Check all detections of an image for instant violations, per zone.
         
-        # Check if vehicle is in lane and not allowed
-        if self.point_in_lane(cx, cy):
-            if class_name not in self.classes_truck_ok:
-                return True
+        Args:
+            detections: Detections for the image
         
-        return False
+        Returns:
+            (N, Z) boolean array, True where detection n violates zone z
+        """
+        return self._zones_for(detections) & ~self._allowed(detections.class_names)
+    
+    def check_instant_violations(self, detections: Detections) -> np.ndarray:
+        """
+        Check all detections of an image for instant violations.
+        
+        Args:
+            detections: Detections for the image
+        
+        Returns:
+            (N,) boolean array, True where a violation is detected
+        """
+        return self.instant_violation_zones(detections).any(axis=1)
     
     def check_track_violation(self, track_id: int, centroid: Tuple[float, float],
                              class_name: str) -> Tuple[bool, int]:
@@ -103,36 +357,56 @@ class LaneViolationChecker:
             track_id: Unique track identifier
             centroid: (cx, cy) vehicle centroid
             class_name: Vehicle class name
-            
+        
         Returns:
-            (is_violation, dwell_count) tuple
-        """
-        cx, cy = centroid
-        
-        # Initialize counters if new track
-        if track_id not in self.track_dwell_counters:
-            self.track_dwell_counters[track_id] = 0
-            self.track_violations[track_id] = False
-        
-        # Check if vehicle is in lane and not allowed
-        in_lane = self.point_in_lane(cx, cy)
-        is_allowed = class_name in self.classes_truck_ok
-        
-        if in_lane and not is_allowed:
-            # Increment dwell counter
-            self.track_dwell_counters[track_id] += 1
-            
-            # Check if violation threshold reached
-            if self.track_dwell_counters[track_id] >= self.dwell_frames:
-                if not self.track_violations[track_id]:
-                    # First time violation triggered
-                    self.track_violations[track_id] = True
-                return True, self.track_dwell_counters[track_id]
-        else:
-            # Reset counter if vehicle leaves lane
-            self.track_dwell_counters[track_id] = 0
-        
-        return self.track_violations[track_id], self.track_dwell_counters[track_id]
+            (is_violation, dwell_count) tuple, over all zones
+        """
+        is_violation, dwell_counts = self._update_dwell(
+            [track_id], self.zones_at([centroid]), [class_name]
+        )
+        return bool(is_violation.any()), int(dwell_counts.max(initial=0))
+    
+    def check_tracks(self, tracks: Tracks) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Check all tracks of a frame for violations with dwell time.
+        
+        Args:
+            tracks: Tracks for the current frame
+        
+        Returns:
+            (is_violation, dwell_count) arrays of shape (N, Z), per track and
+            zone. A zone's violation triggers on the frame its dwell count
+            reaches that zone's dwell_frames.
+        """
+        return self._update_dwell(tracks.track_ids.tolist(), self._zones_for(tracks),
+                                  tracks.class_names)
+    
+    def _update_dwell(self, track_ids: List[int], in_zone: np.ndarray,
+                      class_names: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Advance the tracks' per-zone dwell counters given which zones they are in."""
+        num_zones = len(self.zones)
+        no_counts = np.zeros(num_zones, dtype=np.int64)
+        no_violations = np.zeros(num_zones, dtype=bool)
+        
+        counts = np.array([self.track_dwell_counters.get(t, no_counts) for t in track_ids],
+                          dtype=np.int64).reshape(-1, num_zones)
+        violations = np.array([self.track_violations.get(t, no_violations) for t in track_ids],
+                              dtype=bool).reshape(-1, num_zones)
+        
+        # Count frames inside zones the vehicle is not allowed in; reset the
+        # counter when it leaves. Once triggered, a zone's violation sticks.
+        offending = in_zone & ~self._allowed(class_names)
+        counts = np.where(offending, counts + 1, 0)
+        violations |= offending & (counts >= self.dwell_thresholds)
+        
+        for i, track_id in enumerate(track_ids):
+            self.track_dwell_counters[track_id] = counts[i]
+            self.track_violations[track_id] = violations[i]
+        return violations, counts
+    
+    def __len__(self) -> int:
+        """Number of tracks holding dwell state."""
+        return len(self.track_dwell_counters)
     
     def reset_track(self, track_id: int):
         """Reset tracking data for a specific track."""
@@ -141,11 +415,18 @@ class LaneViolationChecker:
         if track_id in self.track_violations:
             del self.track_violations[track_id]
     
+    def get_zones(self) -> List[LaneZone]:
+        """Get all zones."""
+        return self.zones
+    
+    def get_zone_polygons(self) -> List[np.ndarray]:
+        """Get the polygon points of all zones."""
+        return [zone.polygon for zone in self.zones]
+    
     def get_lane_polygon(self) -> Optional[np.ndarray]:
-        """Get lane polygon points."""
+        """Get lane polygon points (the first zone's if only zones are configured)."""
         return self.lane_polygon
     
     def get_lane_rect(self) -> Optional[Tuple[int, int, int, int]]:
         """Get lane rectangle coordinates (for backward compatibility)."""
         return self.lane_rect
-
@@ -0,0 +1,411 @@
+"""
+Time-sharded processing of long recordings.
+Splits a video into segments processed in parallel worker processes, then
+stitches track IDs across segment boundaries so events match a sequential run.
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import yaml
+
+from src.detect import VehicleDetector
+from src.processor import FrameProcessor
+from src.main import read_frames, iter_batches, save_event_log
+from src.rules import LaneViolationChecker
+from src.track import assign, iou_matrix
+
+
+def default_overlap(site_config: dict, tracker_config: str, fps: float) -> int:
+    """
+    Pick an overlap window long enough for per-track state to converge.
+
+    Each segment is warmed up on the frames before it. The warm-up has to
+    cover the tracker's lost-track buffer (so tracks lost just before the
+    boundary are still known), the violation dwell time, and enough speed
+    updates for the EMA to forget its zero start.
+
+    Args:
+        site_config: Site configuration dictionary
+        tracker_config: Path to tracker config
+        fps: Video frame rate
+
+    Returns:
+        Overlap in frames
+    """
+    with open(tracker_config, 'r') as f:
+        track_buffer = (yaml.safe_load(f) or {}).get('track_buffer', 30)
+    dwell_frames = int(LaneViolationChecker(site_config).dwell_thresholds.max(initial=0))
+    speed_history = max(int(fps), 10)
+    return int(max(track_buffer, dwell_frames) + 3 * speed_history)
+
+
+def plan_segments(total_frames: int, num_segments: int,
+                  overlap: int) -> List[Tuple[int, int]]:
+    """
+    Split frames 1..total_frames into contiguous segments.
+
+    Segments are never shorter than the overlap window, so a segment's
+    warm-up only reaches back into the segment right before it.
+
+    Args:
+        total_frames: Number of frames in the video
+        num_segments: Desired number of segments
+        overlap: Warm-up frames processed before each segment
+
+    Returns:
+        List of (first_frame, last_frame), 1-based and inclusive
+    """
+    num_segments = max(1, min(num_segments, total_frames // max(overlap, 1)))
+    bounds = np.linspace(0, total_frames, num_segments + 1).round().astype(int)
+    return [(int(bounds[i]) + 1, int(bounds[i + 1])) for i in range(num_segments)]
+
+
+def _tracker_state(tracker, frame_offset: int) -> Dict[str, Any]:
+    """
+    Copy the tracker's stored tracks, including lost ones.
+
+    Args:
+        tracker: VehicleTracker of a segment
+        frame_offset: Video frame number of the tracker's frame 0
+
+    Returns:
+        Dict with 'track_ids', 'boxes', 'class_names' and 'last_frame'
+        (video frame numbers)
+    """
+    tracks = tracker.tracks
+    return {
+        'track_ids': np.array(list(tracks), dtype=np.int64),
+        'boxes': np.array([t['bbox'] for t in tracks.values()], dtype=np.float64).reshape(-1, 4),
+        'class_names': [t['class_name'] for t in tracks.values()],
+        'last_frame': np.array([t['last_frame'] + frame_offset for t in tracks.values()],
+                               dtype=np.int64)
+    }
+
+
+def process_segment(config_path: str, video_path: str, detector_config: str,
+                    tracker_config: str, first_frame: int, last_frame: int,
+                    overlap: int, detect_every_n_frames: int = 1) -> Dict[str, Any]:
+    """
+    Process one segment of a video (runs in a worker process).
+
+    Frames from first_frame - overlap onwards are processed so tracker,
+    speed and rule state have converged by first_frame; events before
+    first_frame are discarded. Track IDs in the result are local to the
+    segment.
+
+    Args:
+        config_path: Path to site config YAML
+        video_path: Path to input video
+        detector_config: Path to detector config
+        tracker_config: Path to tracker config
+        first_frame: First frame of the segment (1-based)
+        last_frame: Last frame of the segment (inclusive)
+        overlap: Warm-up frames before first_frame
+        detect_every_n_frames: Run the detector only on every Nth frame
+
+    Returns:
+        Dict with the segment bounds and overlap, 'events', 'new_track_ids'
+        (tracks created inside the segment, in creation order),
+        'start_state' and 'end_state' (stored tracks after the warm-up and
+        after the last frame) and 'detector_frames'
+    """
+    with open(config_path, 'r') as f:
+        site_config = yaml.safe_load(f)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    fps = site_config.get('fps_override') or cap.get(cv2.CAP_PROP_FPS)
+
+    warmup_start = max(1, first_frame - overlap)
+    if warmup_start > 1:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warmup_start - 1)
+
+    detector = VehicleDetector(detector_config)
+    processor = FrameProcessor(site_config, config_path, video_path, fps,
+                               detector, tracker_config, verbose=False,
+                               frame_size=(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                           int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+                               detect_every_n_frames=detect_every_n_frames)
+    tracker = processor.tracker
+    frame_offset = warmup_start - 1
+
+    events = []
+    start_state = _tracker_state(tracker, frame_offset)
+    new_track_ids = set()
+
+    # Same keyframe selection and batching as the sequential loop
+    detect_every_n_frames = max(1, detect_every_n_frames)
+    frames = itertools.takewhile(lambda item: item['frame_num'] <= last_frame,
+                                 read_frames(cap, start_frame=warmup_start))
+    try:
+        for batch in iter_batches(frames, detector.batch_size * detect_every_n_frames):
+            keyframes = [item for item in batch
+                         if (item['frame_num'] - 1) % detect_every_n_frames == 0]
+            detections = dict(zip(
+                [item['frame_num'] for item in keyframes],
+                processor.detect_batch([item['frame'] for item in keyframes])
+            ))
+
+            for item in batch:
+                frame_num = item['frame_num']
+                result = processor.analyze(frame_num, detections.get(frame_num))
+                if frame_num < first_frame:
+                    if frame_num == first_frame - 1:
+                        start_state = _tracker_state(tracker, frame_offset)
+                    continue
+                new_track_ids.update(result['tracks'].track_ids.tolist())
+                events.extend(result['events'])
+    finally:
+        cap.release()
+
+    new_track_ids.difference_update(start_state['track_ids'].tolist())
+
+    return {
+        'first_frame': first_frame,
+        'last_frame': last_frame,
+        'overlap': overlap,
+        'events': events,
+        'new_track_ids': sorted(new_track_ids),
+        'start_state': start_state,
+        'end_state': _tracker_state(tracker, frame_offset),
+        'detector_frames': processor.frames_detected
+    }
+
+
+def match_states(state: Dict[str, Any], prev_state: Dict[str, Any],
+                 match_thresh: float = 0.5) -> Tuple[Dict[int, int], bool]:
+    """
+    Match a segment's tracks after warm-up to the previous segment's final tracks.
+
+    Both describe the tracker after the same frame. A pair matches when the
+    tracks share class and last-seen frame and their boxes overlap.
+
+    Args:
+        state: start_state of a segment
+        prev_state: end_state of the previous segment
+        match_thresh: Minimum IoU for two tracks to be the same vehicle
+
+    Returns:
+        (mapping, converged): local track ID -> previous segment's local
+        track ID, and whether every track on both sides was matched
+    """
+    iou = iou_matrix(state['boxes'], prev_state['boxes'])
+    same = ((np.array(state['class_names'], dtype=object)[:, None]
+             == np.array(prev_state['class_names'], dtype=object)[None, :])
+            & (state['last_frame'][:, None] == prev_state['last_frame'][None, :]))
+    iou[~same] = 0.0
+
+    rows, cols = assign(iou, match_thresh)
+    mapping = dict(zip(state['track_ids'][rows].tolist(),
+                       prev_state['track_ids'][cols].tolist()))
+    converged = len(rows) == len(state['track_ids']) == len(prev_state['track_ids'])
+    return mapping, converged
+
+
+def stitch_segments(results: List[Dict[str, Any]], site_name: str) -> List[Dict[str, Any]]:
+    """
+    Combine segment results into one event list with global track IDs.
+
+    Tracks that continue across a boundary keep the ID from the previous
+    segment. Tracks created inside a segment get new IDs in segment order
+    and, within a segment, in local creation order, which reproduces the
+    sequential tracker's numbering.
+
+    Args:
+        results: process_segment() outputs in frame order
+        site_name: Site name used in event IDs
+
+    Returns:
+        Violation events in frame order
+    """
+    events = []
+    next_id = 1
+    prev_state = None
+    prev_global: Dict[int, int] = {}
+
+    for result in results:
+        carried = {}
+        if prev_state is not None:
+            carried, _ = match_states(result['start_state'], prev_state)
+
+        global_ids = {}
+        for local_id, prev_id in carried.items():
+            global_ids[local_id] = prev_global[prev_id]
+
+        # Unmatched warm-up tracks only remain if the boundary never converged
+        unmatched = [t for t in result['start_state']['track_ids'].tolist() if t not in carried]
+        for local_id in result['new_track_ids'] + unmatched:
+            global_ids[local_id] = next_id
+            next_id += 1
+
+        for event in result['events']:
+            event = dict(event)
+            # Swap the local track ID in the event ID, keeping any zone suffix
+            local_prefix = f"{site_name}_{event['frame_num']:08d}_t{event['track_id']}"
+            event['track_id'] = global_ids[event['track_id']]
+            event['event_id'] = (f"{site_name}_{event['frame_num']:08d}_t{event['track_id']}"
+                                 + event['event_id'][len(local_prefix):])
+            events.append(event)
+
+        prev_state = result['end_state']
+        prev_global = global_ids
+
+    return events
+
+
+def process_video_sharded(config_path: str, video_path: str,
+                          detector_config: str = "configs/detector_yolov8s.yaml",
+                          tracker_config: str = "configs/tracker_bytetrack.yaml",
+                          workers: Optional[int] = None, overlap: Optional[int] = None,
+                          detect_every_n_frames: int = 1) -> List[Dict[str, Any]]:
+    """
+    Process a recorded video in parallel time segments.
+
+    Produces the same violation events as process_video() without writing
+    an output video. Each worker loads its own detector.
+
+    Args:
+        config_path: Path to site config YAML
+        video_path: Path to input video
+        detector_config: Path to detector config
+        tracker_config: Path to tracker config
+        workers: Worker processes (defaults to the CPU count)
+        overlap: Warm-up frames per segment (defaults to default_overlap())
+        detect_every_n_frames: Run the detector only on every Nth frame
+
+    Returns:
+        Violation events in frame order
+    """
+    print(f"Processing video in segments: {video_path}")
+
+    with open(config_path, 'r') as f:
+        site_config = yaml.safe_load(f)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    fps = site_config.get('fps_override') or cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total_frames <= 0:
+        raise ValueError(f"Frame count unknown, cannot split video: {video_path}")
+
+    workers = workers or os.cpu_count() or 1
+    if overlap is None:
+        overlap = default_overlap(site_config, tracker_config, fps)
+    segments = plan_segments(total_frames, workers, overlap)
+
+    print(f"Video: {total_frames} frames @ {fps:.2f} FPS")
+    print(f"Segments: {len(segments)} on {min(workers, len(segments))} worker(s), "
+          f"overlap {overlap} frames")
+
+    start_time = time.time()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(segments)
+    reprocessed = 0
+
+    # Spawn keeps CUDA and model state out of forked children
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments)),
+                             mp_context=context) as executor:
+        futures = {
+            executor.submit(process_segment, config_path, video_path, detector_config,
+                            tracker_config, first, last, overlap,
+                            detect_every_n_frames): i
+            for i, (first, last) in enumerate(segments)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            first, last = segments[i]
+            print(f"Segment {i + 1}/{len(segments)} (frames {first}-{last}) done "
+                  f"after {time.time() - start_time:.1f}s - "
+                  f"{len(results[i]['events'])} violation(s)")
+
+        # A segment whose warm-up ended with different tracks than the
+        # previous segment is reprocessed with a longer warm-up, at worst
+        # from frame 1, so results always match a sequential run
+        for i in range(1, len(segments)):
+            first, last = segments[i]
+            segment_overlap = overlap
+            while (not match_states(results[i]['start_state'], results[i - 1]['end_state'])[1]
+                   and segment_overlap < first - 1):
+                segment_overlap = min(2 * segment_overlap, first - 1)
+                reprocessed += 1
+                print(f"Tracks differ at frame {first}; reprocessing segment {i + 1} "
+                      f"with {segment_overlap} warm-up frames")
+                results[i] = executor.submit(
+                    process_segment, config_path, video_path, detector_config,
+                    tracker_config, first, last, segment_overlap, detect_every_n_frames
+                ).result()
+
+    violation_events = stitch_segments(results, Path(config_path).parent.name)
+    for event in violation_events:
+        print(f"  VIOLATION: Track {event['track_id']} ({event['class']}) - "
+              f"{event['speed_kph']:.1f} km/h")
+
+    if violation_events:
+        event_file = save_event_log(config_path, video_path, total_frames, fps,
+                                    violation_events, {
+                                        'detector_frames': sum(r['detector_frames'] for r in results),
+                                        'segments': len(segments),
+                                        'overlap_frames': overlap,
+                                        'segments_reprocessed': reprocessed
+                                    })
+        print(f"\nSaved {len(violation_events)} violation event(s) to: {event_file}")
+
+    elapsed = time.time() - start_time
+    print(f"\nProcessing complete!")
+    print(f"  Frames processed: {total_frames}")
+    print(f"  Time elapsed: {elapsed:.1f}s")
+    print(f"  Average FPS: {total_frames/elapsed:.1f}")
+    print(f"  Violations detected: {len(violation_events)}")
+    print(f"  Segments reprocessed: {reprocessed}")
+
+    return violation_events
+
+
+def main():
+    """Main entry point for sharded video processing."""
+    parser = argparse.ArgumentParser(
+        description='Process a recorded video for lane violations in parallel segments'
+    )
+    parser.add_argument('--config', required=True,
+                       help='Path to site config YAML')
+    parser.add_argument('--video', required=True,
+                       help='Path to input video (a file; streams cannot be split)')
+    parser.add_argument('--detector-config', default='configs/detector_yolov8s.yaml',
+                       help='Path to detector config')
+    parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
+                       help='Path to tracker config')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes (default: CPU count)')
+    parser.add_argument('--overlap', type=int, default=None,
+                       help='Warm-up frames before each segment '
+                            '(default: derived from track buffer, dwell and FPS)')
+    parser.add_argument('--detect-every-n-frames', type=int, default=1,
+                       help='Run the detector only on every Nth frame (default: 1)')
+
+    args = parser.parse_args()
+
+    process_video_sharded(
+        config_path=args.config,
+        video_path=args.video,
+        detector_config=args.detector_config,
+        tracker_config=args.tracker_config,
+        workers=args.workers,
+        overlap=args.overlap,
+        detect_every_n_frames=args.detect_every_n_frames
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,12 @@ Speed estimation module using camera calibration and tracking.
 Estimates vehicle speed in km/h with EMA smoothing.
 """
 import time
-from typing import Dict, Optional, Tuple
-from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 
 from src.calibrate import CameraCalibrator
+from src.detections import Tracks
 
 
 class SpeedEstimator:
@@ -33,114 +33,197 @@ class SpeedEstimator:
         self.ema_alpha = speed_config.get('ema_alpha', 0.2)
         self.min_pixels_per_sec = speed_config.get('min_pixels_per_sec', 3)
         self.report_every_n_frames = speed_config.get('report_every_n_frames', 3)
+        # 'endpoints' (oldest to newest position) or 'lstsq' (least-squares
+        # slope over the whole window)
+        self.method = speed_config.get('method', 'endpoints')
         
-        # Track history: track_id -> deque of (frame_num, world_x, world_y)
-        self.track_positions: Dict[int, deque] = {}
+        # Max history length (keep last ~1 second of data)
+        self.max_history = max(int(fps), 10)
         
-        # Smoothed speeds: track_id -> speed_kph
-        self.track_speeds: Dict[int, float] = {}
+        # Per-track state lives in preallocated arrays indexed by a slot;
+        # track_id -> slot, and slots freed by reset_track are reused
+        self._slots: Dict[int, int] = {}
+        self._free_slots: List[int] = []
+        self._capacity = 0
         
-        # Frame counters for reporting
-        self.track_frame_counters: Dict[int, int] = {}
+        # Ring buffers of frame numbers and world positions: (slots, history)
+        self._frames = np.zeros((0, self.max_history), dtype=np.int64)
+        self._positions = np.zeros((0, self.max_history, 2), dtype=np.float64)
+        # Positions written so far (the newest is at (count - 1) % max_history)
+        self._counts = np.zeros(0, dtype=np.int64)
         
-        # Max history length (keep last ~1 second of data)
-        self.max_history = max(int(fps), 10)
+        # Smoothed speeds (km/h) and frame counters for reporting
+        self._speeds = np.zeros(0, dtype=np.float64)
+        self._frame_counters = np.zeros(0, dtype=np.int64)
+        
+        self._grow(64)
     
-    def update_track(self, track_id: int, centroid: Tuple[float, float],
-                    frame_num: int) -> Optional[float]:
+    def update_frame(self, track_ids: Iterable[int], centroids: np.ndarray,
+                     frame_num: int) -> np.ndarray:
         """
-        Update track position and estimate speed.
+        Update positions and estimate speeds for all tracks of a frame at once.
         
         Args:
-            track_id: Unique track identifier
-            centroid: (cx, cy) in pixels
+            track_ids: Track identifiers (unique within the frame)
+            centroids: (N, 2) centroids (cx, cy) in pixels
             frame_num: Current frame number
             
         Returns:
-            Speed in km/h, or None if not enough data
+            (N,) speeds in km/h, NaN where not enough data
         """
-        # Convert to world coordinates
-        if not self.calibrator.is_calibrated():
-            return None
+        track_ids = [int(track_id) for track_id in track_ids]
+        speeds = np.full(len(track_ids), np.nan)
+        if not track_ids:
+            return speeds
         
-        world_pos = self.calibrator.pixel_to_world(centroid[0], centroid[1])
-        if world_pos is None:
-            return None
+        # Convert to world coordinates
+        world_positions = self.calibrator.pixel_to_world_batch(centroids)
+        if world_positions is None:
+            return speeds
         
-        # Initialize track history if new
-        if track_id not in self.track_positions:
-            self.track_positions[track_id] = deque(maxlen=self.max_history)
-            self.track_speeds[track_id] = 0.0
-            self.track_frame_counters[track_id] = 0
+        slots = self._slots_for(track_ids)
         
-        # Add current position
-        self.track_positions[track_id].append((frame_num, world_pos[0], world_pos[1]))
+        # Add current positions
+        write_index = self._counts[slots] % self.max_history
+        self._frames[slots, write_index] = frame_num
+        self._positions[slots, write_index] = world_positions
+        self._counts[slots] += 1
         
         # Need at least 2 positions to calculate speed
-        if len(self.track_positions[track_id]) < 2:
-            return None
-        
-        # Calculate instantaneous speed
-        instant_speed = self._calculate_instant_speed(track_id)
-        
-        if instant_speed is None:
-            return self.track_speeds[track_id]
+        ready = self._counts[slots] >= 2
+        ready_slots = slots[ready]
+        instant_speeds = self._instant_speeds(ready_slots)
         
-        # Apply smoothing
+        # Apply smoothing where an instantaneous speed is available
+        current = self._speeds[ready_slots]
         if self.smoothing == 'ema':
             # Exponential moving average
-            self.track_speeds[track_id] = (
-                self.ema_alpha * instant_speed +
-                (1 - self.ema_alpha) * self.track_speeds[track_id]
-            )
+            smoothed = self.ema_alpha * instant_speeds + (1 - self.ema_alpha) * current
         else:
             # No smoothing
-            self.track_speeds[track_id] = instant_speed
+            smoothed = instant_speeds
+        current = np.where(np.isnan(instant_speeds), current, smoothed)
         
-        return self.track_speeds[track_id]
+        self._speeds[ready_slots] = current
+        speeds[ready] = current
+        return speeds
     
-    def _calculate_instant_speed(self, track_id: int) -> Optional[float]:
+    def update_tracks(self, tracks: Tracks, frame_num: int) -> np.ndarray:
         """
-        Calculate instantaneous speed from recent positions.
+        Update positions and estimate speeds for all tracks of a frame.
         
         Args:
-            track_id: Track identifier
+            tracks: Tracks for the current frame
+            frame_num: Current frame number
             
         Returns:
-            Speed in km/h, or None if insufficient data
+            (N,) speeds in km/h, NaN where not enough data
+        """
+        return self.update_frame(tracks.track_ids.tolist(), tracks.centroids, frame_num)
+    
+    def update_track(self, track_id: int, centroid: Tuple[float, float],
+                    frame_num: int) -> Optional[float]:
         """
-        positions = self.track_positions[track_id]
+        Update track position and estimate speed.
         
-        if len(positions) < 2:
-            return None
+        Args:
+            track_id: Unique track identifier
+            centroid: (cx, cy) in pixels
+            frame_num: Current frame number
+            
+        Returns:
+            Speed in km/h, or None if not enough data
+        """
+        speed_kph = self.update_frame([track_id], np.array([centroid], dtype=np.float64),
+                                      frame_num)[0]
+        return None if np.isnan(speed_kph) else float(speed_kph)
+    
+    def _instant_speeds(self, slots: np.ndarray) -> np.ndarray:
+        """
+        Calculate instantaneous speeds from the positions in the window.
         
-        # Use positions separated by a few frames to reduce noise
-        # Get oldest and newest positions
-        old_frame, old_x, old_y = positions[0]
-        new_frame, new_x, new_y = positions[-1]
+        Args:
+            slots: Slots of tracks with at least 2 positions
+            
+        Returns:
+            Speeds in km/h, NaN where the window spans no time
+        """
+        counts = self._counts[slots]
+        history = np.minimum(counts, self.max_history)
         
-        # Calculate distance and time
-        distance_m = self.calibrator.distance_meters((old_x, old_y), (new_x, new_y))
-        frame_diff = new_frame - old_frame
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.method == 'lstsq':
+                speed_ms = self._slope_speeds(slots, history)
+            else:
+                # Use positions separated by a few frames to reduce noise:
+                # oldest and newest positions in the window
+                newest = (counts - 1) % self.max_history
+                oldest = (counts - history) % self.max_history
+                frame_diff = self._frames[slots, newest] - self._frames[slots, oldest]
+                delta = self._positions[slots, newest] - self._positions[slots, oldest]
+                distance_m = np.sqrt(delta[:, 0]**2 + delta[:, 1]**2)
+                time_s = frame_diff / self.fps
+                speed_ms = np.where(frame_diff > 0, distance_m / time_s, np.nan)
         
-        if frame_diff == 0:
-            return None
+        # Check minimum motion threshold (reduce jitter)
+        speed_kph = np.where(speed_ms < self.min_pixels_per_sec, 0.0, speed_ms * 3.6)
         
-        time_s = frame_diff / self.fps
+        return np.maximum(speed_kph, 0.0)  # Ensure non-negative (NaN is kept)
+    
+    def _slope_speeds(self, slots: np.ndarray, history: np.ndarray) -> np.ndarray:
+        """
+        Fit position against frame number over each window by least squares.
         
-        # Check minimum motion threshold (reduce jitter)
-        pixel_motion = np.sqrt((positions[-1][1] - positions[0][1])**2 +
-                               (positions[-1][2] - positions[0][2])**2)
-        pixel_per_sec = pixel_motion / time_s if time_s > 0 else 0
+        Slots fill from index 0, so the valid samples are the first
+        `history` entries; their order in the ring does not matter for the fit.
         
-        if pixel_per_sec < self.min_pixels_per_sec:
-            return 0.0
+        Args:
+            slots: Slots of tracks with at least 2 positions
+            history: Number of valid positions per slot
+            
+        Returns:
+            Speeds in m/s, NaN where the window spans no time
+        """
+        weights = (np.arange(self.max_history) < history[:, None]).astype(np.float64)
+        frames = self._frames[slots].astype(np.float64)
+        positions = self._positions[slots]
         
-        # Speed in m/s, convert to km/h
-        speed_ms = distance_m / time_s if time_s > 0 else 0
-        speed_kph = speed_ms * 3.6
+        frame_mean = (weights * frames).sum(axis=1) / history
+        frame_offsets = (frames - frame_mean[:, None]) * weights
+        position_mean = (weights[..., None] * positions).sum(axis=1) / history[:, None]
         
-        return max(0.0, speed_kph)  # Ensure non-negative
+        # Velocity in meters per frame
+        velocity = ((frame_offsets[..., None] * (positions - position_mean[:, None]))
+                    .sum(axis=1) / (frame_offsets**2).sum(axis=1)[:, None])
+        return np.sqrt(velocity[:, 0]**2 + velocity[:, 1]**2) * self.fps
+    
+    def _slots_for(self, track_ids: List[int]) -> np.ndarray:
+        """Get the slots of tracks, allocating slots for new tracks."""
+        slots = np.empty(len(track_ids), dtype=np.intp)
+        for i, track_id in enumerate(track_ids):
+            slot = self._slots.get(track_id)
+            if slot is None:
+                if not self._free_slots:
+                    self._grow(2 * self._capacity)
+                slot = self._free_slots.pop()
+                self._slots[track_id] = slot
+            slots[i] = slot
+        return slots
+    
+    def _grow(self, capacity: int):
+        """Enlarge the per-track arrays to hold capacity tracks."""
+        extra = capacity - self._capacity
+        self._frames = np.concatenate(
+            [self._frames, np.zeros((extra, self.max_history), dtype=np.int64)])
+        self._positions = np.concatenate(
+            [self._positions, np.zeros((extra, self.max_history, 2), dtype=np.float64)])
+        self._counts = np.concatenate([self._counts, np.zeros(extra, dtype=np.int64)])
+        self._speeds = np.concatenate([self._speeds, np.zeros(extra, dtype=np.float64)])
+        self._frame_counters = np.concatenate(
+            [self._frame_counters, np.zeros(extra, dtype=np.int64)])
+        # Hand out low slots first
+        self._free_slots.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
     
     def get_speed(self, track_id: int) -> float:
         """
@@ -152,7 +235,8 @@ class SpeedEstimator:
         Returns:
             Speed in km/h (0.0 if track not found)
         """
-        return self.track_speeds.get(track_id, 0.0)
+        slot = self._slots.get(track_id)
+        return 0.0 if slot is None else float(self._speeds[slot])
     
     def should_report(self, track_id: int) -> bool:
         """
@@ -164,23 +248,26 @@ class SpeedEstimator:
         Returns:
             True if should report speed this frame
         """
-        if track_id not in self.track_frame_counters:
-            self.track_frame_counters[track_id] = 0
+        slot = self._slots_for([track_id])[0]
         
-        self.track_frame_counters[track_id] += 1
+        self._frame_counters[slot] += 1
         
-        if self.track_frame_counters[track_id] >= self.report_every_n_frames:
-            self.track_frame_counters[track_id] = 0
+        if self._frame_counters[slot] >= self.report_every_n_frames:
+            self._frame_counters[slot] = 0
             return True
         
         return False
     
+    def __len__(self) -> int:
+        """Number of tracks holding speed state."""
+        return len(self._slots)
+    
     def reset_track(self, track_id: int):
         """Remove track data."""
-        if track_id in self.track_positions:
-            del self.track_positions[track_id]
-        if track_id in self.track_speeds:
-            del self.track_speeds[track_id]
-        if track_id in self.track_frame_counters:
-            del self.track_frame_counters[track_id]
-
+        slot = self._slots.pop(track_id, None)
+        if slot is None:
+            return
+        self._counts[slot] = 0
+        self._speeds[slot] = 0.0
+        self._frame_counters[slot] = 0
+        self._free_slots.append(slot)
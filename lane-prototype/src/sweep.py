@@ -0,0 +1,403 @@
+"""
+Parameter sweep over cached detections.
+Replays the same recorded detections under many combinations of rule, speed
+and tracker settings in a process pool and ranks the results, optionally
+against labelled violations.
+"""
+import argparse
+import copy
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+from src.detection_cache import DEFAULT_CACHE_DIR, DetectionCache
+from src.replay import open_cache, replay_detections
+
+# Short names for the settings tuned most often; other settings are given
+# by their dotted site config path, or 'tracker.<key>' for the tracker config
+PARAM_ALIASES = {
+    'dwell_frames': 'violation.dwell_frames',
+    'ema_alpha': 'speed.ema_alpha',
+    'min_pixels_per_sec': 'speed.min_pixels_per_sec',
+    'match_thresh': 'tracker.match_thresh',
+    'track_buffer': 'tracker.track_buffer'
+}
+
+
+def parse_param(spec: str) -> tuple:
+    """
+    Parse a --param spec: 'name=v1,v2,...' (values) or 'name=low:high' (range).
+
+    Args:
+        spec: Parameter spec
+
+    Returns:
+        (key, values) with values a list, or (key, (low, high)) for a range
+    """
+    name, _, values = spec.partition('=')
+    if not values:
+        raise ValueError(f"Parameter needs values: {spec}")
+    key = PARAM_ALIASES.get(name.strip(), name.strip())
+    if ':' in values:
+        low, high = (yaml.safe_load(value) for value in values.split(':', 1))
+        return key, (low, high)
+    return key, [yaml.safe_load(value) for value in values.split(',')]
+
+
+def grid_combinations(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every combination of the parameters' value lists."""
+    for key, values in params.items():
+        if isinstance(values, tuple):
+            raise ValueError(f"Ranges need --random: {key}")
+    keys = list(params)
+    return [dict(zip(keys, combination))
+            for combination in itertools.product(*(params[key] for key in keys))]
+
+
+def random_combinations(params: Dict[str, Any], samples: int,
+                        seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Sample parameter combinations.
+
+    Value lists are sampled uniformly; ranges uniformly between their ends
+    (as integers when both ends are integers).
+
+    Args:
+        params: key -> value list or (low, high) range
+        samples: Number of combinations
+        seed: Random seed
+
+    Returns:
+        List of key -> value dicts
+    """
+    rng = random.Random(seed)
+    combinations = []
+    for _ in range(samples):
+        combination = {}
+        for key, values in params.items():
+            if not isinstance(values, tuple):
+                combination[key] = rng.choice(values)
+            elif all(isinstance(end, int) for end in values):
+                combination[key] = rng.randint(*values)
+            else:
+                combination[key] = round(rng.uniform(*values), 4)
+        combinations.append(combination)
+    return combinations
+
+
+def apply_params(site_config: dict, tracker_config: dict,
+                 params: Dict[str, Any]) -> tuple:
+    """
+    Get copies of the site and tracker configs with parameters set.
+
+    Args:
+        site_config: Site configuration dictionary
+        tracker_config: Tracker configuration dictionary
+        params: Dotted key -> value ('tracker.<key>' for the tracker config)
+
+    Returns:
+        (site_config, tracker_config) copies
+    """
+    site_config = copy.deepcopy(site_config)
+    tracker_config = dict(tracker_config)
+    for key, value in params.items():
+        if key.startswith('tracker.'):
+            tracker_config[key[len('tracker.'):]] = value
+            continue
+        parts = key.split('.')
+        section = site_config
+        for part in parts[:-1]:
+            if not isinstance(section.get(part), dict):
+                section[part] = {}
+            section = section[part]
+        section[parts[-1]] = value
+    return site_config, tracker_config
+
+
+def match_labels(events: List[Dict[str, Any]], labels: List[Dict[str, Any]],
+                 tolerance_frames: int) -> int:
+    """
+    Count events that match a labelled violation.
+
+    A label matches the nearest unmatched event within tolerance_frames
+    that agrees on 'class' and 'violation' where the label gives them.
+
+    Args:
+        events: Violation events of a run
+        labels: Labelled violations with 'frame_num' and optional
+                'class' and 'violation'
+        tolerance_frames: Maximum frame distance for a match
+
+    Returns:
+        Number of matched labels
+    """
+    if not events or not labels:
+        return 0
+
+    event_frames = np.array([event['frame_num'] for event in events])
+    used = np.zeros(len(events), dtype=bool)
+    matched = 0
+    for label in sorted(labels, key=lambda label: label['frame_num']):
+        distance = np.abs(event_frames - label['frame_num'])
+        candidates = ~used & (distance <= tolerance_frames)
+        for key in ('class', 'violation'):
+            if label.get(key) is not None:
+                candidates &= np.array([event.get(key) == label[key] for event in events])
+        if not candidates.any():
+            continue
+        best = np.flatnonzero(candidates)[np.argmin(distance[candidates])]
+        used[best] = True
+        matched += 1
+    return matched
+
+
+def evaluate_params(cache_path: str, site_config: dict, config_path: str,
+                    tracker_config: dict, params: Dict[str, Any],
+                    detect_every_n_frames: int = 1,
+                    labels: Optional[List[Dict[str, Any]]] = None,
+                    match_seconds: float = 2.0) -> Dict[str, Any]:
+    """
+    Replay cached detections with one parameter combination and summarize.
+
+    Runs in a worker process.
+
+    Args:
+        cache_path: Detection cache entry folder
+        site_config: Site configuration dictionary
+        config_path: Path to site config YAML
+        tracker_config: Tracker configuration dictionary
+        params: Parameter combination to apply
+        detect_every_n_frames: Keyframe interval to replay
+        labels: Optional labelled violations
+        match_seconds: Time tolerance for matching events to labels
+
+    Returns:
+        Dict with 'params', 'events', speed statistics ('speed_mean',
+        'speed_median', 'speed_p90'), 'seconds' and, with labels,
+        'matched', 'precision', 'recall' and 'f1'
+    """
+    cache = DetectionCache.from_path(cache_path)
+    run_site_config, run_tracker_config = apply_params(site_config, tracker_config, params)
+    result = replay_detections(cache, run_site_config, config_path, run_tracker_config,
+                               detect_every_n_frames=detect_every_n_frames)
+    events = result['events']
+
+    speeds = np.array([event['speed_kph'] for event in events
+                       if event.get('speed_kph') is not None], dtype=np.float64)
+    speeds = speeds[np.isfinite(speeds)]
+    summary = {
+        'params': params,
+        'events': len(events),
+        'speed_mean': float(speeds.mean()) if len(speeds) else None,
+        'speed_median': float(np.median(speeds)) if len(speeds) else None,
+        'speed_p90': float(np.percentile(speeds, 90)) if len(speeds) else None,
+        'seconds': result['seconds']
+    }
+
+    if labels is not None:
+        matched = match_labels(events, labels, int(round(match_seconds * result['fps'])))
+        precision = matched / len(events) if events else 0.0
+        recall = matched / len(labels) if labels else 0.0
+        summary.update({
+            'matched': matched,
+            'precision': precision,
+            'recall': recall,
+            'f1': (2 * precision * recall / (precision + recall)
+                   if precision + recall > 0 else 0.0)
+        })
+    return summary
+
+
+def load_labels(labels_path: str) -> List[Dict[str, Any]]:
+    """
+    Load labelled violations: a JSON list, or an events log with 'violations'.
+
+    Args:
+        labels_path: Path to the labels JSON
+
+    Returns:
+        Labels with 'frame_num' and optional 'class' and 'violation'
+    """
+    with open(labels_path, 'r') as f:
+        labels = json.load(f)
+    if isinstance(labels, dict):
+        labels = labels['violations']
+    return labels
+
+
+def run_sweep(cache: DetectionCache, site_config: dict, config_path: str,
+              tracker_config: dict, combinations: List[Dict[str, Any]],
+              detect_every_n_frames: int = 1, labels: Optional[List[Dict[str, Any]]] = None,
+              match_seconds: float = 2.0, workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluate parameter combinations in a process pool.
+
+    Args:
+        cache: Detection cache entry to replay
+        site_config: Site configuration dictionary
+        config_path: Path to site config YAML
+        tracker_config: Tracker configuration dictionary
+        combinations: Parameter combinations
+        detect_every_n_frames: Keyframe interval to replay
+        labels: Optional labelled violations
+        match_seconds: Time tolerance for matching events to labels
+        workers: Worker processes (defaults to the CPU count)
+
+    Returns:
+        One summary per combination (see evaluate_params), in input order
+    """
+    workers = min(workers or os.cpu_count() or 1, len(combinations))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(combinations)
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {
+            executor.submit(evaluate_params, str(cache.path), site_config, config_path,
+                            tracker_config, params, detect_every_n_frames, labels,
+                            match_seconds): i
+            for i, params in enumerate(combinations)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if done % 10 == 0 or done == len(combinations):
+                print(f"  {done}/{len(combinations)} combinations evaluated")
+    return results
+
+
+def rank_results(results: List[Dict[str, Any]], sort_key: str) -> List[Dict[str, Any]]:
+    """Sort results best first by a summary column (missing values last)."""
+    return sorted(results, key=lambda result: (result.get(sort_key) is None,
+                                               -(result.get(sort_key) or 0)))
+
+
+def write_results(results: List[Dict[str, Any]], output_path: Path):
+    """Write ranked results as CSV, one column per parameter."""
+    param_keys = list(results[0]['params'])
+    columns = [key for key in ('events', 'speed_mean', 'speed_median', 'speed_p90',
+                               'matched', 'precision', 'recall', 'f1', 'seconds')
+               if key in results[0]]
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank'] + param_keys + columns)
+        for rank, result in enumerate(results, 1):
+            writer.writerow([rank] + [result['params'][key] for key in param_keys]
+                            + [result[column] for column in columns])
+
+
+def print_results(results: List[Dict[str, Any]], top: int):
+    """Print the best results as a table."""
+    param_keys = list(results[0]['params'])
+    has_labels = 'f1' in results[0]
+
+    def number(value, fmt):
+        return format(value, fmt) if value is not None else '-'
+
+    header = "  ".join([f"{'rank':>4}"] + [f"{key.split('.')[-1]:>18}" for key in param_keys]
+                       + [f"{'events':>6}", f"{'mean kph':>8}", f"{'p90 kph':>8}"])
+    if has_labels:
+        header += f"  {'prec':>5}  {'recall':>6}  {'f1':>5}"
+    print(header)
+    for rank, result in enumerate(results[:top], 1):
+        row = "  ".join([f"{rank:>4}"] + [f"{str(result['params'][key]):>18}" for key in param_keys]
+                        + [f"{result['events']:>6}", f"{number(result['speed_mean'], '.1f'):>8}",
+                           f"{number(result['speed_p90'], '.1f'):>8}"])
+        if has_labels:
+            row += (f"  {result['precision']:>5.2f}  {result['recall']:>6.2f}"
+                    f"  {result['f1']:>5.2f}")
+        print(row)
+
+
+def main():
+    """Main entry point for parameter sweeps."""
+    parser = argparse.ArgumentParser(
+        description='Sweep rule, speed and tracker settings over cached detections'
+    )
+    parser.add_argument('--config', required=True,
+                       help='Path to site config YAML')
+    parser.add_argument('--video',
+                       help='Video whose cached detections to replay (not decoded)')
+    parser.add_argument('--cache',
+                       help='Cache entry folder (instead of --video)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'Root folder of the detection cache (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--tracker-config', default='configs/tracker_bytetrack.yaml',
+                       help='Path to tracker config')
+    parser.add_argument('--param', action='append', required=True,
+                       help="Setting to sweep: 'name=v1,v2,...' or 'name=low:high' "
+                            "(ranges need --random). Names: "
+                            f"{', '.join(PARAM_ALIASES)}, a dotted site config key "
+                            "or tracker.<key>")
+    parser.add_argument('--random', type=int, default=None, metavar='N',
+                       help='Evaluate N random combinations instead of the full grid')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Random seed for --random')
+    parser.add_argument('--labels',
+                       help='Labelled violations (JSON list or events log) for precision/recall')
+    parser.add_argument('--match-seconds', type=float, default=2.0,
+                       help='Time tolerance when matching events to labels (default: 2.0)')
+    parser.add_argument('--sort', default=None,
+                       help='Column to rank by (default: f1 with labels, else events)')
+    parser.add_argument('--detect-every-n-frames', type=int, default=1,
+                       help='Keyframe interval to replay (default: 1)')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Worker processes (default: CPU count)')
+    parser.add_argument('--top', type=int, default=20,
+                       help='Rows to print (default: 20)')
+    parser.add_argument('--output',
+                       help='CSV file for the ranked table '
+                            '(default: events/sweeps/<site>_sweep_<timestamp>.csv)')
+
+    args = parser.parse_args()
+    if not args.video and not args.cache:
+        parser.error('--video or --cache is required')
+
+    with open(args.config, 'r') as f:
+        site_config = yaml.safe_load(f)
+    with open(args.tracker_config, 'r') as f:
+        tracker_config = yaml.safe_load(f)
+
+    params = dict(parse_param(spec) for spec in args.param)
+    if args.random:
+        combinations = random_combinations(params, args.random, args.seed)
+    else:
+        combinations = grid_combinations(params)
+    labels = load_labels(args.labels) if args.labels else None
+
+    cache = open_cache(args.video, args.cache, args.cache_dir)
+    print(f"Sweeping {len(combinations)} combination(s) of {', '.join(params)} "
+          f"over {cache.path} ({cache.video_frames} frames)")
+
+    start_time = time.time()
+    results = run_sweep(cache, site_config, args.config, tracker_config, combinations,
+                        args.detect_every_n_frames, labels, args.match_seconds, args.workers)
+    elapsed = time.time() - start_time
+
+    sort_key = args.sort or ('f1' if labels is not None else 'events')
+    results = rank_results(results, sort_key)
+
+    output_path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = (Path("events/sweeps")
+                       / f"{Path(args.config).parent.name}_sweep_{timestamp}.csv")
+    write_results(results, Path(output_path))
+
+    print(f"\nSweep complete in {elapsed:.1f}s, ranked by {sort_key}")
+    print_results(results, args.top)
+    print(f"\nFull table: {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,13 @@ Multi-object tracking module using BYTETrack.
 Maintains stable track IDs across frames.
 """
 import yaml
-from typing import List, Dict, Any
+from typing import Callable, Dict, Any, List, Tuple, Union
 
 import numpy as np
 
+from src.detections import Detections, Tracks, class_name_for
+from src.kalman import BoxKalmanFilter, xywh_to_boxes
+
 
 try:
     from ultralytics.trackers.byte_tracker import BYTETracker
@@ -14,165 +17,299 @@ try:
 except ImportError:
     BYTETRACK_AVAILABLE = False
 
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """
+    Calculate pairwise Intersection over Union between two sets of boxes.
+    
+    Args:
+        boxes_a: (N, 4) boxes as [x1, y1, x2, y2]
+        boxes_b: (M, 4) boxes as [x1, y1, x2, y2]
+    
+    Returns:
+        (N, M) IoU matrix
+    """
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    
+    # Calculate intersection
+    inter_w = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    inter_h = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    
+    # Calculate union
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union > 0, intersection / union, 0.0)
+    return iou
+
+
+def assign(scores: np.ndarray, thresh: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve the assignment that maximizes total score, keeping pairs above thresh.
+    
+    Uses the Hungarian algorithm when SciPy is available, otherwise a greedy
+    best-pair-first assignment. Either way every row and column is used at
+    most once.
+    
+    Args:
+        scores: (N, M) score matrix (e.g. IoU)
+        thresh: Minimum score (exclusive) for a pair to be matched
+    
+    Returns:
+        (rows, cols) index arrays of matched pairs
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if scores.size == 0:
+        return empty, empty
+    
+    valid = scores > thresh
+    if not valid.any():
+        return empty, empty
+    
+    if SCIPY_AVAILABLE:
+        # Invalid pairs get a cost no valid assignment can beat, then are dropped
+        cost = np.where(valid, 1.0 - scores, scores.shape[0] + scores.shape[1] + 1.0)
+        rows, cols = linear_sum_assignment(cost)
+        keep = valid[rows, cols]
+        return rows[keep].astype(np.int64), cols[keep].astype(np.int64)
+    
+    # Greedy fallback: take candidate pairs in descending score order
+    cand_rows, cand_cols = np.nonzero(valid)
+    order = np.argsort(-scores[cand_rows, cand_cols], kind='stable')
+    used_rows = np.zeros(scores.shape[0], dtype=bool)
+    used_cols = np.zeros(scores.shape[1], dtype=bool)
+    rows, cols = [], []
+    for r, c in zip(cand_rows[order].tolist(), cand_cols[order].tolist()):
+        if used_rows[r] or used_cols[c]:
+            continue
+        used_rows[r] = used_cols[c] = True
+        rows.append(r)
+        cols.append(c)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
 
 class VehicleTracker:
     """Wrapper for BYTETrack multi-object tracking."""
     
-    def __init__(self, config_path: str, fps: float = 30.0):
+    def __init__(self, config_path: Union[str, Dict[str, Any]], fps: float = 30.0):
         """
         Initialize tracker.
         
         Args:
-            config_path: Path to tracker config YAML
+            config_path: Path to tracker config YAML, or the config as a dict
             fps: Video frame rate
         """
-        with open(config_path, 'r') as f:
-            self.config = yaml.safe_load(f)
+        if isinstance(config_path, dict):
+            self.config = dict(config_path)
+        else:
+            with open(config_path, 'r') as f:
+                self.config = yaml.safe_load(f)
         
         self.fps = fps
         self.frame_count = 0
         
+        # Association parameters
+        self.track_thresh = self.config.get('track_thresh', 0.6)
+        # As in BYTETrack, match_thresh is the highest association cost (1 - IoU)
+        # accepted, so a detection continues a track when IoU > 1 - match_thresh
+        self.match_thresh = self.config.get('match_thresh', 0.5)
+        self.min_match_iou = 1.0 - self.match_thresh
+        self.track_buffer = self.config.get('track_buffer', 30)
+        
         # Use Ultralytics built-in tracking if available
         self.use_builtin = True
         
-        # Track storage for manual tracking fallback
-        self.tracks: Dict[int, Dict[str, Any]] = {}
+        # Constant-velocity motion model used to predict boxes between detections
+        self.kalman = BoxKalmanFilter()
+        
+        # Track storage for manual tracking fallback, one row per track
+        self._init_storage()
         self.next_id = 1
+        
+        # Callbacks run with the track_id of every track that is dropped,
+        # so per-track state elsewhere can be released
+        self._track_ended_listeners: List[Callable[[int], None]] = []
+        self.tracks_ended = 0
     
-    def update(self, detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def add_track_ended_listener(self, callback: Callable[[int], None]):
         """
-        Update tracks with new detections.
+        Subscribe to tracks ending (timed out or cleared by reset).
         
         Args:
-            detections: List of detection dicts with 'bbox', 'score', 'class_id', 'class_name'
-            
-        Returns:
-            List of tracks with added 'track_id' field
+            callback: Called with the track_id of each ended track
         """
-        self.frame_count += 1
-        
-        # Simple tracking: assign IDs based on IoU matching
-        tracks = []
-        
-        if not detections:
-            return tracks
-        
-        # Convert detections to tracks
-        for det in detections:
-            # Try to match with existing tracks
-            track_id = self._match_detection(det)
-            
-            track = det.copy()
-            track['track_id'] = track_id
-            track['frame'] = self.frame_count
-            
-            tracks.append(track)
-            
-            # Update track storage
-            self.tracks[track_id] = {
-                'bbox': det['bbox'],
-                'class_name': det['class_name'],
-                'last_frame': self.frame_count
+        self._track_ended_listeners.append(callback)
+    
+    def _end_tracks(self, track_ids: np.ndarray):
+        """Notify listeners that tracks have ended."""
+        self.tracks_ended += len(track_ids)
+        for track_id in track_ids.tolist():
+            for callback in self._track_ended_listeners:
+                callback(track_id)
+    
+    def _init_storage(self):
+        """Allocate empty per-track arrays."""
+        self._track_ids = np.zeros(0, dtype=np.int64)
+        self._boxes = np.zeros((0, 4), dtype=np.float64)
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._class_ids = np.zeros(0, dtype=np.int32)
+        self._last_frame = np.zeros(0, dtype=np.int64)
+        self._mean = np.zeros((0, 8))
+        self._covariance = np.zeros((0, 8, 8))
+        self._last_detect_frame = 0
+    
+    @property
+    def tracks(self) -> Dict[int, Dict[str, Any]]:
+        """Stored tracks as a dict of track_id -> {'bbox', 'class_name', 'last_frame'}."""
+        return {
+            int(track_id): {
+                'bbox': box.tolist(),
+                'class_name': class_name_for(class_id),
+                'last_frame': int(last_frame)
             }
-        
-        # Clean up old tracks
-        self._cleanup_old_tracks()
-        
-        return tracks
+            for track_id, box, class_id, last_frame in zip(
+                self._track_ids, self._boxes, self._class_ids, self._last_frame)
+        }
     
-    def _match_detection(self, detection: Dict[str, Any]) -> int:
+    def update(self, detections: Detections) -> Tracks:
         """
-        Match detection to existing track or create new one.
+        Update tracks with new detections.
+        
+        All tracks are first moved forward one frame by the Kalman filter.
+        Association then follows BYTETrack: detections scoring at least
+        track_thresh are matched to the predicted track boxes first, then the remaining
+        tracks are matched against low-score detections. A pair needs IoU
+        above 1 - match_thresh (BYTETrack's cost threshold). Each stage builds
+        the full IoU matrix at once and solves it as an optimal assignment,
+        so one track can never be claimed by two detections. Unmatched
+        high-score detections start new tracks; unmatched low-score
+        detections are dropped as likely false positives.
         
         Args:
-            detection: Detection dictionary
-            
+            detections: Detections for the current frame
+        
         Returns:
-            Track ID
+            Tracked detections (in input order) with track_ids assigned
         """
-        bbox = detection['bbox']
-        class_name = detection['class_name']
+        self._advance()
+        self._last_detect_frame = self.frame_count
         
-        best_iou = 0.0
-        best_track_id = None
+        num_dets = len(detections)
+        det_track_ids = np.full(num_dets, -1, dtype=np.int64)
         
-        # Try to match with existing tracks
-        for track_id, track_data in self.tracks.items():
-            # Only match same class
-            if track_data['class_name'] != class_name:
-                continue
+        if num_dets > 0:
+            # IoU between every detection and every stored track; only same class can match
+            iou = iou_matrix(detections.boxes, self._boxes)
+            iou[detections.class_ids[:, None] != self._class_ids[None, :]] = 0.0
             
-            # Check if track is recent
-            if self.frame_count - track_data['last_frame'] > 30:
-                continue
+            high = np.flatnonzero(detections.scores >= self.track_thresh)
+            low = np.flatnonzero(detections.scores < self.track_thresh)
             
-            # Calculate IoU
-            iou = self._calculate_iou(bbox, track_data['bbox'])
+            # First association: high-score detections against all tracks
+            rows, cols = assign(iou[high], self.min_match_iou)
+            det_track_ids[high[rows]] = self._track_ids[cols]
+            matched_tracks = np.zeros(len(self._track_ids), dtype=bool)
+            matched_tracks[cols] = True
             
-            if iou > best_iou:
-                best_iou = iou
-                best_track_id = track_id
+            # Second association: low-score detections against leftover tracks
+            remaining = np.flatnonzero(~matched_tracks)
+            rows, cols = assign(iou[np.ix_(low, remaining)], self.min_match_iou)
+            det_track_ids[low[rows]] = self._track_ids[remaining[cols]]
+            
+            # Update matched tracks
+            matched = np.flatnonzero(det_track_ids >= 0)
+            track_index = np.searchsorted(self._track_ids, det_track_ids[matched])
+            self._mean[track_index], self._covariance[track_index] = self.kalman.update(
+                self._mean[track_index], self._covariance[track_index],
+                detections.boxes[matched]
+            )
+            self._boxes[track_index] = detections.boxes[matched]
+            self._scores[track_index] = detections.scores[matched]
+            self._last_frame[track_index] = self.frame_count
+            
+            # Create new tracks from unmatched high-score detections
+            new = high[det_track_ids[high] < 0]
+            if len(new) > 0:
+                new_ids = np.arange(self.next_id, self.next_id + len(new), dtype=np.int64)
+                self.next_id += len(new)
+                det_track_ids[new] = new_ids
+                mean, covariance = self.kalman.initiate(detections.boxes[new])
+                self._track_ids = np.concatenate([self._track_ids, new_ids])
+                self._boxes = np.concatenate([self._boxes, detections.boxes[new]])
+                self._scores = np.concatenate([self._scores, detections.scores[new]])
+                self._mean = np.concatenate([self._mean, mean])
+                self._covariance = np.concatenate([self._covariance, covariance])
+                self._class_ids = np.concatenate([self._class_ids, detections.class_ids[new]])
+                self._last_frame = np.concatenate([
+                    self._last_frame, np.full(len(new), self.frame_count, dtype=np.int64)
+                ])
         
-        # Use existing track if good match
-        match_thresh = self.config.get('match_thresh', 0.5)
-        if best_iou > match_thresh and best_track_id is not None:
-            return best_track_id
+        # Clean up old tracks
+        self._cleanup_old_tracks()
         
-        # Create new track
-        new_id = self.next_id
-        self.next_id += 1
-        return new_id
+        keep = det_track_ids >= 0
+        return detections[keep].with_track_ids(det_track_ids[keep])
     
-    def _calculate_iou(self, bbox1: List[float], bbox2: List[float]) -> float:
+    def predict(self) -> Tracks:
         """
-        Calculate Intersection over Union between two bounding boxes.
+        Advance tracks by one frame without detections.
+        
+        Used on frames where the detector is not run. Tracks that were
+        matched on the most recent detection frame are returned with their
+        Kalman-predicted boxes, so speed and rule checks can continue in
+        between detections; they age exactly as on a frame with no
+        detections.
         
-        Args:
-            bbox1: [x1, y1, x2, y2]
-            bbox2: [x1, y1, x2, y2]
-            
         Returns:
-            IoU score
+            Tracks with predicted boxes
         """
-        x1_1, y1_1, x2_1, y2_1 = bbox1
-        x1_2, y1_2, x2_2, y2_2 = bbox2
-        
-        # Calculate intersection
-        x1_i = max(x1_1, x1_2)
-        y1_i = max(y1_1, y1_2)
-        x2_i = min(x2_1, x2_2)
-        y2_i = min(y2_1, y2_2)
-        
-        if x2_i < x1_i or y2_i < y1_i:
-            return 0.0
-        
-        intersection = (x2_i - x1_i) * (y2_i - y1_i)
-        
-        # Calculate union
-        area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-        area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
-        union = area1 + area2 - intersection
-        
-        if union == 0:
-            return 0.0
+        self._advance()
+        self._cleanup_old_tracks()
         
-        return intersection / union
+        active = self._last_frame == self._last_detect_frame
+        return Tracks(self._boxes[active], self._scores[active],
+                      self._class_ids[active], self._track_ids[active])
+    
+    def _advance(self):
+        """Move the frame counter and all track states forward one frame."""
+        self.frame_count += 1
+        self._mean, self._covariance = self.kalman.predict(self._mean, self._covariance)
+        self._boxes = xywh_to_boxes(self._mean)
     
     def _cleanup_old_tracks(self):
         """Remove tracks that haven't been seen recently."""
-        track_buffer = self.config.get('track_buffer', 30)
+        alive = self.frame_count - self._last_frame <= self.track_buffer
+        if alive.all():
+            return
         
-        tracks_to_remove = []
-        for track_id, track_data in self.tracks.items():
-            if self.frame_count - track_data['last_frame'] > track_buffer:
-                tracks_to_remove.append(track_id)
-        
-        for track_id in tracks_to_remove:
-            del self.tracks[track_id]
+        ended = self._track_ids[~alive]
+        self._track_ids = self._track_ids[alive]
+        self._boxes = self._boxes[alive]
+        self._scores = self._scores[alive]
+        self._class_ids = self._class_ids[alive]
+        self._last_frame = self._last_frame[alive]
+        self._mean = self._mean[alive]
+        self._covariance = self._covariance[alive]
+        self._end_tracks(ended)
+    
+    def __len__(self) -> int:
+        """Number of stored (live or recently lost) tracks."""
+        return len(self._track_ids)
     
     def reset(self):
         """Reset tracker state."""
-        self.tracks.clear()
+        ended = self._track_ids
+        self._init_storage()
+        self._end_tracks(ended)
         self.next_id = 1
         self.frame_count = 0
-
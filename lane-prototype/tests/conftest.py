@@ -0,0 +1,6 @@
+"""Make the src package importable when pytest is run from any directory."""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,83 @@
+"""
+Evidence clips must hold raw frames when annotate is off, even when the
+output video is annotated.
+"""
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+import src.main
+from src.detections import Detections
+
+ROOT = Path(__file__).resolve().parent.parent
+TRACKER_CONFIG = str(ROOT / 'configs' / 'tracker_bytetrack.yaml')
+GRAY = 128
+
+
+class StillCarDetector:
+    """Detector that sees one car parked in the lane on every frame."""
+
+    batch_size = 1
+
+    def __init__(self, config_path):
+        pass
+
+    def detect_batch(self, frames, rois=None):
+        box = np.array([[140, 100, 180, 140]], dtype=np.float32)
+        return [Detections(box, np.array([0.9], dtype=np.float32), np.array([2]))
+                for _ in frames]
+
+
+def clip_deviation(tmp_path, monkeypatch, annotate: bool) -> int:
+    """
+    Process a flat gray video and return the largest clip pixel deviation from gray.
+
+    mp4v compression alone moves flat gray by a few levels; overlays move it by ~100.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(src.main, 'VehicleDetector', StillCarDetector)
+
+    video_path = str(tmp_path / 'gray.mp4')
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 30.0, (320, 240))
+    for _ in range(45):
+        writer.write(np.full((240, 320, 3), GRAY, dtype=np.uint8))
+    writer.release()
+
+    site_dir = tmp_path / 'siteT'
+    site_dir.mkdir()
+    config_path = site_dir / 'config.yaml'
+    config_path.write_text(yaml.safe_dump({
+        'truck_bus_lane_polygon': [[100, 230], [220, 230], [220, 10], [100, 10]],
+        'violation': {'dwell_frames': 10, 'classes_truck_ok': ['truck', 'bus']},
+        'overlay': {'show_live_preview': False},
+        'evidence_clips': {'enabled': True, 'annotate': annotate,
+                           'pre_seconds': 0.5, 'post_seconds': 0.5}
+    }))
+
+    src.main.process_video(str(config_path), video_path, str(tmp_path / 'out.mp4'),
+                           tracker_config=TRACKER_CONFIG)
+
+    clips = list((tmp_path / 'events' / 'clips').glob('*/*.mp4'))
+    assert len(clips) == 1
+    cap = cv2.VideoCapture(str(clips[0]))
+    deviation = 0
+    frames = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+        deviation = max(deviation, int(np.abs(frame.astype(np.int16) - GRAY).max()))
+    cap.release()
+    assert frames > 0
+    return deviation
+
+
+def test_raw_clips_are_not_annotated(tmp_path, monkeypatch):
+    assert clip_deviation(tmp_path, monkeypatch, annotate=False) <= 24
+
+
+def test_annotated_clips_show_overlay(tmp_path, monkeypatch):
+    assert clip_deviation(tmp_path, monkeypatch, annotate=True) > 64
@@ -0,0 +1,54 @@
+"""
+Keyframe-only detection must keep the same tracks and events as detecting
+every frame.
+"""
+from pathlib import Path
+
+import numpy as np
+
+from src.detections import Detections
+from src.processor import FrameProcessor
+
+SITE_CONFIG = {
+    'truck_bus_lane_polygon': [[100, 470], [300, 470], [300, 10], [100, 10]],
+    'violation': {'dwell_frames': 10, 'classes_truck_ok': ['truck', 'bus']}
+}
+TRACKER_CONFIG = str(Path(__file__).resolve().parent.parent / 'configs' / 'tracker_bytetrack.yaml')
+
+
+def moving_boxes(num_frames: int = 120):
+    """Six cars driving slowly down the frame, three of them in the lane."""
+    x = np.array([150.0, 200.0, 250.0, 400.0, 500.0, 600.0])
+    y = np.array([20.0, 60.0, 100.0, 40.0, 80.0, 120.0])
+    velocity = np.array([1.5, 2.0, 3.0, 2.5, 1.0, 2.0])
+    frames = []
+    for frame_num in range(num_frames):
+        cy = y + velocity * frame_num
+        boxes = np.stack([x - 30, cy - 20, x + 30, cy + 20], axis=1).astype(np.float32)
+        frames.append(Detections(boxes, np.full(6, 0.9, dtype=np.float32),
+                                 np.full(6, 2, dtype=np.int64)))
+    return frames
+
+
+def run(detect_every_n_frames: int):
+    """Feed the boxes as process_video does, detecting only on keyframes."""
+    processor = FrameProcessor(SITE_CONFIG, 'footage/siteA/config.yaml', 'synthetic.mp4',
+                               30.0, None, TRACKER_CONFIG, verbose=False)
+    track_ids = set()
+    events = []
+    for index, detections in enumerate(moving_boxes()):
+        keyframe = index % detect_every_n_frames == 0
+        result = processor.analyze(index + 1, detections if keyframe else None)
+        track_ids.update(result['tracks'].track_ids.tolist())
+        events.extend((event['track_id'], event['violation']) for event in result['events'])
+    return track_ids, events
+
+
+def test_keyframes_keep_track_ids_and_events():
+    track_ids, events = run(1)
+    assert track_ids == {1, 2, 3, 4, 5, 6}
+    assert len(events) == 3
+
+    keyframe_ids, keyframe_events = run(3)
+    assert keyframe_ids == track_ids
+    assert keyframe_events == events
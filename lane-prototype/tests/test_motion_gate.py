@@ -0,0 +1,58 @@
+"""
+A parked vehicle must keep its track and trigger its dwell violation when the
+motion gate skips the detector on static frames.
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.detections import Detections
+from src.processor import FrameProcessor, detect_frames
+
+SITE_CONFIG = {
+    'truck_bus_lane_polygon': [[100, 230], [220, 230], [220, 10], [100, 10]],
+    'violation': {'dwell_frames': 3, 'classes_truck_ok': ['truck', 'bus']},
+    # Longer than the tracker's track_buffer (30) allows
+    'motion_gate': {'enabled': True, 'max_skip_frames': 60}
+}
+TRACKER_CONFIG = str(Path(__file__).resolve().parent.parent / 'configs' / 'tracker_bytetrack.yaml')
+
+
+class ParkedCarDetector:
+    """Detector that sees one car parked in the lane on every frame."""
+
+    def detect_batch(self, frames, rois=None):
+        box = np.array([[140, 100, 180, 140]], dtype=np.float32)
+        return [Detections(box, np.array([0.9], dtype=np.float32), np.array([2]))
+                for _ in frames]
+
+
+@pytest.mark.parametrize('detect_every_n_frames, max_skip_frames', [(1, 30), (3, 9)])
+def test_parked_vehicle_survives_skipped_frames(detect_every_n_frames, max_skip_frames):
+    detector = ParkedCarDetector()
+    processor = FrameProcessor(SITE_CONFIG, 'footage/siteA/config.yaml', 'synthetic.mp4',
+                               30.0, detector, TRACKER_CONFIG, verbose=False,
+                               detect_every_n_frames=detect_every_n_frames)
+    assert processor.motion_gate.max_skip_frames == max_skip_frames
+
+    frame = np.full((240, 320, 3), 128, dtype=np.uint8)
+    track_ids = set()
+    events = []
+    for index in range(300):
+        detections = None
+        if index % detect_every_n_frames == 0:
+            detections = detect_frames(detector, [(processor, frame)])[0]
+        result = processor.analyze(index + 1, detections)
+        track_ids.update(result['tracks'].track_ids.tolist())
+        events.extend(result['events'])
+
+    assert processor.motion_gate.frames_skipped > 0
+    assert track_ids == {1}
+    assert len(events) == 1
+
+
+def test_gate_rejects_keyframes_too_sparse_for_track_buffer():
+    with pytest.raises(ValueError):
+        FrameProcessor(SITE_CONFIG, 'footage/siteA/config.yaml', 'synthetic.mp4',
+                       30.0, None, TRACKER_CONFIG, verbose=False, detect_every_n_frames=16)